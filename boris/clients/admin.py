@@ -3,6 +3,7 @@ from datetime import datetime
 
 from django.conf.urls import patterns, url
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.db.models import Count
@@ -15,12 +16,14 @@ from django.utils.html import escape, escapejs
 
 from boris.clients.models import Client, Town, Anamnesis, DrugUsage, \
     RiskyManners, Region, District, DiseaseTest, Anonymous, \
-    PractitionerContact, Person, GroupContact, ClientCard, GroupContactType
+    PractitionerContact, Person, GroupContact, ClientCard, GroupContactType, \
+    sync_group_encounters
+from boris.clients import search
 from boris.clients.forms import ReadOnlyWidget
 from boris.clients.views import add_note, delete_note
 from boris.services.admin import EncounterInline
 from boris.services.models import IncomeExamination
-from boris.utils.admin import BorisBaseAdmin, textual
+from boris.utils.admin import BorisBaseAdmin, related_count, related_list, textual
 from boris.utils.widgets import SplitDateWidget
 
 
@@ -52,6 +55,19 @@ class DiseaseTestInline(admin.TabularInline):
     extra = 0
 
 
+class IndexedSearchMixin(object):
+    """
+    Runs changelist search through the prefix search index instead of
+    ``search_fields``. Results are ranked by relevance unless the user
+    sorts the list explicitly.
+    """
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        rank = ORDER_VAR not in request.GET
+        return search.filter_queryset(queryset, search_term, rank=rank), False
+
+
 class EnumAdmin(BorisBaseAdmin):
     def show_save(self, obj):
         return True
@@ -62,6 +78,7 @@ class EnumAdmin(BorisBaseAdmin):
 
 class AnamnesisAdmin(BorisBaseAdmin):
     list_display = ('__unicode__', 'client_link')
+    list_select_related = ('client',)
     search_fields = ('client__code', 'client__first_name', 'client__last_name')
     readonly_fields = ('client__sex', 'client__birthyear')
     fieldsets = (
@@ -160,7 +177,7 @@ class AnamnesisAdmin(BorisBaseAdmin):
         return obj and obj.pk is not None
 
 
-class PersonAdmin(BorisBaseAdmin):
+class PersonAdmin(IndexedSearchMixin, BorisBaseAdmin):
     list_display = ('title',)
     search_fields = ('title',)
 
@@ -213,9 +230,7 @@ class PractitionerContactAdmin(BorisBaseAdmin):
     ordering = ('-date', 'person_or_institution')
     fields = ('person_or_institution', 'town', 'date', 'note', 'users')
 
-    @textual(_(u'Kdo'))
-    def user_list(self, obj):
-        return u'<br />'.join([unicode(s) for s in obj.users.all()])
+    user_list = related_list('users', _(u'Kdo'))
 
     def show_save_and_add_another(self, obj):
         return bool(obj.pk)
@@ -234,13 +249,27 @@ class GroupContactAdmin(BorisBaseAdmin):
     fields = ('type', 'town', 'date', 'note', 'users', 'clients')
     filter_horizontal = ('clients', )
 
-    @textual(_(u'Kdo'))
-    def user_list(self, obj):
-        return u'<br />'.join([unicode(s) for s in obj.users.all()])
+    user_list = related_list('users', _(u'Kdo'))
+    client_count = related_count('clients', _(u'Počet klientů'))
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and not obj.is_editable():
+            return False
+        return super(GroupContactAdmin, self).has_delete_permission(request, obj=obj)
+
+    def save_model(self, request, obj, form, change):
+        # The encounters are synced once the clients and users are saved too.
+        obj.defer_group_sync = True
+        super(GroupContactAdmin, self).save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super(GroupContactAdmin, self).save_related(request, form, formsets, change)
+        del form.instance.defer_group_sync
+        sync_group_encounters(form.instance)
 
-    @textual(_(u'Počet klientů'))
-    def client_count(self, obj):
-        return obj.clients.count()
+
+class TownAdmin(IndexedSearchMixin, EnumAdmin):
+    search_fields = ('title',)
 
 
 class GroupContactTypeAdmin(EnumAdmin):
@@ -280,12 +309,15 @@ class FirstEncounterListFilter(admin.SimpleListFilter):
             return queryset.exclude(pk__in=person_ids)
 
 
-class ClientAdmin(AddContactAdmin):
+class ClientAdmin(IndexedSearchMixin, AddContactAdmin):
     list_display = ('code', 'first_name_display', 'last_name_display', 'sex', 'primary_drug',
                     'town', 'encounter_count')
     list_actions = ('add_contact_button',)
     list_filter = ('town', 'sex', 'primary_drug', 'encounters__performed_on', FirstEncounterListFilter)
     search_fields = ('code', 'first_name', 'last_name')
+    list_select_related = ('town', 'anamnesis')
+    list_count_mode = 'estimate'
+    list_keyset_pagination = True
     fieldsets = (
         (_(u'Základní informace'), {'fields': (
             ('code', 'sex'),
@@ -386,7 +418,7 @@ class ClientAdmin(AddContactAdmin):
 
 admin.site.register(Region, EnumAdmin)
 admin.site.register(District, EnumAdmin)
-admin.site.register(Town, EnumAdmin)
+admin.site.register(Town, TownAdmin)
 admin.site.register(GroupContactType, GroupContactTypeAdmin)
 admin.site.register(Person, PersonAdmin)
 admin.site.register(PractitionerContact, PractitionerContactAdmin)
@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from boris.clients.search import rebuild_index
+
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the client, person and town search index'
+
+    def handle_noargs(self, **options):
+        with transaction.atomic():
+            rebuild_index()
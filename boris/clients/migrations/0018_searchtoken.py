@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_search_index(apps, schema_editor):
+    from boris.clients.search import rebuild_index
+    rebuild_index(apps)
+
+
+def drop_search_index(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0017_auto_20170125_1224'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('scope', models.CharField(max_length=30)),
+                ('object_id', models.PositiveIntegerField()),
+                ('token', models.CharField(max_length=20)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchtoken',
+            unique_together=set([('scope', 'object_id', 'token')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchtoken',
+            index_together=set([('scope', 'token')]),
+        ),
+        migrations.RunPython(build_search_index, reverse_code=drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0018_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='groupcontact',
+            index_together=set([('date', 'town')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='practitionercontact',
+            index_together=set([('date', 'town')]),
+        ),
+    ]
@@ -2,10 +2,12 @@
 import datetime
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.db.models import signals
 from django.dispatch import receiver
 from django.utils.dateformat import format
+from django.utils import timezone
 from django.utils.formats import date_format, get_format
 from django.utils.translation import ugettext_lazy as _
 from fragapy.common.models.adminlink import AdminLinkMixin
@@ -16,8 +18,10 @@ from boris.classification import SEXES, NATIONALITIES, \
     DRUG_APPLICATION_FREQUENCY, DRUG_APPLICATION_TYPES, \
     DISEASES, DISEASE_TEST_RESULTS, EDUCATION_LEVELS, ANONYMOUS_TYPES, \
     RISKY_BEHAVIOR_KIND, RISKY_BEHAVIOR_PERIODICITY, DRUGS
-from boris.services.models import GroupCounselling, Encounter
-from boris.services.models.k import _group_service_title
+from boris.clients import search
+from boris.services.models import GroupCounselling, Encounter, Service, bulk_save_services
+from boris.services.models.core import _group_service_title
+from boris.utils.contenttypes import content_types
 
 
 class IndexedStringEnum(models.Model, AdminLinkMixin):
@@ -61,6 +65,10 @@ class Town(IndexedStringEnum):
     def __unicode__(self):
         return u'%s' % self.title
 
+    @staticmethod
+    def autocomplete_search_fields():
+        return ('id__indexed',)
+
 
 class GroupContactType(IndexedStringEnum):
     key = models.SmallIntegerField(verbose_name=_(u'Kód'))
@@ -107,10 +115,8 @@ class Person(TimeStampedModel, AdminLinkMixin):
 
     def clean(self):
         self.title = unicode(self)
-        # @attention: instead of using get_for_model which doesn't respect
-        # proxy models content types, use get_by_natural key as a workaround
-        self.content_type = ContentType.objects.get_by_natural_key(
-            self._meta.app_label, self._meta.object_name.lower())
+        # @attention: get_for_model doesn't respect proxy models content types
+        self.content_type = content_types.get(self.__class__)
 
     def cast(self):
         """
@@ -128,7 +134,32 @@ class Person(TimeStampedModel, AdminLinkMixin):
 
     @staticmethod
     def autocomplete_search_fields():
-        return ('title__icontains',)
+        return ('id__indexed',)
+
+
+class SearchToken(models.Model):
+    """
+    One prefix of a word in an indexed field, see ``boris.clients.search``.
+    """
+    scope = models.CharField(max_length=30)
+    object_id = models.PositiveIntegerField()
+    token = models.CharField(max_length=search.MAX_TOKEN_LENGTH)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('scope', 'object_id', 'token')
+        index_together = (('scope', 'token'),)
+
+    def __unicode__(self):
+        return u'%s:%s %s' % (self.scope, self.object_id, self.token)
+
+
+def update_search_index(sender, instance, **kwargs):
+    search.index_objects(sender, [instance.pk])
+
+
+def delete_from_search_index(sender, instance, **kwargs):
+    search.unindex_objects(sender, [instance.pk])
 
 
 class PractitionerContact(models.Model, AdminLinkMixin):
@@ -148,6 +179,7 @@ class PractitionerContact(models.Model, AdminLinkMixin):
     class Meta:
         verbose_name = _(u'Odborný kontakt')
         verbose_name_plural = _(u'Odborné kontakty')
+        index_together = (('date', 'town'),)
 
     def __unicode__(self):
         return _(u'%(person_or_institution)s v %(town)s, %(date)s') % {
@@ -172,85 +204,153 @@ class GroupContact(models.Model, AdminLinkMixin):
     class Meta:
         verbose_name = u'Skupinový kontakt'
         verbose_name_plural = u'Skupinové kontakty'
+        index_together = (('date', 'town'),)
 
     def __unicode__(self):
         town = self.town.title if hasattr(self, 'town') and self.town else '---'
         return u'Skupinový kontakt %s, %s, %s' % (self.type.title, town, self.date)
 
+    def is_editable(self):
+        from boris.reporting.models import FrozenPeriod
+        return not FrozenPeriod.objects.is_frozen(self.date)
 
-def __sync_many(e, instance, src_attr, target_attr):
-    existing = getattr(e, src_attr).values_list('id', flat=True)
-    to_keep = getattr(instance, target_attr).values_list('id', flat=True)
-    to_delete = set(existing) - set(to_keep)
-    to_create = set(to_keep) - set(existing)
-    for pk in to_create:
-        getattr(e, src_attr).add(pk)
-    for pk in to_delete:
-        getattr(e, src_attr).remove(pk)
-
-
-def __get_or_create_encounter(client, instance, services):
-    e, created = Encounter.objects.get_or_create(person=client, is_by_phone=False, group_contact=instance,
-                                                 defaults={'performed_on': instance.date, 'where': instance.town})
-    __sync_many(e, instance, 'performed_by', 'users')
-    e.performed_on = instance.date
-    e.where = instance.town
-    e.save()
-
-    for service in services:
-        ct = service.service.model.real_content_type()
-        s, _ = service.objects.get_or_create(encounter=e, content_type=ct)
-        s.title = _group_service_title(instance, service)
-        s.save()
-    return e, created
-
-
-def __delete_group_encounters(encs, group_contact):
-    for encounter in encs:
-        services = encounter.services.all()
-        group_services = __filter_group_services(group_contact, services)
-        if services.count() == 1 and group_services.exists():
-            encounter.delete()
-        else:
-            group_services.delete()
-
-
-def __filter_group_services(group_contact, services):
-    return services.filter(content_type=GroupCounselling.real_content_type())
-
-
-def __correct_contact(encs, instance):
-    for encounter in encs:
-        for service in __filter_group_services(instance, encounter.services):
-            service.save()
-        encounter.save()
+    def clean(self):
+        super(GroupContact, self).clean()
+        dates = [self.date]
+        if self.pk is not None:
+            dates += GroupContact.objects.filter(pk=self.pk).values_list('date', flat=True)
+        _check_group_dates(dates)
+
+
+def _check_group_dates(dates):
+    """Raises ValidationError if any of ``dates`` lies in a frozen period."""
+    from boris.reporting.models import FrozenPeriod
+    if any(FrozenPeriod.objects.is_frozen(day) for day in set(dates)):
+        raise ValidationError(_(u'Období skupinového kontaktu je uzavřené pro výkaznictví.'))
+
+
+def sync_group_encounters(group_contact):
+    """
+    Brings the group counselling encounters of ``group_contact`` in line
+    with its clients, users, date and town.
+
+    The signal handlers sync after every change of the group contact or its
+    clients. Code changing several of them at once (like the admin) can set
+    ``defer_group_sync`` on the instance and sync once when done.
+
+    The differences are computed as sets and written in bulk, so the number
+    of queries does not depend on the number of clients in the group.
+
+    Raises ValidationError when the date of the group contact or of its
+    encounters lies in a frozen period, those encounters can't change.
+    """
+    gc_ct = GroupCounselling.real_content_type()
+    title = _group_service_title(group_contact, GroupCounselling)
+    client_ids = set(group_contact.clients.values_list('pk', flat=True))
+    user_ids = set(group_contact.users.values_list('pk', flat=True))
+
+    with transaction.atomic():
+        encounters = Encounter.objects.filter(group_contact=group_contact)
+        rows = list(encounters.values_list('pk', 'person_id', 'performed_on'))
+        _check_group_dates([group_contact.date] + [day for _pk, _person_id, day in rows])
+        by_person = {}
+        for pk, person_id, _day in rows:
+            by_person.setdefault(person_id, []).append(pk)
+
+        removed = [pk for person_id, pks in by_person.iteritems()
+                   if person_id not in client_ids for pk in pks]
+        if removed:
+            _delete_group_encounters(removed, gc_ct)
+
+        kept = [pk for person_id, pks in by_person.iteritems()
+                if person_id in client_ids for pk in pks]
+        if kept:
+            Encounter.objects.filter(pk__in=kept).update(
+                performed_on=group_contact.date, where=group_contact.town_id)
+
+        new_clients = client_ids - set(by_person)
+        if new_clients:
+            Encounter.objects.bulk_create([
+                Encounter(person_id=client_id, is_by_phone=False, group_contact=group_contact,
+                          performed_on=group_contact.date, where_id=group_contact.town_id)
+                for client_id in new_clients])
+            kept += encounters.filter(person__in=new_clients).values_list('pk', flat=True)
+
+        if kept:
+            _sync_performed_by(kept, user_ids)
+            _sync_group_services(group_contact, kept, gc_ct, title)
+
+
+def _delete_group_encounters(encounter_ids, gc_ct):
+    """
+    Deletes group counselling services of given encounters. Encounters left
+    with no other service are deleted altogether.
+    """
+    group_services = Service.objects.filter(encounter__in=encounter_ids, content_type=gc_ct)
+    with_group = set(group_services.values_list('encounter_id', flat=True))
+    with_other = set(Service.objects.filter(encounter__in=with_group).exclude(
+        content_type=gc_ct).values_list('encounter_id', flat=True))
+    if with_group - with_other:
+        Encounter.objects.filter(pk__in=with_group - with_other).delete()
+    if with_other:
+        group_services.filter(encounter__in=with_other).delete()
+
+
+def _sync_performed_by(encounter_ids, user_ids):
+    through = Encounter.performed_by.through
+    rows = through.objects.filter(encounter__in=encounter_ids)
+    rows.exclude(user__in=user_ids).delete()
+    existing = set(rows.filter(user__in=user_ids).values_list('encounter_id', 'user_id'))
+    through.objects.bulk_create([
+        through(encounter_id=encounter_id, user_id=user_id)
+        for encounter_id in encounter_ids for user_id in user_ids
+        if (encounter_id, user_id) not in existing])
+
+
+def _sync_group_services(group_contact, encounter_ids, gc_ct, title):
+    services = Service.objects.filter(encounter__in=encounter_ids, content_type=gc_ct)
+    services.update(title=title, modified=timezone.now())
+    existing = set(services.values_list('encounter_id', flat=True))
+    # Only the pk and group contact of the encounters are needed for saving.
+    bulk_save_services([
+        GroupCounselling(encounter=Encounter(pk=encounter_id, group_contact=group_contact),
+                         content_type=gc_ct, title=title)
+        for encounter_id in encounter_ids if encounter_id not in existing])
 
 
 @receiver(signals.m2m_changed, sender=GroupContact.clients.through)
-def create_group_encounters(sender, instance, action, *args, **kwargs):
+def create_group_encounters(sender, instance, action, reverse, pk_set, *args, **kwargs):
     # group contact serves as a way to create many group counselling encounters at a time
-    # this signal is used for creating encounters
-    for client in instance.clients.all():
-        __get_or_create_encounter(client, instance, [GroupCounselling])
-    if instance.clients.exists():
-        # this is needed because django sends signals pretty erratically :(
-        delete_excess_group_encounters(sender, instance)
+    if reverse:
+        # a cleared client leaves group contacts unknown to post_clear
+        if action == 'pre_clear':
+            instance._cleared_group_contacts = list(
+                GroupContact.objects.filter(clients=instance).values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_cleared_group_contacts', [])
+        elif action not in ('post_add', 'post_remove'):
+            return
+        for group_contact in GroupContact.objects.filter(pk__in=pk_set):
+            sync_group_encounters(group_contact)
+    elif action in ('post_add', 'post_remove', 'post_clear') and \
+            not getattr(instance, 'defer_group_sync', False):
+        # post_clear syncs too, assigning an empty list sends no post_add
+        sync_group_encounters(instance)
 
 
 @receiver(signals.post_save, sender=GroupContact)
-def delete_excess_group_encounters(sender, instance, *args, **kwargs):
-    # this signal is used for deleting encounters for removed clients
-    all_encs = Encounter.objects.filter(group_contact=instance)
-    to_delete = set(all_encs.values_list('person', flat=True)) - set(instance.clients.values_list('pk', flat=True))
-    for client_pk in to_delete:
-        encs = all_encs.filter(person__pk=client_pk)
-        __delete_group_encounters(encs, instance)
+def delete_excess_group_encounters(sender, instance, created, *args, **kwargs):
+    # a new group contact has no clients yet
+    if not created and not getattr(instance, 'defer_group_sync', False):
+        sync_group_encounters(instance)
 
 
 @receiver(signals.pre_delete, sender=GroupContact)
 def save_group_contact3(sender, instance, using, signal, *args, **kwargs):
-    encs = Encounter.objects.filter(group_contact=instance)
-    __delete_group_encounters(encs, instance)
+    rows = list(Encounter.objects.filter(group_contact=instance).values_list('pk', 'performed_on'))
+    _check_group_dates([instance.date] + [day for _pk, day in rows])
+    _delete_group_encounters([pk for pk, _day in rows], GroupCounselling.real_content_type())
 
 
 class Anonymous(Person):
@@ -366,32 +466,66 @@ class Anamnesis(TimeStampedModel, AdminLinkMixin):
         verbose_name = _(u'Anamnéza')
         verbose_name_plural = _(u'Anamnézy')
 
+    @classmethod
+    def load_related_data(cls, anamneses):
+        """
+        Loads drug usages, disease tests and risky manners of all
+        ``anamneses`` at once (three queries in total), so that the
+        properties below don't query for every single anamnesis.
+        """
+        anamneses = list(anamneses)
+        by_pk = dict((a.pk, a) for a in anamneses)
+        for a in anamneses:
+            a._drug_info, a._disease_tests, a._risky_manners = [], [], {}
+        for di in DrugUsage.objects.filter(anamnesis__in=by_pk.keys()):
+            by_pk[di.anamnesis_id]._drug_info.append(di)
+        for t in DiseaseTest.objects.filter(anamnesis__in=by_pk.keys()):
+            by_pk[t.anamnesis_id]._disease_tests.append(t)
+        for rm in RiskyManners.objects.filter(anamnesis__in=by_pk.keys()):
+            by_pk[rm.anamnesis_id]._risky_manners[rm.behavior] = rm
+        for a in anamneses:
+            a._drug_info.sort(key=_drug_info_key)
+        return anamneses
+
     @property
     def drug_info(self):
-        if not hasattr(self, '__drug_info'):
-            self.__drug_info =  DrugUsage.objects.filter(anamnesis=self)
-            self.__drug_info = sorted(list(self.__drug_info),
-                                      key=lambda di: '%s%s' % (
-                                          '1' if di.is_primary else '2',
-                                          str(di.pk)
-                                      ))
-        return self.__drug_info
+        if not hasattr(self, '_drug_info'):
+            self._drug_info = sorted(DrugUsage.objects.filter(anamnesis=self),
+                                     key=_drug_info_key)
+        return self._drug_info
+
+    @property
+    def disease_tests(self):
+        if not hasattr(self, '_disease_tests'):
+            self._disease_tests = list(DiseaseTest.objects.filter(anamnesis=self))
+        return self._disease_tests
 
     @property
     def disease_test_results(self):
-        if not hasattr(self, '__disease_test_results'):
-            self.__disease_test_results = dict((c[1], None) for c in DISEASE_TEST_RESULTS)
+        if not hasattr(self, '_disease_test_results'):
+            self._disease_test_results = dict((c[1], None) for c in DISEASE_TEST_RESULTS)
+            for t in self.disease_tests:
+                self._disease_test_results[t.get_disease_display()] = t
+        return self._disease_test_results
+
+    @property
+    def risky_manners(self):
+        """Returns {behavior: ``RiskyManners``}."""
+        if not hasattr(self, '_risky_manners'):
+            self._risky_manners = dict(
+                (rm.behavior, rm) for rm in RiskyManners.objects.filter(anamnesis=self))
+        return self._risky_manners
 
-            for t in DiseaseTest.objects.filter(anamnesis=self):
-                self.__disease_test_results[t.get_disease_display()] = t
-        return self.__disease_test_results
+    def risky_manner(self, behavior):
+        """Returns ``RiskyManners`` of given ``behavior`` or None."""
+        return self.risky_manners.get(behavior)
 
     @property
     def overall_first_try_age(self):
-        if not hasattr(self, '__overall_first_try_age'):
+        if not hasattr(self, '_overall_first_try_age'):
             ages = [d.first_try_age for d in self.drug_info]
-            self.__overall_first_try_age = min(ages) if ages else None
-        return self.__overall_first_try_age
+            self._overall_first_try_age = min(ages) if ages else None
+        return self._overall_first_try_age
 
     @property
     def is_intravenous_user(self):
@@ -401,10 +535,15 @@ class Anamnesis(TimeStampedModel, AdminLinkMixin):
 
     @property
     def intravenous_first_try_age(self):
-        if not hasattr(self, '__intravenous_first_try_age'):
+        if not hasattr(self, '_intravenous_first_try_age'):
             ages = [d.first_try_iv_age for d in self.drug_info if d.first_try_iv_age]
-            self.__intravenous_first_try_age = min(ages) if ages else None
-        return self.__intravenous_first_try_age
+            self._intravenous_first_try_age = min(ages) if ages else None
+        return self._intravenous_first_try_age
+
+
+def _drug_info_key(di):
+    # Primary drug goes first.
+    return '%s%s' % ('1' if di.is_primary else '2', str(di.pk))
 
 
 class ClientNote(models.Model):
@@ -513,3 +652,10 @@ class ClientCard(models.Model):
     def delete(self, using=None):
         self.file.delete(save=False)
         super(ClientCard, self).delete(using=using)
+
+
+for indexed_model in (Person, Anonymous, Client, Town):
+    signals.post_save.connect(update_search_index, sender=indexed_model,
+                              dispatch_uid='search_index_%s' % indexed_model.__name__)
+    signals.post_delete.connect(delete_from_search_index, sender=indexed_model,
+                                dispatch_uid='search_unindex_%s' % indexed_model.__name__)
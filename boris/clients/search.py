@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Prefix search index for persons and towns.
+
+Grappelli autocompletes and the admin search used to run
+``title__icontains`` style lookups, i.e. a leading-wildcard LIKE over the
+whole table on every keystroke. Instead, every word of the indexed fields
+is split into its prefixes, which are stored in ``SearchToken``. Looking up
+a word then becomes an indexed equality match on ``(scope, token)``.
+
+The index is kept in sync by signal handlers in ``boris.clients.models``.
+Code that bypasses ``save()`` (``bulk_create``, ``update``) has to call
+``index_objects`` itself.
+
+Use the ``indexed`` lookup on the primary key to search, e.g.::
+
+    Client.objects.filter(id__indexed=u'novak')
+    Town.objects.filter(id__indexed=u'prah')
+"""
+import re
+import unicodedata
+
+from django.apps import apps as global_apps
+from django.db import connection, models
+from django.utils.encoding import force_text
+
+
+# Longer words are indexed (and searched) by their first MAX_TOKEN_LENGTH
+# characters only.
+MAX_TOKEN_LENGTH = 20
+
+# (app_label, model name, scope, ((field, weight), ...))
+#
+# ``scope`` is the name of the model owning the primary key, so that e.g.
+# both Person.title and Client.code end up under the same person.
+INDEXED_MODELS = (
+    ('clients', 'Person', 'person', (('title', 1),)),
+    ('clients', 'Client', 'person', (('code', 3), ('first_name', 2), ('last_name', 2))),
+    ('clients', 'Town', 'town', (('title', 1),)),
+)
+
+# Whole words are ranked higher than their prefixes.
+WHOLE_WORD_BONUS = 2
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(value):
+    """Returns lowercase ``value`` without diacritics."""
+    value = unicodedata.normalize('NFKD', force_text(value))
+    return u''.join(c for c in value if not unicodedata.combining(c)).lower()
+
+
+def words(value):
+    """Returns the normalized words of ``value``, cropped to MAX_TOKEN_LENGTH."""
+    if not value:
+        return []
+    return [w[:MAX_TOKEN_LENGTH] for w in WORD_RE.findall(normalize(value))]
+
+
+def tokenize(value, weight=1):
+    """
+    Returns a dict {token: weight} of all prefixes of all words in ``value``.
+    """
+    tokens = {}
+    for word in words(value):
+        for i in xrange(1, len(word) + 1):
+            w = weight * WHOLE_WORD_BONUS if i == len(word) else weight
+            tokens[word[:i]] = max(w, tokens.get(word[:i], 0))
+    return tokens
+
+
+def _root_opts(model):
+    """Returns options of the model owning ``model``'s primary key."""
+    opts = model._meta.concrete_model._meta
+    while opts.pk.rel and opts.pk.rel.parent_link:
+        opts = opts.pk.rel.to._meta
+    return opts
+
+
+def get_scope(model):
+    """Returns the index scope for ``model`` (name of the pk owning model)."""
+    return _root_opts(model).model_name
+
+
+def _indexed_models(scope, apps=global_apps):
+    for app_label, model_name, model_scope, fields in INDEXED_MODELS:
+        if model_scope == scope:
+            yield apps.get_model(app_label, model_name), fields
+
+
+def _collect_tokens(scope, pks=None, apps=global_apps):
+    """
+    Returns {pk: {token: weight}} for objects in ``scope``. If ``pks`` is
+    given, only these objects are processed.
+    """
+    collected = {}
+    for model, fields in _indexed_models(scope, apps):
+        qset = model._default_manager.all()
+        if pks is not None:
+            qset = qset.filter(pk__in=pks)
+        for row in qset.values_list('pk', *[f for f, _ in fields]).iterator():
+            tokens = collected.setdefault(row[0], {})
+            for (field, weight), value in zip(fields, row[1:]):
+                for token, w in tokenize(value, weight).iteritems():
+                    tokens[token] = max(w, tokens.get(token, 0))
+    return collected
+
+
+def _store_tokens(scope, collected, apps=global_apps):
+    SearchToken = apps.get_model('clients', 'SearchToken')
+    SearchToken.objects.bulk_create([
+        SearchToken(scope=scope, object_id=pk, token=token, weight=weight)
+        for pk, tokens in collected.iteritems()
+        for token, weight in tokens.iteritems()
+    ], batch_size=500)
+
+
+# None until checked. Older data migrations save persons before the
+# migration creating the index table, which then builds the whole index.
+_index_ready = None
+
+
+def index_ready():
+    """
+    Returns whether the index table exists. The table is looked up once per
+    process, ``rebuild_index`` marks the index ready.
+    """
+    global _index_ready
+    if _index_ready is None:
+        from boris.clients.models import SearchToken
+        _index_ready = SearchToken._meta.db_table in connection.introspection.table_names()
+    return _index_ready
+
+
+def index_objects(model, pks):
+    """(Re)indexes objects of ``model`` with given primary keys."""
+    from boris.clients.models import SearchToken
+    if not index_ready():
+        return
+    scope = get_scope(model)
+    pks = list(pks)
+    SearchToken.objects.filter(scope=scope, object_id__in=pks).delete()
+    _store_tokens(scope, _collect_tokens(scope, pks))
+
+
+def unindex_objects(model, pks):
+    from boris.clients.models import SearchToken
+    if not index_ready():
+        return
+    SearchToken.objects.filter(scope=get_scope(model), object_id__in=list(pks)).delete()
+
+
+def rebuild_index(apps=global_apps):
+    """
+    Drops and rebuilds the whole index. Accepts ``apps`` so that it can
+    be used from data migrations.
+    """
+    global _index_ready
+    SearchToken = apps.get_model('clients', 'SearchToken')
+    SearchToken.objects.all().delete()
+    for scope in set(m[2] for m in INDEXED_MODELS):
+        _store_tokens(scope, _collect_tokens(scope, apps=apps), apps)
+    _index_ready = True
+
+
+def _token_subquery(scope, tokens, select):
+    from boris.clients.models import SearchToken
+    qn = connection.ops.quote_name
+    sql = 'SELECT %s FROM %s WHERE %s = %%s AND %s IN (%s)' % (
+        select, qn(SearchToken._meta.db_table), qn('scope'), qn('token'),
+        ', '.join(['%s'] * len(tokens)))
+    return sql, [scope] + list(tokens)
+
+
+class IndexedLookup(models.Lookup):
+    """
+    ``<pk>__indexed=<word>`` matches objects whose indexed fields contain
+    words starting with (every part of) ``<word>``.
+    """
+    lookup_name = 'indexed'
+
+    def get_prep_lookup(self):
+        return self.rhs
+
+    def as_sql(self, qn, connection):
+        lhs, params = self.process_lhs(qn, connection)
+        tokens = sorted(set(words(self.rhs)))
+        if not tokens:
+            return '1 = 0', []
+        sql, subparams = _token_subquery(get_scope(self.lhs.target.model), tokens,
+                                         connection.ops.quote_name('object_id'))
+        sql += ' GROUP BY %s HAVING COUNT(*) = %d' % (
+            connection.ops.quote_name('object_id'), len(tokens))
+        return '%s IN (%s)' % (lhs, sql), params + subparams
+
+models.AutoField.register_lookup(IndexedLookup)
+
+
+def filter_queryset(queryset, term, rank=True):
+    """
+    Filters ``queryset`` to objects matching all words in ``term``.
+
+    When ``rank`` is True, results are ordered by relevance first (whole word
+    and code matches before prefix and name matches).
+    """
+    for word in term.split():
+        queryset = queryset.filter(id__indexed=word)
+
+    tokens = sorted(set(words(term)))
+    if rank and tokens:
+        qn = connection.ops.quote_name
+        root = _root_opts(queryset.model)
+        sql, params = _token_subquery(root.model_name, tokens, 'SUM(%s)' % qn('weight'))
+        sql += ' AND %s = %s.%s' % (qn('object_id'), qn(root.db_table), qn(root.pk.column))
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        queryset = queryset.extra(select={'search_rank': sql}, select_params=params)
+        queryset = queryset.order_by('-search_rank', *ordering)
+    return queryset
@@ -3,12 +3,17 @@
 from django.conf.urls import url, patterns
 from django.contrib import admin
 from django.core.urlresolvers import reverse
-from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render
 from django.template.defaultfilters import slugify
 from django.utils.datastructures import SortedDict
+from django.utils.translation import ugettext_lazy as _
 
-from boris.reporting.core import ReportResponse
-from boris.reporting import forms
+from boris.reporting.core import report_response
+from boris.reporting import forms, pregenerated
+from boris.reporting.batch import TownStatsBatch
+from boris.reporting.frozen import freeze
+from boris.reporting.models import FrozenPeriod
 from boris.reporting.reports.hygiene import HygieneReport
 from boris.reporting.reports.monthly_stats import MonthlyStatsByTown, \
     MonthlyStatsByDistrict, StatsByTownInPeriod
@@ -17,6 +22,7 @@ from boris.reporting.reports.clients import ClientReport
 from boris.reporting.reports.yearly_stats import YearlyStatsByMonth, YearlyStatsByTown, \
     YearlyStatsByDistrict
 from boris.reporting.reports.council import GovCouncilReport
+from boris.utils import xlsx
 
 
 class ReportingInterfaceTab(object):
@@ -41,6 +47,9 @@ class ReportingInterfaceTab(object):
     def get_description(self):
         return self.report.description
 
+    def is_pregenerated(self):
+        return self.report in pregenerated.REPORTS
+
     def get_absolute_url(self):
         return reverse(self.get_urlname())
 
@@ -112,6 +121,8 @@ class ReportingInterfaceHandler(object):
     id = 'base'
     title = None
     interface_class = None
+    # Computes the reports of all the tabs at once, see ``download_all``.
+    batch_class = None
 
     def __call__(self, request, tab_class=None):
         interface = self.interface_class()
@@ -125,17 +136,36 @@ class ReportingInterfaceHandler(object):
                     cleaned_data = form.cleaned_data
                     display_type = cleaned_data.pop('display')
 
-                    return ReportResponse(tab.report,
-                                          request,
-                                          display_type,
-                                          **cleaned_data)
+                    output = pregenerated.find(tab.report, display_type, cleaned_data)
+                    if output is not None:
+                        if request.POST.get('recompute'):
+                            output = pregenerated.pregenerate(tab.report, cleaned_data)[display_type]
+                        return pregenerated.output_response(output)
+
+                    return report_response(tab.report,
+                                           request,
+                                           display_type,
+                                           **cleaned_data)
             else:
                 form = tab.form(prefix=tab.form_prefix)
             tabs[tab] = form
 
         ctx = {'tabs': tabs.items(), 'interface': interface, 'name': self.title}
+        if self.batch_class is not None:
+            ctx['batch_form'] = forms.YearForm(prefix='all')
+            ctx['batch_url'] = reverse('reporting_%s_all' % self.id)
         return render(request, 'reporting/interface.html', ctx)
 
+    def download_all(self, request):
+        """Returns the reports of all the tabs for the year as one workbook."""
+        form = forms.YearForm(request.POST or None, prefix='all')
+        if not form.is_valid():
+            return redirect('reporting_%s' % self.id)
+        batch = self.batch_class(**form.cleaned_data)
+        response = StreamingHttpResponse(batch.stream(), content_type=xlsx.CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename=%s' % batch.get_filename()
+        return response
+
     def get_urls(self):
         """
         Returns all urls for interface. Each tab has it's own POST URL plus
@@ -149,6 +179,12 @@ class ReportingInterfaceHandler(object):
                 name='reporting_%s' % self.id)
         )
 
+        if self.batch_class is not None:
+            urlpatterns += patterns('',
+                url(r'^all/$', admin.site.admin_view(self.download_all, cacheable=False),
+                    name='reporting_%s_all' % self.id)
+            )
+
         for t in interface.tabs:
             urlpatterns += patterns('',
                 url(r'^%s/$' % slugify(t.__name__), admin.site.admin_view(
@@ -164,6 +200,7 @@ class TownReportingInterfaceHandler(ReportingInterfaceHandler):
     id = 'towns'
     title = u'Města a okresy'
     interface_class = TownReportingInterface
+    batch_class = TownStatsBatch
 
 
 class ServicesReportingInterfaceHandler(ReportingInterfaceHandler):
@@ -203,3 +240,24 @@ clients = ClientReportingInterfaceHandler()
 yearly = YearlyReportingInterfaceHandler()
 hygiene = HygieneReportingInterfaceHandler()
 govcouncil = GovCouncilReportingInterfaceHandler()
+
+
+class FrozenPeriodAdmin(admin.ModelAdmin):
+    """
+    Freezing a period stores its report values and closes it for changes,
+    deleting it reopens the period.
+    """
+    list_display = ('__unicode__', 'frozen_on', 'frozen_by')
+    fields = ('year', 'month')
+    actions = ('refreeze',)
+
+    def save_model(self, request, obj, form, change):
+        freeze(obj, request.user)
+
+    def refreeze(self, request, queryset):
+        for period in queryset:
+            freeze(period, request.user)
+        self.message_user(request, _(u'Hodnoty %d období byly znovu spočítány.') % len(queryset))
+    refreeze.short_description = _(u'Znovu spočítat uložené hodnoty')
+
+admin.site.register(FrozenPeriod, FrozenPeriodAdmin)
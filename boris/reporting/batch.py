@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Reports computed together in one data pass.
+
+Staff download all the tabs of the towns interface for a year in a row,
+each of them aggregating the same rows with a different grouping. The
+batch below computes every aggregation once grouped by month and town (and
+the district of the town) and derives the district and yearly groupings in
+memory. Sums and plain counts are added up, distinct counts (of persons)
+can't be, their distinct rows are loaded instead and counted per grouping.
+
+The reports are returned as one workbook with a sheet per table.
+"""
+from collections import defaultdict
+
+from boris.reporting import tabular
+from boris.reporting.core import make_key
+from boris.reporting.frozen import StoredValues, period_dates
+from boris.reporting.reports.monthly_stats import MonthlyStatsByTown, MonthlyStatsByDistrict
+from boris.reporting.reports.yearly_stats import YearlyStatsByTown, YearlyStatsByDistrict
+
+
+class RollupValues(StoredValues):
+    """
+    Values of a year for the ``groupings``, derived from the ``finest``
+    grouping computed once per aggregation. Frozen periods keep their stored
+    values.
+    """
+    finest = ('month', 'town', 'town__district')
+    groupings = (
+        ('month', 'town'),
+        ('month', 'town__district'),
+        ('month',),
+        ('year', 'town'),
+        ('year', 'town__district'),
+        ('year',),
+    )
+
+    def __init__(self, year):
+        super(RollupValues, self).__init__(*period_dates(year))
+        self.year = year
+        self._rollups = {}
+
+    def _key(self, row, grouping):
+        return make_key((name, self.year if name == 'year' else row[self.finest.index(name)])
+                        for name in grouping)
+
+    def rollup(self, aggregation):
+        """Returns {grouping: {key: value}} of ``aggregation`` for all the groupings."""
+        rollups = dict((grouping, defaultdict(int)) for grouping in self.groupings)
+        if aggregation.is_additive():
+            for key, value in aggregation.values(self.finest).iteritems():
+                row = [key[name] for name in self.finest]
+                for grouping in self.groupings:
+                    rollups[grouping][self._key(row, grouping)] += value
+        else:
+            counted = dict((grouping, defaultdict(set)) for grouping in self.groupings)
+            for row in aggregation.distinct_values(self.finest):
+                for grouping in self.groupings:
+                    counted[grouping][self._key(row, grouping)].add(row[-1])
+            for grouping, keys in counted.iteritems():
+                for key, items in keys.iteritems():
+                    rollups[grouping][key] = len(items)
+        return rollups
+
+    def get(self, aggregation, grouping):
+        if grouping not in self.groupings or self.is_frozen():
+            return super(RollupValues, self).get(aggregation, grouping)
+        if aggregation.__class__ not in self._rollups:
+            self._rollups[aggregation.__class__] = self.rollup(aggregation)
+        return self._rollups[aggregation.__class__][grouping]
+
+
+class TownStatsBatch(object):
+    """The town and district reports of a year, computed in one pass."""
+    report_classes = (MonthlyStatsByTown, YearlyStatsByTown, MonthlyStatsByDistrict,
+                      YearlyStatsByDistrict)
+
+    def __init__(self, year):
+        self.year = year
+        values = RollupValues(year)
+        self.reports = [report_class(year) for report_class in self.report_classes]
+        for report in self.reports:
+            report.stored_values = values
+
+    def get_filename(self):
+        return 'stat_mesta_okresy_%s.xlsx' % self.year
+
+    def get_tables(self):
+        """Returns the tables of all the reports, titled by their reports."""
+        for report in self.reports:
+            for table in report.get_tables():
+                yield table._replace(title=u'%s %s' % (report.title, table.title))
+
+    def stream(self):
+        return tabular.xlsx_chunks(self.get_tables())
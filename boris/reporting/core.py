@@ -1,10 +1,20 @@
 from collections import defaultdict
+from os.path import splitext
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template import loader
 from django.template.context import RequestContext
 
-from boris.reporting.forms import OUTPUT_BROWSER, OUTPUT_OFFICE
+from boris.reporting import tabular
+from boris.reporting.forms import OUTPUT_BROWSER, OUTPUT_OFFICE, OUTPUT_XLSX, OUTPUT_CSV
+from boris.utils import xlsx
+
+
+# Outputs written by the tabular writers as the response is being sent.
+STREAMED_OUTPUTS = {
+    OUTPUT_XLSX: (tabular.xlsx_chunks, xlsx.CONTENT_TYPE, 'xlsx'),
+    OUTPUT_CSV: (tabular.csv_chunks, 'text/csv; charset=utf-8', 'csv'),
+}
 
 
 class hashdict(dict):
@@ -34,6 +44,28 @@ class ReportResponse(HttpResponse):
                 self[key] = val
 
 
+class StreamingReportResponse(StreamingHttpResponse):
+    """
+    Streams the report in one of STREAMED_OUTPUTS, the output is written as
+    the response is being sent.
+    """
+    def __init__(self, report_class, request, display_type, *args, **kwargs):
+        report = report_class(*args, **kwargs)
+        super(StreamingReportResponse, self).__init__(report.stream(display_type),
+                                                      content_type=report.contenttype(display_type))
+        for key, val in report.response_headers(display_type).items():
+            self[key] = val
+
+
+def report_response(report_class, request, display_type, *args, **kwargs):
+    """Returns the response rendering ``report_class`` as ``display_type``."""
+    if display_type in STREAMED_OUTPUTS and not report_class.browser_only:
+        response_class = StreamingReportResponse
+    else:
+        response_class = ReportResponse
+    return response_class(report_class, request, display_type, *args, **kwargs)
+
+
 class BaseReport(object):
     title = None
     description = None
@@ -47,6 +79,9 @@ class BaseReport(object):
         if self.browser_only:
             return 'text/html'
 
+        if display_type in STREAMED_OUTPUTS:
+            return STREAMED_OUTPUTS[display_type][1]
+
         return {
             OUTPUT_BROWSER: 'text/html',
             OUTPUT_OFFICE: self.contenttype_office,
@@ -56,6 +91,10 @@ class BaseReport(object):
         if self.browser_only:
             return {}
 
+        if display_type in STREAMED_OUTPUTS:
+            filename = '%s.%s' % (splitext(self.get_filename())[0], STREAMED_OUTPUTS[display_type][2])
+            return {'Content-Disposition': 'attachment; filename=%s' % filename}
+
         return {
             OUTPUT_BROWSER: {},
             OUTPUT_OFFICE: {
@@ -72,6 +111,18 @@ class BaseReport(object):
                 display_type), # display_type can be "browser" or "office"
         )
 
+    def get_tables(self):
+        """
+        Returns the report as a list of ``tabular.Table`` with typed cell
+        values, used by the HTML, CSV and XLSX writers.
+        """
+        raise NotImplementedError
+
+    def stream(self, display_type):
+        """Returns an iterator over chunks of the output in one of STREAMED_OUTPUTS."""
+        writer = STREAMED_OUTPUTS[display_type][0]
+        return writer(self.get_tables())
+
 
 class Report(BaseReport):
     """
@@ -88,6 +139,8 @@ class Report(BaseReport):
     and methods:
 
     - get_data (required) - returns the data to be used in the template
+    - get_tables (required) - returns the data as tables, the template
+      gets them rendered as ``tables``
     """
     columns = None
     aggregation_classes = ()
@@ -96,7 +149,7 @@ class Report(BaseReport):
         return self.title
 
     def get_context(self):
-        return {'report': self}
+        return {'report': self, 'tables': tabular.render_html(self.get_tables())}
 
     def render(self, request, display_type):
         return loader.render_to_string(
@@ -113,6 +166,13 @@ class Report(BaseReport):
     def get_data(self, *args, **kwargs):
         raise NotImplementedError
 
+    def get_values(self, aggregation, grouping):
+        """
+        Returns the values of ``aggregation`` grouped by ``grouping`` as
+        {key: value}. Reports can override this to reuse stored values.
+        """
+        return aggregation.values(grouping)
+
 
 class Aggregation(object):
     """
@@ -139,26 +199,51 @@ class Aggregation(object):
 
     def _values(self):
         if not hasattr(self, '_vals'):
-            qset = self.model.objects.all()
-
-            if self._filtering:
-                qset = qset.filter(self._filtering)
-
-            if self._excludes:
-                qset = qset.exclude(self._excludes)
-
             self._vals = defaultdict(int)
 
             for grouping in (self.report.grouping, self.report.grouping_total):
-                vals = qset.values(*grouping).order_by().annotate(total=self.get_annotation_func())
+                # Reports may provide stored values, see ``Report.get_values``.
+                if hasattr(self.report, 'get_values'):
+                    vals = self.report.get_values(self, grouping)
+                else:
+                    vals = self.values(grouping)
 
-                for value in vals:
-                    key = make_key((k, value[k]) for k in grouping)
-                    # non-existent entries return None, hence "or 0"
-                    self._vals[key] += value['total'] or 0
+                for key, value in vals.iteritems():
+                    self._vals[key] += value
 
         return self._vals
 
+    def queryset(self, excludes=None):
+        """
+        Returns the rows to aggregate, without those matching the
+        ``excludes`` expression.
+        """
+        qset = self.model.objects.all()
+
+        if self._filtering:
+            qset = qset.filter(self._filtering)
+
+        if self._excludes:
+            qset = qset.exclude(self._excludes)
+
+        if excludes:
+            qset = qset.exclude(self._prepare_expression(excludes))
+
+        return qset
+
+    def values(self, grouping, excludes=None):
+        """
+        Computes the aggregation grouped by ``grouping``, returns {key: value}.
+        Rows matching the ``excludes`` expression are left out.
+        """
+        qset = self.queryset(excludes)
+        vals = defaultdict(int)
+        for value in qset.values(*grouping).order_by().annotate(total=self.get_annotation_func()):
+            key = make_key((k, value[k]) for k in grouping)
+            # non-existent entries return None, hence "or 0"
+            vals[key] += value['total'] or 0
+        return vals
+
     def _prepare_expression(self, qset_expression):
         from django.db.models import Q
         if isinstance(qset_expression, dict):
@@ -173,6 +258,23 @@ class Aggregation(object):
         from django.db.models import Count
         return Count(self.aggregation_dbcol, distinct=True)
 
+    def is_additive(self):
+        """
+        Returns True if the values of a grouping are sums of the values of
+        a finer grouping. Distinct counts are, if the counted column is the
+        row identity.
+        """
+        return self.aggregation_dbcol == 'id'
+
+    def distinct_values(self, grouping):
+        """
+        Returns the distinct rows of the values of ``grouping`` followed by
+        the counted column, a distinct count of a coarser grouping counts
+        these rows.
+        """
+        return self.queryset().exclude(**{'%s__isnull' % self.aggregation_dbcol: True}) \
+            .values_list(*(tuple(grouping) + (self.aggregation_dbcol,))).order_by().distinct()
+
     def get_val(self, key):
         """
         Return value for given column.
@@ -188,6 +290,9 @@ class SumAggregation(Aggregation):
         from django.db.models import Sum
         return Sum(self.aggregation_dbcol)
 
+    def is_additive(self):
+        return True
+
 
 class NonDistinctCountAggregation(Aggregation):
     """
@@ -197,6 +302,9 @@ class NonDistinctCountAggregation(Aggregation):
         from django.db.models import Count
         return Count(self.aggregation_dbcol, distinct=False)
 
+    def is_additive(self):
+        return True
+
 
 class SuperAggregation(Aggregation):
     """ Provides an 'aggregation' (sum) over aggregations. """
@@ -0,0 +1,84 @@
+"""
+Date dimension for the reporting views.
+
+Reports filter on ``performed_on`` ranges, which can use the date indexes,
+and group by year, month, quarter or week. The views (version 0006_views
+on) left join ``DateDimension`` on the date and take these attributes from
+it, together with the ISO week year and the fiscal year and period, which
+reports can group by as well.
+
+The dimension should cover all dates in the reported tables, see
+``fill_date_dimension``. For days outside of it the views compute the
+calendar attributes from the date itself, so such rows are still reported;
+their fiscal attributes are NULL.
+"""
+from datetime import date, timedelta
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import Max, Min
+
+
+# Default range filled by the migration.
+DEFAULT_FIRST_YEAR = 1990
+DEFAULT_LAST_YEAR = 2050
+
+
+def fiscal_period(day, start_month=None):
+    """
+    Returns (fiscal year, fiscal period) of ``day``. Fiscal years are named
+    by the calendar year they start in, periods are numbered from 1.
+    """
+    if start_month is None:
+        start_month = getattr(settings, 'REPORTING_FISCAL_YEAR_START', 1)
+    year = day.year if day.month >= start_month else day.year - 1
+    return year, (day.month - start_month) % 12 + 1
+
+
+def date_attributes(day):
+    """Returns the dimension row values for ``day``."""
+    iso_year, iso_week, _weekday = day.isocalendar()
+    fiscal_year, period = fiscal_period(day)
+    return {
+        'date': day,
+        'year': day.year,
+        'month': day.month,
+        'quarter': (day.month - 1) // 3 + 1,
+        'week': iso_week,
+        'week_year': iso_year,
+        'fiscal_year': fiscal_year,
+        'fiscal_period': period,
+    }
+
+
+def reported_range(apps=global_apps):
+    """Returns the first and the last date found in the reported tables."""
+    bounds = []
+    for app_label, model_name, field in (('services', 'Encounter', 'performed_on'),
+                                         ('syringes', 'SyringeCollection', 'date')):
+        qset = apps.get_model(app_label, model_name)._default_manager.all()
+        bounds.extend(qset.aggregate(first=Min(field), last=Max(field)).values())
+    bounds = filter(None, bounds)
+    return (min(bounds), max(bounds)) if bounds else (None, None)
+
+
+def fill_date_dimension(date_from=None, date_to=None, apps=global_apps):
+    """
+    Inserts the missing days between ``date_from`` and ``date_to``. By
+    default DEFAULT_FIRST_YEAR to DEFAULT_LAST_YEAR, extended to all dates
+    in the reported tables. Accepts ``apps`` so that it can be used from
+    data migrations. Returns the number of days inserted.
+    """
+    DateDimension = apps.get_model('reporting', 'DateDimension')
+    if date_from is None or date_to is None:
+        first, last = reported_range(apps)
+        date_from = date_from or min(filter(None, (first, date(DEFAULT_FIRST_YEAR, 1, 1))))
+        date_to = date_to or max(filter(None, (last, date(DEFAULT_LAST_YEAR, 12, 31))))
+
+    existing = set(DateDimension.objects.filter(
+        date__gte=date_from, date__lte=date_to).values_list('date', flat=True))
+    days = (date_from + timedelta(days=i) for i in xrange((date_to - date_from).days + 1))
+    DateDimension.objects.bulk_create([
+        DateDimension(**date_attributes(day)) for day in days if day not in existing
+    ], batch_size=500)
+    return (date_to - date_from).days + 1 - len(existing)
@@ -11,9 +11,13 @@ from boris.utils.widgets import SelectYearWidget
 
 OUTPUT_BROWSER = 'browser'
 OUTPUT_OFFICE = 'office'
+OUTPUT_XLSX = 'xlsx'
+OUTPUT_CSV = 'csv'
 OUTPUT_TYPES = (
     (OUTPUT_BROWSER, u'V prohlížeči'),
     (OUTPUT_OFFICE, u'Do souboru'),
+    (OUTPUT_XLSX, u'Do souboru XLSX'),
+    (OUTPUT_CSV, u'Do souboru CSV'),
 )
 
 
@@ -32,6 +36,10 @@ class MonthlyStatsForm(ReportForm):
     year = forms.IntegerField(widget=SelectYearWidget(history=10), label=_(u'Rok'))
 
 
+class YearForm(forms.Form):
+    year = forms.IntegerField(widget=SelectYearWidget(history=10), label=_(u'Rok'))
+
+
 class ServiceForm(ReportForm):
     date_from = forms.DateField(label=_(u'Od'), required=False, widget=AdminDateWidget())
     date_to = forms.DateField(label=_(u'Do'), required=False, widget=AdminDateWidget())
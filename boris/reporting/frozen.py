@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Frozen (closed) reporting periods.
+
+When a month or year is frozen, the values of all the aggregations of
+``ClientReportBase`` are computed for the groupings the reports use and
+stored along with the results of the service report for the period.
+Reports of the period then read the stored values instead of aggregating
+the raw rows, yearly reports with monthly groupings combine the stored
+values of frozen months with the computed values of the other months.
+
+Encounters and syringe collections in frozen periods can't be changed (see
+``Encounter.is_editable`` and the ``clean`` methods), so the numbers stay
+those submitted when the period was closed. Changes of clients (e.g. their
+primary drug) don't change the stored values either. A frozen period can be
+recomputed in the admin.
+"""
+import calendar
+import json
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.utils.encoding import force_text
+
+from boris.reporting.core import make_key
+from boris.reporting.models import FrozenPeriod, FrozenValue
+
+
+MONTH_GROUPINGS = (
+    ('month', 'town'),
+    ('month', 'town__district'),
+    ('month',),
+    ('town',),
+    ('grouping_constant',),
+)
+YEAR_GROUPINGS = MONTH_GROUPINGS + (
+    ('year', 'town'),
+    ('year', 'town__district'),
+    ('year',),
+)
+
+BATCH_SIZE = 1000
+
+
+def period_dates(year, month=None):
+    """Returns the first and the last day of a year or a month."""
+    if month is None:
+        return date(year, 1, 1), date(year, 12, 31)
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def period_groupings(period):
+    return YEAR_GROUPINGS if period.month is None else MONTH_GROUPINGS
+
+
+def _key_text(key, grouping):
+    return u','.join(u'' if key[name] is None else unicode(key[name]) for name in grouping)
+
+
+def _parse_key(text, grouping):
+    return make_key(zip(grouping, [int(value) if value else None for value in text.split(',')]))
+
+
+class PeriodReport(object):
+    """Stands for a report of the whole ``period`` when its values are computed."""
+    def __init__(self, period):
+        date_from, date_to = period_dates(period.year, period.month)
+        self.additional_filtering = {'performed_on__gte': date_from, 'performed_on__lte': date_to}
+
+
+def _stats_value(value):
+    return value if isinstance(value, (int, long)) else force_text(value)
+
+
+@transaction.atomic
+def freeze(period, user=None):
+    """
+    Saves ``period``, (re)computes its stored values and discards its
+    pregenerated reports.
+    """
+    from boris.reporting.pregenerated import discard_period
+    from boris.reporting.reports.monthly_stats import ClientReportBase
+    from boris.reporting.reports.services import ServiceReport
+
+    report = PeriodReport(period)
+    values = []
+    for aggregation_class in ClientReportBase.aggregation_classes:
+        aggregation = aggregation_class(report)
+        for grouping in period_groupings(period):
+            values.extend(
+                FrozenValue(aggregation=aggregation_class.__name__, grouping=u','.join(grouping),
+                            key=_key_text(key, grouping), value=value)
+                for key, value in aggregation.values(grouping).iteritems())
+
+    date_from, date_to = period_dates(period.year, period.month)
+    stats = ServiceReport(date_from, date_to).compute_stats()
+    period.service_stats = json.dumps([
+        [(force_text(title), _stats_value(result)) for title, result in results]
+        for _service, results in stats])
+    if user is not None:
+        period.frozen_by = user
+    period.save()
+
+    period.values.all().delete()
+    for value in values:
+        value.period = period
+    FrozenValue.objects.bulk_create(values, batch_size=BATCH_SIZE)
+    discard_period(period.year, period.month)
+    return period
+
+
+def _matching_period(date_from, date_to):
+    """Returns (year, month) of the frozen period spanning exactly the days or None."""
+    if date_from is None or date_to is None or date_from.year != date_to.year:
+        return None
+    for year, month in FrozenPeriod.objects.periods():
+        if year == date_from.year and (date_from, date_to) == period_dates(year, month):
+            return year, month
+    return None
+
+
+def get_period(date_from, date_to):
+    """Returns the frozen period spanning exactly ``date_from`` - ``date_to`` or None."""
+    matching = _matching_period(date_from, date_to)
+    if matching is None:
+        return None
+    return FrozenPeriod.objects.get(year=matching[0], month=matching[1])
+
+
+def service_stats(date_from, date_to):
+    """Returns the stored results of the service report for the period or None."""
+    period = get_period(date_from, date_to)
+    if period is None or not period.service_stats:
+        return None
+    return [(None, results) for results in json.loads(period.service_stats)]
+
+
+class StoredValues(object):
+    """
+    Values of a report taken from frozen periods where possible. The values
+    of a period and a grouping are loaded at once for all the aggregations.
+    """
+    def __init__(self, date_from, date_to):
+        self.date_from = date_from
+        self.date_to = date_to
+        self._periods = {}
+        self._values = {}
+
+    def _period(self, year, month=None):
+        if (year, month) not in self._periods:
+            self._periods[year, month] = FrozenPeriod.objects.get(year=year, month=month)
+        return self._periods[year, month]
+
+    def _stored(self, period, aggregation, grouping):
+        if (period.pk, grouping) not in self._values:
+            loaded = defaultdict(dict)
+            rows = period.values.filter(grouping=u','.join(grouping)) \
+                .values_list('aggregation', 'key', 'value')
+            for aggregation_name, key, value in rows:
+                loaded[aggregation_name][_parse_key(key, grouping)] = value
+            self._values[period.pk, grouping] = loaded
+        return self._values[period.pk, grouping].get(aggregation.__class__.__name__, {})
+
+    def _frozen_months(self):
+        """Returns the frozen months if the report spans a whole year."""
+        if self.date_from is None or (self.date_from, self.date_to) != period_dates(self.date_from.year):
+            return []
+        year = self.date_from.year
+        periods = FrozenPeriod.objects.periods()
+        return [month for month in xrange(1, 13) if (year, month) in periods]
+
+    def is_frozen(self):
+        """Returns True if some of the report's days lie in frozen periods."""
+        return _matching_period(self.date_from, self.date_to) is not None or \
+            bool(self._frozen_months())
+
+    def get(self, aggregation, grouping):
+        """Returns the values of ``aggregation`` grouped by ``grouping``."""
+        matching = _matching_period(self.date_from, self.date_to)
+        if matching is not None:
+            period = self._period(*matching)
+            if grouping in period_groupings(period):
+                return self._stored(period, aggregation, grouping)
+
+        months = self._frozen_months() if 'month' in grouping else []
+        if not months:
+            return aggregation.values(grouping)
+        values = {}
+        for month in months:
+            values.update(self._stored(self._period(self.date_from.year, month), aggregation, grouping))
+        if len(months) < 12:
+            values.update(aggregation.values(grouping, excludes={'month__in': months}))
+        return values
@@ -1 +0,0 @@
-import install_views
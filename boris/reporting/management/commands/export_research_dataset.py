@@ -0,0 +1,32 @@
+import sys
+from optparse import make_option
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import transaction
+
+from boris.reporting.research import CHUNK_SIZE, get_key, research_lines
+
+
+class Command(NoArgsCommand):
+    help = 'Export the pseudonymized per-client research dataset as JSON lines'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--key', help='Pseudonymization key (default RESEARCH_EXPORT_KEY setting).'),
+        make_option('--output', '-o', help='Output file (default standard output).'),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+            help='Number of clients read at once (default %d).' % CHUNK_SIZE),
+    )
+
+    def handle_noargs(self, **options):
+        try:
+            key = get_key(options['key'])
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout
+        try:
+            with transaction.atomic():
+                for line in research_lines(key, chunk_size=options['chunk_size']):
+                    out.write(line)
+        finally:
+            if options['output']:
+                out.close()
@@ -0,0 +1,35 @@
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import transaction
+
+from boris.reporting.dimension import fill_date_dimension
+from boris.reporting.models import DateDimension
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        raise CommandError('Invalid date %r, use YYYY-MM-DD.' % value)
+
+
+class Command(NoArgsCommand):
+    help = 'Add missing days to the reporting date dimension'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--from', dest='date_from',
+            help='First day (YYYY-MM-DD), defaults to the earliest reported date.'),
+        make_option('--to', dest='date_to',
+            help='Last day (YYYY-MM-DD), defaults to the latest reported date.'),
+        make_option('--rebuild', action='store_true', default=False,
+            help='Drop the existing days first, e.g. after changing the fiscal year start.'),
+    )
+
+    def handle_noargs(self, **options):
+        with transaction.atomic():
+            if options['rebuild']:
+                DateDimension.objects.all().delete()
+            count = fill_date_dimension(_parse_date(options['date_from']),
+                                        _parse_date(options['date_to']))
+        self.stdout.write('%d days added' % count)
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from datetime import date
+from optparse import make_option
+
+from django import forms
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import connection, transaction, DatabaseError
+from django.db.backends.utils import CursorWrapper
+from django.test.client import RequestFactory
+
+from boris.reporting import admin as reporting_admin
+from boris.reporting.forms import OUTPUT_BROWSER
+
+
+# Enumeration tables are small enough for full scans not to matter.
+SMALL_TABLES = ('django_content_type', 'clients_town', 'clients_district', 'clients_region',
+                'clients_groupcontacttype', 'auth_user')
+
+HANDLERS = ('towns', 'services', 'clients', 'yearly', 'hygiene', 'govcouncil')
+
+
+class RecordingCursor(CursorWrapper):
+    """Cursor which records the SQL and parameters of all SELECTs."""
+    def __init__(self, cursor, db, log):
+        super(RecordingCursor, self).__init__(cursor, db)
+        self.log = log
+
+    def execute(self, sql, params=None):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.log.append((sql, tuple(params or ())))
+        return super(RecordingCursor, self).execute(sql, params)
+
+
+def explain_mysql(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    names = [c[0].lower() for c in cursor.description]
+    issues = []
+    for row in cursor.fetchall():
+        row = dict(zip(names, row))
+        table, extra = row.get('table') or '', row.get('extra') or ''
+        if row.get('type') == 'ALL' and table not in SMALL_TABLES:
+            issues.append('full scan of %s (%s rows)' % (table, row.get('rows')))
+        if 'Using filesort' in extra:
+            issues.append('filesort on %s' % table)
+        if 'Using temporary' in extra:
+            issues.append('temporary table for %s' % table)
+    return issues
+
+
+def explain_sqlite(cursor, sql, params):
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    issues = []
+    for row in cursor.fetchall():
+        detail = row[-1]
+        words = detail.split()
+        if words[0] == 'SCAN' and 'INDEX' not in detail:
+            table = words[2] if words[1] == 'TABLE' else words[1]
+            if table not in SMALL_TABLES:
+                issues.append('full scan of %s' % table)
+        if 'TEMP B-TREE' in detail:
+            issues.append(detail.lower())
+    return issues
+
+
+def explain_postgresql(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    issues = []
+    for (line,) in cursor.fetchall():
+        line = line.strip().lstrip('-> ')
+        if line.startswith('Seq Scan on '):
+            table = line.split()[3]
+            if table not in SMALL_TABLES:
+                issues.append('full scan of %s' % table)
+        elif line.startswith('Sort '):
+            issues.append('sort')
+    return issues
+
+
+EXPLAINERS = {
+    'mysql': explain_mysql,
+    'sqlite': explain_sqlite,
+    'postgresql': explain_postgresql,
+}
+
+
+class Command(NoArgsCommand):
+    help = ('Run every report, EXPLAIN the queries it issues and list those '
+            'doing full table scans or sorting without an index')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--year', type='int', default=date.today().year,
+            help='Year to run the reports for (default current year).'),
+        make_option('--all', action='store_true', default=False,
+            help='List all queries, not only the flagged ones.'),
+    )
+
+    def get_report_kwargs(self, form, year):
+        """Yields keyword arguments for every variant of the report form."""
+        kwargs = {}
+        variants = [{}]
+        for name, field in form.base_fields.iteritems():
+            if name == 'display':
+                continue
+            if name == 'year':
+                kwargs[name] = year
+            elif name == 'date_from':
+                kwargs[name] = date(year, 1, 1)
+            elif name == 'date_to':
+                kwargs[name] = date(year, 12, 31)
+            elif isinstance(field, forms.ModelMultipleChoiceField):
+                kwargs[name] = []  # All towns.
+            elif isinstance(field, forms.ModelChoiceField):
+                kwargs[name] = None
+            elif isinstance(field, forms.ChoiceField):
+                variants = [dict(v, **{name: choice}) for v in variants for choice, _ in field.choices]
+        for variant in variants:
+            yield dict(kwargs, **variant)
+
+    def run_report(self, report_cls, kwargs):
+        """Renders the report and returns the SELECTs issued with their counts."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        log = []
+        make_debug_cursor = connection.make_debug_cursor
+        use_debug_cursor = connection.use_debug_cursor
+        connection.make_debug_cursor = lambda cursor: RecordingCursor(cursor, connection, log)
+        connection.use_debug_cursor = True
+        try:
+            with transaction.atomic():
+                report_cls(**kwargs).render(request, OUTPUT_BROWSER)
+                transaction.set_rollback(True)
+        finally:
+            connection.make_debug_cursor = make_debug_cursor
+            connection.use_debug_cursor = use_debug_cursor
+        queries = OrderedDict()
+        for sql, params in log:
+            queries.setdefault(sql, [params, 0])[1] += 1
+        return queries
+
+    def handle_noargs(self, **options):
+        explain = EXPLAINERS.get(connection.vendor)
+        if explain is None:
+            raise CommandError('EXPLAIN is not supported for %s.' % connection.vendor)
+
+        flagged = 0
+        for handler_name in HANDLERS:
+            handler = getattr(reporting_admin, handler_name)
+            for tab in handler.interface_class.tabs:
+                for kwargs in self.get_report_kwargs(tab.form, options['year']):
+                    label = tab.report.__name__
+                    if 'kind' in kwargs:
+                        label += ' (kind=%s)' % kwargs['kind']
+                    try:
+                        queries = self.run_report(tab.report, kwargs)
+                    except DatabaseError as e:
+                        self.stdout.write('%s: failed (%s)' % (label, e))
+                        continue
+                    self.stdout.write('%s: %d queries' % (label, sum(c for _p, c in queries.values())))
+                    cursor = connection.cursor()
+                    for sql, (params, count) in queries.iteritems():
+                        try:
+                            issues = explain(cursor, sql, params)
+                        except DatabaseError as e:
+                            issues = ['EXPLAIN failed: %s' % e]
+                        flagged += bool(issues)
+                        if issues or options['all']:
+                            self.stdout.write('  [%dx] %s' % (count, sql[:300]))
+                            for issue in issues:
+                                self.stdout.write('    - %s' % issue)
+        self.stdout.write('%d flagged queries' % flagged)
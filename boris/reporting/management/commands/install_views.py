@@ -1,9 +1,17 @@
-from django.core.management.base import NoArgsCommand, CommandError
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import DEFAULT_DB_ALIAS
+
 from boris.reporting.management.install_views import install_views
 
 
 class Command(NoArgsCommand):
     help = 'Reinstall reporting views'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--database', default=DEFAULT_DB_ALIAS,
+            help='Database to install the views to (default "default").'),
+    )
 
     def handle_noargs(self, **options):
-        install_views(None)
+        install_views(using=options['database'])
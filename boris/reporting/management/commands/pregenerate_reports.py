@@ -0,0 +1,41 @@
+from datetime import date
+from optparse import make_option
+
+from django.core.management.base import CommandError, NoArgsCommand
+
+from boris.reporting.models import FrozenPeriod
+from boris.reporting.pregenerated import pregenerate_period
+
+
+class Command(NoArgsCommand):
+    help = ('Pregenerate the standard reports of frozen periods, by default of the last month '
+            'and in January also of the last year (to be run from cron)')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--year', type='int', help='Closed year to pregenerate.'),
+        make_option('--month', type='int', help='Closed month of --year to pregenerate.'),
+    )
+
+    def handle_noargs(self, **options):
+        year, month = options['year'], options['month']
+        if year is None and month is not None:
+            raise CommandError('--month requires --year.')
+        if month is not None and not 1 <= month <= 12:
+            raise CommandError('Invalid month %d.' % month)
+
+        if year is not None:
+            periods = [(year, month)]
+        else:
+            today = date.today()
+            if today.month == 1:
+                periods = [(today.year - 1, 12), (today.year - 1, None)]
+            else:
+                periods = [(today.year, today.month - 1)]
+
+        frozen = FrozenPeriod.objects.periods()
+        for year, month in periods:
+            period = '%d/%d' % (month, year) if month else '%d' % year
+            if (year, None) not in frozen and (year, month) not in frozen:
+                self.stdout.write('Skipped %s, the period is not frozen.' % period)
+                continue
+            count = pregenerate_period(year, month)
+            self.stdout.write('Pregenerated %d reports of %s.' % (count, period))
@@ -1,19 +1,103 @@
+"""
+Reporting views over the encounter, service and syringe collection tables.
+
+The view SQL is versioned. Every version lives in ``sql/<version>/`` with
+one file per database backend and is named by the reporting migration
+installing it (``0003_views``). A released version never changes: later
+migrations, also those of other apps, have to install the views exactly as
+they were at their point in the migration history. Changed views get a new
+version directory, a reporting migration installing it and become
+``VIEWS_VERSION``, the version ``install_views`` installs by default. That
+migration depends on the latest migrations of the tables under the views,
+so that no older migration reinstalls the previous version after it.
+
+Schema changes of the tables under the views have to drop them first:
+SQLite rebuilds a table by renaming a copy of it, which fails while a view
+refers to the table, and PostgreSQL refuses to alter columns used by views.
+A schema migration of any of ``VIEW_TABLES`` therefore depends on the
+reporting migration of the latest views version and wraps its operations::
+
+    from boris.reporting.management.install_views import views_reinstalled
+
+    dependencies = [..., ('reporting', '0006_views')]
+    operations = views_reinstalled('0006_views',
+        migrations.AddField(...),
+    )
+"""
 from os.path import dirname, join
 
-from django.db import connection
-from south.signals import post_migrate
+from django.db import connections, migrations, DEFAULT_DB_ALIAS
 
 from boris import reporting
 
 
-def install_views(app, **kwargs):
-    cursor = connection.cursor()
-    sql_file = open(join(dirname(reporting.__file__), 'sql', 'reporting-views.mysql.sql'), 'r')
+# The version installed by default, see above.
+VIEWS_VERSION = '0006_views'
+
+VIEWS = ('reporting_searchencounter', 'reporting_searchservice', 'reporting_searchsyringecollection')
+# Tables the views select from.
+VIEW_TABLES = ('services_encounter', 'services_service', 'syringes_syringecollection',
+               'clients_client', 'clients_anonymous', 'django_content_type',
+               'reporting_datedimension')
+
+
+def view_statements(vendor, version=VIEWS_VERSION):
+    """
+    Returns the statements creating the reporting views of ``version`` on
+    ``vendor`` (``connection.vendor``), one file per database backend.
+    """
+    try:
+        sql_file = open(join(dirname(reporting.__file__), 'sql', version, '%s.sql' % vendor), 'r')
+    except IOError:
+        raise NotImplementedError('Reporting views %s are not available for %s.' % (version, vendor))
 
     try:
-        cursor.execute(sql_file.read())
+        sql = sql_file.read()
     finally:
         sql_file.close()
+    # Not all backends accept several statements at once.
+    return [statement.strip() for statement in sql.split(';') if statement.strip()]
+
+
+def install_views(app=None, using=DEFAULT_DB_ALIAS, version=VIEWS_VERSION, **kwargs):
+    connection = connections[using]
+    cursor = connection.cursor()
+    for statement in view_statements(connection.vendor, version):
+        cursor.execute(statement)
+
+
+def uninstall_views(using=DEFAULT_DB_ALIAS):
+    cursor = connections[using].cursor()
+    for view in VIEWS:
+        cursor.execute('DROP VIEW IF EXISTS %s' % view)
+
+
+def install_views_operation(version, previous=None):
+    """
+    Returns a migration operation installing the views of ``version``. When
+    reversed, it installs the ``previous`` version or drops the views.
+    """
+    def install(apps, schema_editor):
+        install_views(using=schema_editor.connection.alias, version=version)
+
+    def revert(apps, schema_editor):
+        if previous is None:
+            uninstall_views(using=schema_editor.connection.alias)
+        else:
+            install_views(using=schema_editor.connection.alias, version=previous)
+    return migrations.RunPython(install, revert)
+
 
+def views_reinstalled(version, *operations):
+    """
+    Returns migration ``operations`` changing ``VIEW_TABLES`` wrapped in
+    dropping the reporting views of ``version`` before and installing them
+    after.
+    """
+    def install(apps, schema_editor):
+        install_views(using=schema_editor.connection.alias, version=version)
 
-post_migrate.connect(install_views)
+    def uninstall(apps, schema_editor):
+        uninstall_views(using=schema_editor.connection.alias)
+    return [migrations.RunPython(uninstall, install)] + list(operations) + \
+        [migrations.RunPython(install, uninstall)]
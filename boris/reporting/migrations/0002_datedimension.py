@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def fill_dates(apps, schema_editor):
+    from boris.reporting.dimension import fill_date_dimension
+    fill_date_dimension(apps=apps)
+
+
+def drop_dates(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0001_initial'),
+        ('services', '0019_reporting_indexes'),
+        ('syringes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DateDimension',
+            fields=[
+                ('date', models.DateField(serialize=False, primary_key=True)),
+                ('year', models.SmallIntegerField()),
+                ('month', models.SmallIntegerField()),
+                ('quarter', models.SmallIntegerField()),
+                ('week', models.SmallIntegerField()),
+                ('week_year', models.SmallIntegerField()),
+                ('fiscal_year', models.SmallIntegerField()),
+                ('fiscal_period', models.SmallIntegerField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='datedimension',
+            index_together=set([('year', 'month')]),
+        ),
+        migrations.RunPython(fill_dates, reverse_code=drop_dates),
+    ]
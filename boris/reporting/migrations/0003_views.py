@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from boris.reporting.management.install_views import install_views_operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0002_datedimension'),
+        ('clients', '0019_contact_indexes'),
+        ('services', '0019_reporting_indexes'),
+        ('syringes', '0002_syringecollection_indexes'),
+        ('contenttypes', '0001_initial'),
+    ]
+
+    operations = [
+        install_views_operation('0003_views'),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0003_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PregeneratedReport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('report', models.CharField(max_length=100)),
+                ('parameters', models.CharField(max_length=255)),
+                ('display_type', models.CharField(max_length=10)),
+                ('content_type', models.CharField(max_length=100)),
+                ('disposition', models.CharField(max_length=255, blank=True)),
+                ('content', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pregeneratedreport',
+            unique_together=set([('report', 'parameters', 'display_type')]),
+        ),
+    ]
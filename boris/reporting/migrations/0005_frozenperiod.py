@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reporting', '0004_pregeneratedreport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FrozenPeriod',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('year', models.SmallIntegerField(verbose_name='Rok')),
+                ('month', models.SmallIntegerField(blank=True, help_text='Prázdný pro celý rok.', null=True, verbose_name='Měsíc', choices=[(1, 1), (2, 2), (3, 3), (4, 4), (5, 5), (6, 6), (7, 7), (8, 8), (9, 9), (10, 10), (11, 11), (12, 12)])),
+                ('frozen_on', models.DateTimeField(auto_now=True, verbose_name='Uzavřeno')),
+                ('service_stats', models.TextField(editable=False, blank=True)),
+                ('frozen_by', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to=settings.AUTH_USER_MODEL, null=True, verbose_name='Uzavřel')),
+            ],
+            options={
+                'ordering': ('-year', '-month'),
+                'verbose_name': 'Uzavřené období',
+                'verbose_name_plural': 'Uzavřená období',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='FrozenValue',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('aggregation', models.CharField(max_length=100)),
+                ('grouping', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.BigIntegerField()),
+                ('period', models.ForeignKey(related_name='values', to='reporting.FrozenPeriod')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='frozenperiod',
+            unique_together=set([('year', 'month')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='frozenvalue',
+            index_together=set([('period', 'aggregation', 'grouping')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from boris.reporting.management.install_views import install_views_operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0005_frozenperiod'),
+        ('services', '0020_sync_uuid'),
+        ('syringes', '0003_syringecollection_uuid'),
+    ]
+
+    operations = [
+        install_views_operation('0006_views', previous='0003_views'),
+    ]
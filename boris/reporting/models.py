@@ -1,4 +1,9 @@
+# -*- coding: utf-8 -*-
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import signals
+from django.utils.translation import ugettext_lazy as _
 
 from boris.clients.models import Person, Town
 from boris.services.models.core import Service, Encounter
@@ -6,6 +11,28 @@ from boris.services.models.core import Service, Encounter
 DO_NOTHING = models.DO_NOTHING
 
 
+class DateDimension(models.Model):
+    """
+    One row per day, joined by the reporting views on the date to provide
+    the calendar, ISO week and fiscal attributes. See
+    ``boris.reporting.dimension``.
+    """
+    date = models.DateField(primary_key=True)
+    year = models.SmallIntegerField()
+    month = models.SmallIntegerField()
+    quarter = models.SmallIntegerField()
+    week = models.SmallIntegerField()  # ISO week number.
+    week_year = models.SmallIntegerField()  # ISO year the week belongs to.
+    fiscal_year = models.SmallIntegerField()
+    fiscal_period = models.SmallIntegerField()
+
+    class Meta:
+        index_together = (('year', 'month'),)
+
+    def __unicode__(self):
+        return unicode(self.date)
+
+
 class SearchEncounter(models.Model):
     """
     An augmented model corresponding to a database view.
@@ -22,7 +49,13 @@ class SearchEncounter(models.Model):
     primary_drug_usage = models.PositiveSmallIntegerField()
     performed_on = models.DateField()
     month = models.SmallIntegerField()
+    quarter = models.SmallIntegerField()
+    week = models.SmallIntegerField()
     year = models.SmallIntegerField()
+    week_year = models.SmallIntegerField()
+    # Only for days filled in the date dimension.
+    fiscal_year = models.SmallIntegerField(null=True)
+    fiscal_period = models.SmallIntegerField(null=True)
     # "grouping_constant" is used in aggregations where grand totals are needed.
     grouping_constant = models.SmallIntegerField()  # Is always 1.
 
@@ -38,7 +71,13 @@ class SearchService(models.Model):
     town = models.ForeignKey(Town, related_name='+', on_delete=DO_NOTHING)
     performed_on = models.DateField()
     month = models.SmallIntegerField()
+    quarter = models.SmallIntegerField()
+    week = models.SmallIntegerField()
     year = models.SmallIntegerField()
+    week_year = models.SmallIntegerField()
+    # Only for days filled in the date dimension.
+    fiscal_year = models.SmallIntegerField(null=True)
+    fiscal_period = models.SmallIntegerField(null=True)
     is_client = models.BooleanField(default=False)
     is_anonymous = models.BooleanField(default=False)
     grouping_constant = models.SmallIntegerField()  # Is always 1.
@@ -52,8 +91,111 @@ class SearchSyringeCollection(models.Model):
     town = models.ForeignKey(Town, related_name='+', on_delete=DO_NOTHING)
     performed_on = models.DateField()
     month = models.SmallIntegerField()
+    quarter = models.SmallIntegerField()
+    week = models.SmallIntegerField()
     year = models.SmallIntegerField()
+    week_year = models.SmallIntegerField()
+    # Only for days filled in the date dimension.
+    fiscal_year = models.SmallIntegerField(null=True)
+    fiscal_period = models.SmallIntegerField(null=True)
     grouping_constant = models.SmallIntegerField()  # Is always 1.
 
     class Meta:
         managed = False
+
+
+class PregeneratedReport(models.Model):
+    """
+    A report output rendered in advance for a closed period, served instead
+    of computing the report when the parameters match. See
+    ``boris.reporting.pregenerated``.
+    """
+    report = models.CharField(max_length=100)
+    parameters = models.CharField(max_length=255)
+    display_type = models.CharField(max_length=10)
+    content_type = models.CharField(max_length=100)
+    disposition = models.CharField(max_length=255, blank=True)
+    content = models.BinaryField()
+    created = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('report', 'parameters', 'display_type'),)
+
+    def __unicode__(self):
+        return u'%s (%s, %s)' % (self.report, self.parameters, self.display_type)
+
+
+class FrozenPeriodManager(models.Manager):
+    # Cached for all processes sharing the cache, other processes with local
+    # caches see changes of frozen periods after the timeout.
+    cache_key = 'boris.reporting.frozen_periods'
+    cache_timeout = 60
+
+    def periods(self):
+        """Returns a set of (year, month) of frozen periods, month is None for years."""
+        periods = cache.get(self.cache_key)
+        if periods is None:
+            periods = set(self.values_list('year', 'month'))
+            cache.set(self.cache_key, periods, self.cache_timeout)
+        return periods
+
+    def is_frozen(self, day):
+        """Returns True if ``day`` lies in a frozen period."""
+        if day is None:
+            return False
+        periods = self.periods()
+        return (day.year, None) in periods or (day.year, day.month) in periods
+
+    def clear_cache(self, **kwargs):
+        cache.delete(self.cache_key)
+
+
+class FrozenPeriod(models.Model):
+    """
+    A closed month or year. The report aggregations of the period are
+    stored when it's frozen and reused by the reports, encounters and
+    syringe collections in the period can't be changed. See
+    ``boris.reporting.frozen``.
+    """
+    year = models.SmallIntegerField(verbose_name=_(u'Rok'))
+    month = models.SmallIntegerField(null=True, blank=True, verbose_name=_(u'Měsíc'),
+        choices=[(m, m) for m in xrange(1, 13)], help_text=_(u'Prázdný pro celý rok.'))
+    frozen_on = models.DateTimeField(auto_now=True, verbose_name=_(u'Uzavřeno'))
+    frozen_by = models.ForeignKey('auth.User', null=True, blank=True, editable=False,
+        on_delete=models.SET_NULL, verbose_name=_(u'Uzavřel'))
+    # Results of the service report for the whole period, see ``frozen.freeze``.
+    service_stats = models.TextField(blank=True, editable=False)
+
+    objects = FrozenPeriodManager()
+
+    class Meta:
+        unique_together = (('year', 'month'),)
+        ordering = ('-year', '-month')
+        verbose_name = _(u'Uzavřené období')
+        verbose_name_plural = _(u'Uzavřená období')
+
+    def clean(self):
+        # Unique together doesn't check the years, their month is NULL.
+        if FrozenPeriod.objects.filter(year=self.year, month=self.month).exclude(pk=self.pk).exists():
+            raise ValidationError(_(u'Období je již uzavřené.'))
+
+    def __unicode__(self):
+        if self.month:
+            return u'%s/%s' % (self.month, self.year)
+        return unicode(self.year)
+
+
+class FrozenValue(models.Model):
+    """A value of an aggregation for one key of a grouping in a frozen period."""
+    period = models.ForeignKey(FrozenPeriod, related_name='values')
+    aggregation = models.CharField(max_length=100)
+    grouping = models.CharField(max_length=100)
+    key = models.CharField(max_length=100)
+    value = models.BigIntegerField()
+
+    class Meta:
+        index_together = (('period', 'aggregation', 'grouping'),)
+
+
+signals.post_save.connect(FrozenPeriod.objects.clear_cache, sender=FrozenPeriod)
+signals.post_delete.connect(FrozenPeriod.objects.clear_cache, sender=FrozenPeriod)
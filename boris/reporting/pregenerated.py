@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Reports pregenerated for closed periods.
+
+At every month and year close the same standard reports are requested by
+everybody at once. The ``pregenerate_reports`` command computes them for a
+closed period off-hours and stores their outputs in all the display types
+(the CSV and XLSX outputs being the data tables). The reporting interface
+serves a stored output when the form parameters match it and recomputes it
+on request.
+
+Only outputs of periods that are frozen (see ``boris.reporting.frozen``)
+are served, the data of other periods may have changed since. Freezing a
+period again discards its outputs, they are pregenerated anew afterwards.
+
+Parameters are matched by their canonical form, see ``parameters_key``.
+"""
+import operator
+from datetime import date
+
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Q
+from django.http import HttpRequest, HttpResponse
+from django.utils.encoding import force_text
+
+from boris.reporting.core import STREAMED_OUTPUTS
+from boris.reporting.forms import OUTPUT_TYPES
+from boris.reporting.frozen import period_dates
+from boris.reporting.models import FrozenPeriod, PregeneratedReport
+from boris.reporting.reports.council import GovCouncilReport
+from boris.reporting.reports.monthly_stats import MonthlyStatsByTown, MonthlyStatsByDistrict
+from boris.reporting.reports.services import ServiceReport
+from boris.reporting.reports.yearly_stats import YearlyStatsByMonth, YearlyStatsByTown, \
+    YearlyStatsByDistrict
+
+
+# Reports of a whole year, pregenerated for closed years.
+YEAR_REPORTS = (MonthlyStatsByTown, MonthlyStatsByDistrict, YearlyStatsByTown,
+                YearlyStatsByDistrict, YearlyStatsByMonth)
+# Reports of a date range, pregenerated for closed months and years.
+PERIOD_REPORTS = (ServiceReport, GovCouncilReport)
+REPORTS = YEAR_REPORTS + PERIOD_REPORTS
+
+GOV_COUNCIL_KINDS = ('1', '2')
+
+
+def _param_value(value):
+    if hasattr(value, 'pk'):
+        return force_text(value.pk)
+    if hasattr(value, '__iter__'):
+        return u','.join(sorted(_param_value(v) for v in value)) or None
+    if isinstance(value, date):
+        return value.isoformat()
+    return force_text(value) if value not in (None, '') else None
+
+
+def parameters_key(parameters):
+    """
+    Returns the canonical form of report ``parameters`` (form cleaned data
+    without the display type). Models are represented by their keys, empty
+    values (e.g. no towns selected) are left out.
+    """
+    items = ((name, _param_value(value)) for name, value in parameters.items())
+    return u'&'.join(u'%s=%s' % item for item in sorted(items) if item[1] is not None)
+
+
+def period_reports(year, month=None):
+    """Returns [(report class, parameters)] of the standard reports of a period."""
+    date_from, date_to = period_dates(year, month)
+    reports = []
+    if month is None:
+        reports.extend((report_class, {'year': year}) for report_class in YEAR_REPORTS)
+    reports.append((ServiceReport, {'date_from': date_from, 'date_to': date_to,
+                                    'towns': [], 'person': None}))
+    reports.extend((GovCouncilReport, {'date_from': date_from, 'date_to': date_to,
+                                       'kind': kind, 'towns': []})
+                   for kind in GOV_COUNCIL_KINDS)
+    return reports
+
+
+def is_frozen(parameters):
+    """Returns True if all the days of the report ``parameters`` lie in frozen periods."""
+    if 'year' in parameters:
+        date_from, date_to = period_dates(parameters['year'])
+    else:
+        date_from, date_to = parameters.get('date_from'), parameters.get('date_to')
+    if date_from is None or date_to is None:
+        return False
+    periods = FrozenPeriod.objects.periods()
+    year, month = date_from.year, date_from.month
+    while (year, month) <= (date_to.year, date_to.month):
+        if (year, None) not in periods and (year, month) not in periods:
+            return False
+        year, month = year + month // 12, month % 12 + 1
+    return True
+
+
+def _render_request():
+    # Reports are rendered outside of a request for whoever asks later.
+    request = HttpRequest()
+    request.user = AnonymousUser()
+    return request
+
+
+def render_output(report, display_type):
+    """Returns the output of ``report`` in ``display_type`` as bytes."""
+    if display_type in STREAMED_OUTPUTS and not report.browser_only:
+        return ''.join(report.stream(display_type))
+    return report.render(_render_request(), display_type).encode('utf-8')
+
+
+def pregenerate(report_class, parameters):
+    """
+    Computes the report once and stores its outputs in all the display
+    types, returns them as {display type: PregeneratedReport}.
+    """
+    report = report_class(**parameters)
+    key = parameters_key(parameters)
+    outputs = {}
+    for display_type, _title in OUTPUT_TYPES:
+        disposition = report.response_headers(display_type).get('Content-Disposition', '')
+        outputs[display_type], _created = PregeneratedReport.objects.update_or_create(
+            report=report_class.__name__, parameters=key, display_type=display_type,
+            defaults={
+                'content_type': report.contenttype(display_type),
+                'disposition': disposition,
+                'content': render_output(report, display_type),
+            })
+    return outputs
+
+
+def pregenerate_period(year, month=None):
+    """Pregenerates the standard reports of a period, returns their count."""
+    reports = period_reports(year, month)
+    for report_class, parameters in reports:
+        pregenerate(report_class, parameters)
+    return len(reports)
+
+
+def discard_period(year, month=None):
+    """Deletes the stored outputs of a period, of a year including its months."""
+    months = [month] if month is not None else [None] + range(1, 13)
+    reports = [report for m in months for report in period_reports(year, m)]
+    PregeneratedReport.objects.filter(reduce(operator.or_, [
+        Q(report=report_class.__name__, parameters=parameters_key(parameters))
+        for report_class, parameters in reports])).delete()
+
+
+def find(report_class, display_type, parameters):
+    """Returns the stored output for the parameters of a frozen period or None."""
+    if report_class not in REPORTS or not is_frozen(parameters):
+        return None
+    try:
+        return PregeneratedReport.objects.get(report=report_class.__name__,
+                                              parameters=parameters_key(parameters),
+                                              display_type=display_type)
+    except PregeneratedReport.DoesNotExist:
+        return None
+
+
+def output_response(output):
+    response = HttpResponse(content=bytes(output.content), content_type=output.content_type)
+    if output.disposition:
+        response['Content-Disposition'] = output.disposition
+    return response
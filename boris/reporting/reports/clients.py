@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-from django.contrib.contenttypes.models import ContentType
 from django.template import loader
 from django.template.context import RequestContext
 from django.utils.translation import ugettext_lazy as _
@@ -7,7 +6,9 @@ from django.utils.translation import ugettext_lazy as _
 from boris.classification import DRUG_APPLICATION_TYPES as DAT
 from boris.clients.models import Client
 from boris.reporting.core import BaseReport
+from boris.reporting.tabular import Table, render_html
 from boris.services.models import Encounter
+from boris.utils.contenttypes import content_types
 
 
 def enrich_with_type(client):
@@ -31,8 +32,7 @@ class ClientReport(BaseReport):
         _(u'Typ klienta'), _(u'Primární droga'))
 
     def __init__(self, date_from=None, date_to=None, towns=None):
-        client_contenttype = ContentType.objects.get_by_natural_key('clients',
-            'Client')
+        client_contenttype = content_types.get_id(Client)
         filtering = (
             ('performed_on__gte', date_from),
             ('performed_on__lte', date_to),
@@ -49,13 +49,16 @@ class ClientReport(BaseReport):
         return 'souhrn_klientu.xls'
 
     def get_stats(self):
+        if hasattr(self, '_stats'):
+            return self._stats
         person_ids = Encounter.objects.filter(**self.filtering).values_list(
             'person', flat=True) # distinct() cannot be used here because
                                  # Encounters are ordered by default.
         clients = Client.objects.filter(person_ptr__in=person_ids).order_by(
-            'code')
+            'code').select_related('town')
         for client in clients:
             enrich_with_type(client)
+        self._stats = clients
         return clients
 
     @staticmethod
@@ -76,6 +79,20 @@ class ClientReport(BaseReport):
                 'date_from': self.date_from,
                 'date_to': self.date_to,
                 'average_age': self.get_average_age(client_stats),
+                'tables': render_html(self.get_tables()),
             },
             context_instance=RequestContext(request)
         )
+
+    def get_tables(self):
+        rows = []
+        for client in self.get_stats():
+            rows.append([
+                client.code,
+                client.get_sex_display(),
+                client.age or None,
+                client.town.title,
+                unicode(client.type_),
+                client.get_primary_drug_display() if client.primary_drug else u'Neuvedeno',
+            ])
+        return [Table(self.title, self.columns, rows)]
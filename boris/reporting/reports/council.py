@@ -12,6 +12,7 @@ from boris.classification import (DISEASES, DRUGS, DRUG_APPLICATION_TYPES,
     SEXES)
 from boris.clients.models import Client, Anonymous
 from boris.reporting.core import BaseReport
+from boris.reporting.tabular import Table, render_html
 from boris.services.models import (Encounter, Address, ContactWork,
                                    IncomeFormFillup, IndividualCounselling, CrisisIntervention, SocialWork,
                                    HarmReduction, BasicMedicalTreatment, InformationService,
@@ -397,7 +398,7 @@ class GovCouncilReport(BaseReport):
         return loader.render_to_string(
             self.get_template(display_type),
             {
-                'rows': self.get_data(),
+                'tables': render_html(self.get_tables()),
                 'date_from': self.datetime_from,
                 'date_to': self.datetime_to,
                 'report_kind': self.kind,
@@ -405,3 +406,9 @@ class GovCouncilReport(BaseReport):
             },
             context_instance=RequestContext(request)
         )
+
+    def get_tables(self):
+        header = None
+        if self.kind == 'services':
+            header = [u'Výkon', u'Počet osob, kterým byl výkon poskytnut', u'Počet výkonů']
+        return [Table(self.title, header, self.get_data())]
@@ -5,7 +5,7 @@ from django.template import loader
 from django.template.context import RequestContext
 
 from boris.classification import SEXES
-from boris.clients.models import Anamnesis, RiskyManners, Town
+from boris.clients.models import Anamnesis, Town
 from boris.reporting.core import BaseReport
 from boris.services.models import Encounter, IncomeExamination, Service
 from boris import classification
@@ -62,42 +62,49 @@ class HygieneReport(BaseReport):
             encounter_data[e.person_id]['objects'].append(e)
 
         # Finally, select these clients if they have anamnesis filled up.
-        _a = Anamnesis.objects.filter(client__pk__in=encounter_data.keys()).select_related()
+        _a = Anamnesis.load_related_data(
+            Anamnesis.objects.filter(client__pk__in=encounter_data.keys()).select_related())
         _all = []
 
+        # Clients with an income examination within selected encounters.
+        examined = set(Service.objects.filter(
+            encounter__in=[e.pk for d in encounter_data.values() for e in d['objects']],
+            content_type=IncomeExamination.real_content_type()
+        ).order_by().values_list('encounter__person', flat=True))
+
         # Annotate extra information needed in report.
         for a in _a:
             # Date of first encounter with client.
             a.extra_first_encounter_date = encounter_data[a.client_id]['first_encounter_date']
             # If has been cured before - True if there is not IncomeExamination
             # within selected encounters.
-            a.extra_been_cured_before = not Service.objects.filter(encounter__in=encounter_data[a.client_id]['objects'],
-                                                                   content_type=IncomeExamination.real_content_type()).exists()
+            a.extra_been_cured_before = a.client_id not in examined
             # When showing 'incidency', only those, who have not been cured before
             # should be returned.
             if self.kind == 'incidence' and a.extra_been_cured_before is True:
                 continue
 
             # Information about risky behaviour and it's periodicity.
-            try:
-                ivrm = a.riskymanners_set.get(behavior=classification.RISKY_BEHAVIOR_KIND.INTRAVENOUS_APPLICATION)
-
-                if (ivrm.periodicity_in_present, ivrm.periodicity_in_past) == (p.NEVER, p.NEVER):
-                    a.extra_intravenous_application = 'c'
-                elif ivrm.periodicity_in_present in (p.ONCE, p.OFTEN):
-                    a.extra_intravenous_application = 'b'
-                elif ivrm.periodicity_in_present == p.NEVER and ivrm.periodicity_in_past in (p.ONCE, p.OFTEN):
-                    a.extra_intravenous_application = 'a'
-                else:
-                    a.extra_intravenous_application = 'd'
-            except RiskyManners.DoesNotExist:
+            ivrm = a.risky_manner(classification.RISKY_BEHAVIOR_KIND.INTRAVENOUS_APPLICATION)
+
+            if ivrm is None:
+                a.extra_intravenous_application = 'd'
+            elif (ivrm.periodicity_in_present, ivrm.periodicity_in_past) == (p.NEVER, p.NEVER):
+                a.extra_intravenous_application = 'c'
+            elif ivrm.periodicity_in_present in (p.ONCE, p.OFTEN):
+                a.extra_intravenous_application = 'b'
+            elif ivrm.periodicity_in_present == p.NEVER and ivrm.periodicity_in_past in (p.ONCE, p.OFTEN):
+                a.extra_intravenous_application = 'a'
+            else:
                 a.extra_intravenous_application = 'd'
 
             # Information about syringe sharing activity.
             if a.extra_intravenous_application in ('a', 'b'):
-                try:
-                    ssrm = a.riskymanners_set.get(behavior=classification.RISKY_BEHAVIOR_KIND.SYRINGE_SHARING)
+                ssrm = a.risky_manner(classification.RISKY_BEHAVIOR_KIND.SYRINGE_SHARING)
 
+                if ssrm is None:
+                    a.extra_syringe_sharing = 'unknown'
+                else:
                     # Use current periodicity in past/current according to
                     # `extra_intravenous_application`
                     per = (ssrm.periodicity_in_present
@@ -110,8 +117,6 @@ class HygieneReport(BaseReport):
                         a.extra_syringe_sharing = 'no'
                     else:
                         a.extra_syringe_sharing = 'unknown'
-                except RiskyManners.DoesNotExist:
-                    a.extra_syringe_sharing = 'unknown'
 
             _all.append(a)
 
@@ -4,6 +4,7 @@ Created on 27.11.2011
 
 @author: xaralis
 '''
+
 from django.db.models import Q
 from django.utils.translation import ugettext as _
 
@@ -12,7 +13,19 @@ from boris.classification import SEXES, ANONYMOUS_TYPES, DISEASES, \
 from boris.clients.models import Town, District
 from boris.reporting.core import Aggregation, Report, \
     SumAggregation, make_key, NonDistinctCountAggregation
+from boris.reporting.frozen import StoredValues, period_dates
 from boris.reporting.models import SearchEncounter, SearchService, SearchSyringeCollection
+from boris.reporting.tabular import Table
+
+
+def stats_table(title, corner, columns, data):
+    """
+    Returns a table for ``data`` as returned by ``get_data`` of the stats
+    reports: ``(aggregation title, values)`` pairs, one value per column
+    plus the total.
+    """
+    header = [corner] + list(columns) + [u'Celkem']
+    return Table(title, header, [[aggr_title] + values for aggr_title, values in data])
 
 
 class EncounterAggregation(Aggregation):
@@ -201,6 +214,20 @@ class ClientReportBase(Report):
         IssuedSyringes
     ]
 
+    def get_period(self):
+        """Returns the first and the last day of the report or (None, None)."""
+        return None, None
+
+    # ``StoredValues`` of the report, reports computed together can share
+    # one (see ``boris.reporting.batch``).
+    stored_values = None
+
+    def get_values(self, aggregation, grouping):
+        # Values of frozen periods are stored, see ``boris.reporting.frozen``.
+        if self.stored_values is None:
+            self.stored_values = StoredValues(*self.get_period())
+        return self.stored_values.get(aggregation, grouping)
+
 
 class MonthlyStatsByTown(ClientReportBase):
     title = _(u'Měsíční')
@@ -220,9 +247,17 @@ class MonthlyStatsByTown(ClientReportBase):
 
     def __init__(self, year, *args, **kwargs):
         self.year = year
-        self.additional_filtering = {'year': year}
+        date_from, date_to = period_dates(year)
+        # A date range can use the index on performed_on, unlike the year.
+        self.additional_filtering = {
+            'performed_on__gte': date_from,
+            'performed_on__lte': date_to,
+        }
         super(MonthlyStatsByTown, self).__init__(*args, **kwargs)
 
+    def get_period(self):
+        return period_dates(self.year)
+
     def months(self):
         return xrange(1, 13)
 
@@ -240,6 +275,13 @@ class MonthlyStatsByTown(ClientReportBase):
             ]) for month in self.months()
         ]
 
+    def get_tables(self):
+        columns = [column.title for column in self.columns]
+        return [
+            stats_table(u'%s-%s' % (month, self.year), u'%s/%s' % (month, self.year), columns, data)
+            for month, data in self.get_data()
+        ]
+
 
 class StatsByTownInPeriod(ClientReportBase):
     title = _(u'Volitelné')
@@ -250,6 +292,7 @@ class StatsByTownInPeriod(ClientReportBase):
     def __init__(self, date_from, date_to, towns, *args, **kwargs):
         self.date_from = date_from
         self.date_to = date_to
+        self.all_towns = not towns
         self.towns = towns or Town.objects.all()
         self.additional_filtering = {
             'performed_on__gte': date_from,
@@ -258,6 +301,12 @@ class StatsByTownInPeriod(ClientReportBase):
         }
         super(StatsByTownInPeriod, self).__init__(*args, **kwargs)
 
+    def get_period(self):
+        # Stored totals are of all towns.
+        if self.all_towns:
+            return self.date_from, self.date_to
+        return None, None
+
     def get_data(self):
         return [
             (aggregation.title, [
@@ -266,6 +315,10 @@ class StatsByTownInPeriod(ClientReportBase):
             ) for aggregation in self.aggregations
         ]
 
+    def get_tables(self):
+        period = u' - '.join(d.strftime('%d.%m.%Y') if d else u'' for d in (self.date_from, self.date_to))
+        return [stats_table(period, period, [town.title for town in self.towns], self.get_data())]
+
 
 class MonthlyStatsByDistrict(MonthlyStatsByTown):
     title = _(u'Okresy: měsíční')
@@ -3,7 +3,7 @@ from django.utils.translation import ugettext as _
 
 from boris.reporting.core import make_key
 
-from .monthly_stats import MonthlyStatsByTown, MonthlyStatsByDistrict
+from .monthly_stats import MonthlyStatsByTown, MonthlyStatsByDistrict, stats_table
 
 
 class YearlyStatsByTown(MonthlyStatsByTown):
@@ -24,6 +24,10 @@ class YearlyStatsByTown(MonthlyStatsByTown):
             ] + [aggregation.get_val(make_key((('year', self.year),)))]) for aggregation in self.aggregations
         ]
 
+    def get_tables(self):
+        columns = [column.title for column in self.columns]
+        return [stats_table(unicode(self.year), self.year, columns, self.get_data())]
+
 
 class YearlyStatsByDistrict(MonthlyStatsByDistrict):
     title = _(u'Okresy: roční')
@@ -43,6 +47,10 @@ class YearlyStatsByDistrict(MonthlyStatsByDistrict):
             ] + [aggregation.get_val(make_key((('year', self.year),)))]) for aggregation in self.aggregations
         ]
 
+    def get_tables(self):
+        columns = [column.title for column in self.columns]
+        return [stats_table(unicode(self.year), self.year, columns, self.get_data())]
+
 
 class YearlyStatsByMonth(MonthlyStatsByTown):
     title = _(u'Roční statistiky po měsících')
@@ -68,3 +76,6 @@ class YearlyStatsByMonth(MonthlyStatsByTown):
                 ) for month in self.columns
             ] + [self.get_sum(aggregation)]) for aggregation in self.aggregations
         ]
+
+    def get_tables(self):
+        return [stats_table(unicode(self.year), self.year, self.columns, self.get_data())]
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Pseudonymized per-client dataset for research partners.
+
+Every client becomes one JSON object with the demographic data, the income
+anamnesis with its drug usages, risky manners and disease tests and the
+numbers of encounters and services per year. Names, codes, birthdates and
+towns are left out, the client code is replaced by a keyed hash (HMAC) so
+that the same client gets the same pseudonym in repeated exports made with
+the same key, while nobody without the key can map it back.
+
+Clients are read in chunks of ``CHUNK_SIZE``; all related data of a chunk
+is fetched by a fixed number of queries, so the export streams through
+the whole database in constant memory.
+"""
+import hashlib
+import hmac
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+
+from boris.clients.models import Anamnesis, Client
+from boris.reporting.models import SearchEncounter, SearchService
+
+
+CHUNK_SIZE = 500
+
+CLIENT_FIELDS = ('sex', 'primary_drug', 'primary_drug_usage', 'close_person', 'sex_partner')
+ANAMNESIS_FIELDS = ('nationality', 'ethnic_origin', 'living_condition', 'accomodation',
+                    'lives_with_junkies', 'employment', 'education', 'been_cured_before',
+                    'been_cured_currently')
+DRUG_USAGE_FIELDS = ('drug', 'application', 'frequency', 'first_try_age', 'first_try_iv_age',
+                     'first_try_application', 'was_first_illegal', 'is_primary')
+RISKY_MANNERS_FIELDS = ('behavior', 'periodicity_in_past', 'periodicity_in_present')
+DISEASE_TEST_FIELDS = ('disease', 'result')
+
+
+def get_key(key=None):
+    """Returns the pseudonymization key, ``key`` or the configured one."""
+    key = key or getattr(settings, 'RESEARCH_EXPORT_KEY', None)
+    if not key:
+        raise ImproperlyConfigured('Set RESEARCH_EXPORT_KEY or pass a key for the research export.')
+    return key.encode('utf-8') if isinstance(key, unicode) else key
+
+
+def pseudonym(code, key):
+    """Returns the pseudonym of the client ``code``."""
+    return hmac.new(key, code.upper().encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _values(obj, fields):
+    return dict((name, getattr(obj, name)) for name in fields)
+
+
+def _yearly_counts(model, client_ids, by_kind=False):
+    """Returns {client id: {year: count}} (or {year: {kind: count}}) from a reporting view."""
+    grouping = ('person', 'year', 'content_type_model') if by_kind else ('person', 'year')
+    counts = defaultdict(dict)
+    for row in model.objects.filter(person__in=client_ids).values(*grouping) \
+            .order_by().annotate(count=Count('id')):
+        if by_kind:
+            counts[row['person']].setdefault(row['year'], {})[row['content_type_model']] = row['count']
+        else:
+            counts[row['person']][row['year']] = row['count']
+    return counts
+
+
+def client_records(clients, key):
+    """Returns the dataset records of ``clients`` (a list of ``Client``)."""
+    ids = [c.pk for c in clients]
+    anamneses = Anamnesis.load_related_data(Anamnesis.objects.filter(client__in=ids))
+    anamneses = dict((a.client_id, a) for a in anamneses)
+    encounters = _yearly_counts(SearchEncounter, ids)
+    services = _yearly_counts(SearchService, ids, by_kind=True)
+
+    records = []
+    for client in clients:
+        record = _values(client, CLIENT_FIELDS)
+        record.update({
+            'pseudonym': pseudonym(client.code, key),
+            'birth_year': client.birthdate.year if client.birthdate else None,
+            'district': client.town.district.title,
+            'anamnesis': None,
+            'encounters': encounters.get(client.pk, {}),
+            'services': services.get(client.pk, {}),
+        })
+        a = anamneses.get(client.pk)
+        if a is not None:
+            record['anamnesis'] = dict(_values(a, ANAMNESIS_FIELDS), **{
+                'filled_year': a.filled_when.year,
+                'drug_usages': [_values(di, DRUG_USAGE_FIELDS) for di in a.drug_info],
+                'risky_manners': [_values(rm, RISKY_MANNERS_FIELDS) for _b, rm in
+                                  sorted(a.risky_manners.items())],
+                'disease_tests': [dict(_values(t, DISEASE_TEST_FIELDS),
+                                       year=t.date.year if t.date else None)
+                                  for t in sorted(a.disease_tests, key=lambda t: t.disease)],
+            })
+        records.append(record)
+    return records
+
+
+def client_chunks(queryset=None, chunk_size=CHUNK_SIZE):
+    """Yields lists of clients from ``queryset`` in pk order, ``chunk_size`` at a time."""
+    if queryset is None:
+        queryset = Client.objects.all()
+    queryset = queryset.select_related('town__district').order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        clients = list(chunk[:chunk_size])
+        if not clients:
+            return
+        last_pk = clients[-1].pk
+        yield clients
+
+
+def research_lines(key, queryset=None, chunk_size=CHUNK_SIZE):
+    """Yields the dataset as UTF-8 encoded JSON lines, one per client."""
+    key = get_key(key)
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    for clients in client_chunks(queryset, chunk_size):
+        for record in client_records(clients, key):
+            yield (encoder.encode(record) + u'\n').encode('utf-8')
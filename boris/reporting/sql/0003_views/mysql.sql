@@ -6,8 +6,10 @@ SELECT
 	services_encounter.where_id AS town_id,
 	services_encounter.is_by_phone,
 	services_encounter.performed_on as performed_on,
-	YEAR(services_encounter.performed_on) AS year,
-	MONTH(services_encounter.performed_on) AS month,
+	COALESCE(reporting_datedimension.year, YEAR(services_encounter.performed_on)) AS year,
+	COALESCE(reporting_datedimension.month, MONTH(services_encounter.performed_on)) AS month,
+	COALESCE(reporting_datedimension.quarter, QUARTER(services_encounter.performed_on)) AS quarter,
+	COALESCE(reporting_datedimension.week, WEEK(services_encounter.performed_on, 3)) AS week,
 	clients_client.person_ptr_id is NOT NULL AS is_client,
 	clients_client.sex AS client_sex,
 	clients_client.primary_drug,
@@ -18,6 +20,7 @@ SELECT
 	1 AS grouping_constant
 FROM
 	services_encounter
+	LEFT OUTER JOIN reporting_datedimension ON (services_encounter.performed_on = reporting_datedimension.date)
 	LEFT OUTER JOIN clients_client ON (services_encounter.person_id = clients_client.person_ptr_id)
 	LEFT OUTER JOIN clients_anonymous ON (services_encounter.person_id = clients_anonymous.person_ptr_id)
 );
@@ -32,14 +35,17 @@ SELECT
 	services_encounter.where_id AS town_id,
 	services_encounter.person_id AS person_id,
   services_encounter.performed_on as performed_on,
-	YEAR(services_encounter.performed_on) AS year,
-	MONTH(services_encounter.performed_on) AS month,
+	COALESCE(reporting_datedimension.year, YEAR(services_encounter.performed_on)) AS year,
+	COALESCE(reporting_datedimension.month, MONTH(services_encounter.performed_on)) AS month,
+	COALESCE(reporting_datedimension.quarter, QUARTER(services_encounter.performed_on)) AS quarter,
+	COALESCE(reporting_datedimension.week, WEEK(services_encounter.performed_on, 3)) AS week,
 	clients_client.person_ptr_id is NOT NULL AS is_client,
 	clients_anonymous.person_ptr_id IS NOT NULL AS is_anonymous,
 	1 AS grouping_constant
 FROM
 	services_service
 	JOIN services_encounter ON (services_service.encounter_id = services_encounter.id)
+	LEFT OUTER JOIN reporting_datedimension ON (services_encounter.performed_on = reporting_datedimension.date)
 	JOIN django_content_type ON (services_service.content_type_id = django_content_type.id)
 	LEFT OUTER JOIN clients_client ON (services_encounter.person_id = clients_client.person_ptr_id)
 	LEFT OUTER JOIN clients_anonymous ON (services_encounter.person_id = clients_anonymous.person_ptr_id)
@@ -49,13 +55,16 @@ FROM
 CREATE OR REPLACE VIEW reporting_searchsyringecollection AS
 (
 SELECT
-	id as id,
+	syringes_syringecollection.id as id,
 	count as count,
 	town_id,
-	date as performed_on,
-	MONTH(`date`) AS month,
-	YEAR(`date`) AS year,
+	syringes_syringecollection.date as performed_on,
+	COALESCE(reporting_datedimension.month, MONTH(syringes_syringecollection.date)) AS month,
+	COALESCE(reporting_datedimension.quarter, QUARTER(syringes_syringecollection.date)) AS quarter,
+	COALESCE(reporting_datedimension.week, WEEK(syringes_syringecollection.date, 3)) AS week,
+	COALESCE(reporting_datedimension.year, YEAR(syringes_syringecollection.date)) AS year,
 	1 AS grouping_constant
 FROM
 	syringes_syringecollection
+	LEFT OUTER JOIN reporting_datedimension ON (syringes_syringecollection.date = reporting_datedimension.date)
 );
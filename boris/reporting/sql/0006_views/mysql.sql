@@ -0,0 +1,79 @@
+CREATE OR REPLACE VIEW reporting_searchencounter AS
+(
+SELECT
+	services_encounter.id,
+	services_encounter.person_id,
+	services_encounter.where_id AS town_id,
+	services_encounter.is_by_phone,
+	services_encounter.performed_on as performed_on,
+	COALESCE(reporting_datedimension.year, YEAR(services_encounter.performed_on)) AS year,
+	COALESCE(reporting_datedimension.month, MONTH(services_encounter.performed_on)) AS month,
+	COALESCE(reporting_datedimension.quarter, QUARTER(services_encounter.performed_on)) AS quarter,
+	COALESCE(reporting_datedimension.week, WEEK(services_encounter.performed_on, 3)) AS week,
+	COALESCE(reporting_datedimension.week_year, YEARWEEK(services_encounter.performed_on, 3) DIV 100) AS week_year,
+	reporting_datedimension.fiscal_year,
+	reporting_datedimension.fiscal_period,
+	clients_client.person_ptr_id is NOT NULL AS is_client,
+	clients_client.sex AS client_sex,
+	clients_client.primary_drug,
+	clients_client.primary_drug_usage,
+	clients_client.close_person as is_close_person,
+	clients_client.sex_partner as is_sex_partner,
+	clients_anonymous.person_ptr_id IS NOT NULL AS is_anonymous,
+	1 AS grouping_constant
+FROM
+	services_encounter
+	LEFT OUTER JOIN reporting_datedimension ON (services_encounter.performed_on = reporting_datedimension.date)
+	LEFT OUTER JOIN clients_client ON (services_encounter.person_id = clients_client.person_ptr_id)
+	LEFT OUTER JOIN clients_anonymous ON (services_encounter.person_id = clients_anonymous.person_ptr_id)
+);
+
+CREATE OR REPLACE VIEW reporting_searchservice AS
+(
+SELECT
+	services_service.id,
+	services_service.id as service_id,
+	services_encounter.id as encounter_id,
+	django_content_type.model AS content_type_model,
+	services_encounter.where_id AS town_id,
+	services_encounter.person_id AS person_id,
+  services_encounter.performed_on as performed_on,
+	COALESCE(reporting_datedimension.year, YEAR(services_encounter.performed_on)) AS year,
+	COALESCE(reporting_datedimension.month, MONTH(services_encounter.performed_on)) AS month,
+	COALESCE(reporting_datedimension.quarter, QUARTER(services_encounter.performed_on)) AS quarter,
+	COALESCE(reporting_datedimension.week, WEEK(services_encounter.performed_on, 3)) AS week,
+	COALESCE(reporting_datedimension.week_year, YEARWEEK(services_encounter.performed_on, 3) DIV 100) AS week_year,
+	reporting_datedimension.fiscal_year,
+	reporting_datedimension.fiscal_period,
+	clients_client.person_ptr_id is NOT NULL AS is_client,
+	clients_anonymous.person_ptr_id IS NOT NULL AS is_anonymous,
+	1 AS grouping_constant
+FROM
+	services_service
+	JOIN services_encounter ON (services_service.encounter_id = services_encounter.id)
+	LEFT OUTER JOIN reporting_datedimension ON (services_encounter.performed_on = reporting_datedimension.date)
+	JOIN django_content_type ON (services_service.content_type_id = django_content_type.id)
+	LEFT OUTER JOIN clients_client ON (services_encounter.person_id = clients_client.person_ptr_id)
+	LEFT OUTER JOIN clients_anonymous ON (services_encounter.person_id = clients_anonymous.person_ptr_id)
+);
+
+
+CREATE OR REPLACE VIEW reporting_searchsyringecollection AS
+(
+SELECT
+	syringes_syringecollection.id as id,
+	count as count,
+	town_id,
+	syringes_syringecollection.date as performed_on,
+	COALESCE(reporting_datedimension.month, MONTH(syringes_syringecollection.date)) AS month,
+	COALESCE(reporting_datedimension.quarter, QUARTER(syringes_syringecollection.date)) AS quarter,
+	COALESCE(reporting_datedimension.week, WEEK(syringes_syringecollection.date, 3)) AS week,
+	COALESCE(reporting_datedimension.week_year, YEARWEEK(syringes_syringecollection.date, 3) DIV 100) AS week_year,
+	reporting_datedimension.fiscal_year,
+	reporting_datedimension.fiscal_period,
+	COALESCE(reporting_datedimension.year, YEAR(syringes_syringecollection.date)) AS year,
+	1 AS grouping_constant
+FROM
+	syringes_syringecollection
+	LEFT OUTER JOIN reporting_datedimension ON (syringes_syringecollection.date = reporting_datedimension.date)
+);
@@ -0,0 +1,81 @@
+DROP VIEW IF EXISTS reporting_searchencounter;
+CREATE VIEW reporting_searchencounter AS
+(
+SELECT
+	services_encounter.id,
+	services_encounter.person_id,
+	services_encounter.where_id AS town_id,
+	services_encounter.is_by_phone,
+	services_encounter.performed_on as performed_on,
+	COALESCE(reporting_datedimension.year, CAST(EXTRACT(YEAR FROM services_encounter.performed_on) AS smallint)) AS year,
+	COALESCE(reporting_datedimension.month, CAST(EXTRACT(MONTH FROM services_encounter.performed_on) AS smallint)) AS month,
+	COALESCE(reporting_datedimension.quarter, CAST(EXTRACT(QUARTER FROM services_encounter.performed_on) AS smallint)) AS quarter,
+	COALESCE(reporting_datedimension.week, CAST(EXTRACT(WEEK FROM services_encounter.performed_on) AS smallint)) AS week,
+	COALESCE(reporting_datedimension.week_year, CAST(EXTRACT(ISOYEAR FROM services_encounter.performed_on) AS smallint)) AS week_year,
+	reporting_datedimension.fiscal_year,
+	reporting_datedimension.fiscal_period,
+	clients_client.person_ptr_id IS NOT NULL AS is_client,
+	clients_client.sex AS client_sex,
+	clients_client.primary_drug,
+	clients_client.primary_drug_usage,
+	clients_client.close_person as is_close_person,
+	clients_client.sex_partner as is_sex_partner,
+	clients_anonymous.person_ptr_id IS NOT NULL AS is_anonymous,
+	1 AS grouping_constant
+FROM
+	services_encounter
+	LEFT OUTER JOIN reporting_datedimension ON (services_encounter.performed_on = reporting_datedimension.date)
+	LEFT OUTER JOIN clients_client ON (services_encounter.person_id = clients_client.person_ptr_id)
+	LEFT OUTER JOIN clients_anonymous ON (services_encounter.person_id = clients_anonymous.person_ptr_id)
+);
+
+DROP VIEW IF EXISTS reporting_searchservice;
+CREATE VIEW reporting_searchservice AS
+(
+SELECT
+	services_service.id,
+	services_service.id as service_id,
+	services_encounter.id as encounter_id,
+	django_content_type.model AS content_type_model,
+	services_encounter.where_id AS town_id,
+	services_encounter.person_id AS person_id,
+	services_encounter.performed_on as performed_on,
+	COALESCE(reporting_datedimension.year, CAST(EXTRACT(YEAR FROM services_encounter.performed_on) AS smallint)) AS year,
+	COALESCE(reporting_datedimension.month, CAST(EXTRACT(MONTH FROM services_encounter.performed_on) AS smallint)) AS month,
+	COALESCE(reporting_datedimension.quarter, CAST(EXTRACT(QUARTER FROM services_encounter.performed_on) AS smallint)) AS quarter,
+	COALESCE(reporting_datedimension.week, CAST(EXTRACT(WEEK FROM services_encounter.performed_on) AS smallint)) AS week,
+	COALESCE(reporting_datedimension.week_year, CAST(EXTRACT(ISOYEAR FROM services_encounter.performed_on) AS smallint)) AS week_year,
+	reporting_datedimension.fiscal_year,
+	reporting_datedimension.fiscal_period,
+	clients_client.person_ptr_id IS NOT NULL AS is_client,
+	clients_anonymous.person_ptr_id IS NOT NULL AS is_anonymous,
+	1 AS grouping_constant
+FROM
+	services_service
+	JOIN services_encounter ON (services_service.encounter_id = services_encounter.id)
+	LEFT OUTER JOIN reporting_datedimension ON (services_encounter.performed_on = reporting_datedimension.date)
+	JOIN django_content_type ON (services_service.content_type_id = django_content_type.id)
+	LEFT OUTER JOIN clients_client ON (services_encounter.person_id = clients_client.person_ptr_id)
+	LEFT OUTER JOIN clients_anonymous ON (services_encounter.person_id = clients_anonymous.person_ptr_id)
+);
+
+DROP VIEW IF EXISTS reporting_searchsyringecollection;
+CREATE VIEW reporting_searchsyringecollection AS
+(
+SELECT
+	syringes_syringecollection.id as id,
+	syringes_syringecollection.count as count,
+	syringes_syringecollection.town_id,
+	syringes_syringecollection.date as performed_on,
+	COALESCE(reporting_datedimension.month, CAST(EXTRACT(MONTH FROM syringes_syringecollection.date) AS smallint)) AS month,
+	COALESCE(reporting_datedimension.quarter, CAST(EXTRACT(QUARTER FROM syringes_syringecollection.date) AS smallint)) AS quarter,
+	COALESCE(reporting_datedimension.week, CAST(EXTRACT(WEEK FROM syringes_syringecollection.date) AS smallint)) AS week,
+	COALESCE(reporting_datedimension.week_year, CAST(EXTRACT(ISOYEAR FROM syringes_syringecollection.date) AS smallint)) AS week_year,
+	reporting_datedimension.fiscal_year,
+	reporting_datedimension.fiscal_period,
+	COALESCE(reporting_datedimension.year, CAST(EXTRACT(YEAR FROM syringes_syringecollection.date) AS smallint)) AS year,
+	1 AS grouping_constant
+FROM
+	syringes_syringecollection
+	LEFT OUTER JOIN reporting_datedimension ON (syringes_syringecollection.date = reporting_datedimension.date)
+);
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Writers for tabular reports.
+
+A tabular report describes its output as a list of ``Table`` objects:
+a title, the header cells and the data rows with typed cell values. The
+writers below turn the tables into the output formats directly, so the
+template engine only renders the page around the tables instead of
+every single cell.
+"""
+import csv
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
+
+from boris.utils import xlsx
+
+
+Table = namedtuple('Table', ('title', 'header', 'rows'))
+
+
+def format_cell(value):
+    """Returns the text of a cell as displayed in HTML and CSV outputs."""
+    if value is None:
+        return u''
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return unicode(value)
+    if isinstance(value, datetime):
+        return value.strftime('%d.%m.%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d.%m.%Y')
+    return force_text(value)
+
+
+def _html_cells(tag, values):
+    start, end = u'<%s>' % tag, u'</%s>' % tag
+    return u''.join(start + escape(format_cell(value)) + end for value in values)
+
+
+def html_chunks(tables):
+    """Yields the HTML of ``tables``, one chunk per table row."""
+    for table in tables:
+        yield u'<table cellpadding="50" cellspacing="0" border="1">\n<tbody>\n'
+        if table.header:
+            yield u'<tr>%s</tr>\n' % _html_cells('th', table.header)
+        for row in table.rows:
+            yield u'<tr>%s</tr>\n' % _html_cells('td', row)
+        yield u'</tbody>\n</table>\n<br />\n'
+
+
+def render_html(tables):
+    """Returns the HTML of ``tables``, safe for including in templates."""
+    return mark_safe(u''.join(html_chunks(tables)))
+
+
+class Echo(object):
+    """
+    File-like object returning what's written, lets ``csv.writer`` produce
+    the lines one by one.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_chunks(tables):
+    """Yields ``tables`` as UTF-8 encoded CSV lines, separated by an empty line."""
+    writer = csv.writer(Echo())
+    for i, table in enumerate(tables):
+        if i:
+            yield '\r\n'
+        rows = chain([table.header], table.rows) if table.header else table.rows
+        for row in rows:
+            yield writer.writerow([format_cell(value).encode('utf-8') for value in row])
+
+
+def sheets(tables):
+    """Returns ``tables`` as spreadsheets for ``xlsx.stream_xlsx``."""
+    return ((table.title, chain([table.header], table.rows) if table.header else table.rows)
+            for table in tables)
+
+
+def xlsx_chunks(tables):
+    return xlsx.stream_xlsx(sheets(tables))
@@ -1,11 +1,25 @@
 # -*- coding: utf-8 -*-
+import tempfile
+from wsgiref.util import FileWrapper
+
+import anyjson
+
 from django import forms
-from django.contrib import admin
+from django.conf.urls import patterns, url
+from django.contrib import admin, messages
 from django.contrib.admin.utils import flatten_fieldsets
-from django.http import HttpResponseRedirect
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import reverse
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponse, HttpResponseRedirect, Http404, StreamingHttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext_lazy as _
 
+from boris.services.export import export_response, FORMAT_CSV, FORMAT_JSONL
+from boris.services.importer import ImportFileError, KIND_CLIENTS, KIND_ENCOUNTERS, import_records
 from boris.services.models.core import Encounter
 from boris.clients.forms import ReadOnlyWidget
 from boris.clients.models import Person
@@ -16,10 +30,42 @@ def service_list(self, obj):
     return u'<br />'.join([u'<small>%s</small>' % unicode(s) for s in obj.services.all()])
 service_list.short_description = _(u'Provedené výkony')
 service_list.allow_tags = True
+service_list.prefetch_related = 'services'
+
+
+def inline_encounters(queryset):
+    """Orders ``queryset`` and batch-loads everything the encounter inline shows."""
+    return queryset.select_related('person', 'where') \
+        .prefetch_related('services', 'performed_by') \
+        .order_by('-performed_on', '-pk')
+
+
+class EncounterInlineFormSet(BaseInlineFormSet):
+    """
+    Contains only the latest ``per_page`` encounters. Older ones are
+    loaded on demand by ``EncounterAdmin.inline_page_view``.
+    """
+    per_page = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            encounters = list(super(EncounterInlineFormSet, self).get_queryset()[:self.per_page + 1])
+            self.has_more = len(encounters) > self.per_page
+            self._queryset = encounters[:self.per_page]
+        return self._queryset
+
+    def add_fields(self, form, index):
+        super(EncounterInlineFormSet, self).add_fields(form, index)
+        # Share town choices among the forms instead of querying them per row.
+        if 'where' in form.fields:
+            if not hasattr(self, '_where_choices'):
+                self._where_choices = list(form.fields['where'].choices)
+            form.fields['where'].choices = self._where_choices
 
 
 class EncounterInline(admin.TabularInline):
     model = Encounter
+    formset = EncounterInlineFormSet
     classes = ('grp-collapse', 'grp-closed',)
     fieldsets = (
         (None, {
@@ -35,6 +81,9 @@ class EncounterInline(admin.TabularInline):
     def has_add_permission(self, request, *args, **kwargs):
         return False
 
+    def get_queryset(self, request):
+        return inline_encounters(super(EncounterInline, self).get_queryset(request))
+
     def performed_by_verbose(self, obj):
         return u', '.join([unicode(u) for u in obj.performed_by.all()])
     performed_by_verbose.short_description = _(u'Provedli')
@@ -50,10 +99,27 @@ class EncounterInline(admin.TabularInline):
 EncounterInline.service_list = service_list
 
 
+class RecordImportForm(forms.Form):
+    kind = forms.ChoiceField(label=_(u'Obsah souboru'), choices=(
+        (KIND_CLIENTS, _(u'Klienti')),
+        (KIND_ENCOUNTERS, _(u'Kontakty a výkony')),
+    ))
+    file = forms.FileField(label=_(u'CSV soubor'))
+    delimiter = forms.ChoiceField(label=_(u'Oddělovač'), choices=((',', ','), (';', ';')))
+
+
+# Permissions needed for importing the kinds of records.
+IMPORT_PERMISSIONS = {
+    KIND_CLIENTS: 'clients.add_client',
+    KIND_ENCOUNTERS: 'services.add_encounter',
+}
+
+
 class EncounterAdmin(BorisBaseAdmin):
     list_display = ('person_link', 'performed_on', 'where', 'is_by_phone',
         'service_list')
     list_display_links = None
+    list_select_related = ('person', 'where')
     list_filter = ('performed_on', 'where', 'is_by_phone')
     search_fields = ('person__title', 'where__title',
         'performed_by__username', 'performed_by__first_name',
@@ -64,17 +130,31 @@ class EncounterAdmin(BorisBaseAdmin):
     )
     raw_id_fields = ('where', 'person')
     date_hierarchy = 'performed_on'
+    actions = ('export_csv', 'export_jsonl')
+    list_count_mode = 'estimate'
+    list_keyset_pagination = True
     autocomplete_lookup_fields = {
         'fk': ['where', 'person']
     }
 
     def person_link(self, obj):
         """Redefined "person" pointing to the person's page."""
-        person = obj.person.cast()
-        return u'<a href="%s">%s</a>' % (person.get_admin_url(), person)
+        person = obj.person
+        content_type = ContentType.objects.get_for_id(person.content_type_id)
+        url = reverse('admin:%s_%s_change' % (content_type.app_label, content_type.model),
+                      args=(person.pk,))
+        return u'<a href="%s">%s</a>' % (url, person)
     person_link.allow_tags = True
     person_link.short_description = _('Osoba')
 
+    def export_csv(self, request, queryset):
+        return export_response(queryset, FORMAT_CSV)
+    export_csv.short_description = _(u'Exportovat kontakty a výkony (CSV)')
+
+    def export_jsonl(self, request, queryset):
+        return export_response(queryset, FORMAT_JSONL)
+    export_jsonl.short_description = _(u'Exportovat kontakty a výkony (JSON lines)')
+
     def _prepare_for_prefilling(self, request, obj):
         """Enable field pre-filling based on existing records."""
         if "_addanother" in request.POST:
@@ -98,6 +178,79 @@ class EncounterAdmin(BorisBaseAdmin):
         return super(EncounterAdmin, self).response_add(request, obj,
             post_url_continue % obj.id)
 
+    def get_urls(self):
+        urls = super(EncounterAdmin, self).get_urls()
+        my_urls = patterns('',
+            url(r'^inline-page/(?P<person_id>\d+)/$',
+                self.admin_site.admin_view(self.inline_page_view),
+                name='services_encounter_inline_page'
+            ),
+            url(r'^import/$', self.admin_site.admin_view(self.import_view),
+                name='services_encounter_import'
+            ),
+        )
+        return my_urls + urls
+
+    def inline_page_view(self, request, person_id):
+        """
+        An ajax view returning a page of older encounters for the encounter
+        inline of the person's change form.
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            page = int(request.GET.get('page', 2))
+        except ValueError:
+            raise Http404
+        if page < 2:
+            raise Http404
+
+        per_page = EncounterInlineFormSet.per_page
+        offset = (page - 1) * per_page
+        encounters = list(inline_encounters(Encounter.objects.filter(person=person_id))
+            [offset:offset + per_page + 1])
+        next_url = None
+        if len(encounters) > per_page:
+            next_url = '%s?page=%s' % (reverse('admin:services_encounter_inline_page',
+                args=(person_id,)), page + 1)
+        content = render_to_string('admin/services/encounter/encounter_inline_rows.html',
+            {'encounters': encounters[:per_page]})
+        return HttpResponse(anyjson.dumps({'content': content, 'next': next_url}),
+            content_type='application/json')
+
+    def import_view(self, request):
+        """
+        Imports clients or encounters from an uploaded CSV file. Rejected
+        rows are sent back as a CSV file with the errors.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = RecordImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            kind = form.cleaned_data['kind']
+            if not request.user.has_perm(IMPORT_PERMISSIONS[kind]):
+                raise PermissionDenied
+            rejects = tempfile.TemporaryFile()
+            try:
+                result = import_records(form.cleaned_data['file'], kind, rejects,
+                    delimiter=str(form.cleaned_data['delimiter']), user=request.user)
+            except ImportFileError as e:
+                form.add_error('file', unicode(e))
+            else:
+                message = _(u'Naimportováno záznamů: %(records)d, výkonů: %(services)d, '
+                            u'odmítnuto řádků: %(rejected)d.') % result.__dict__
+                if not result.rejected:
+                    rejects.close()
+                    messages.success(request, message)
+                    return HttpResponseRedirect(reverse('admin:services_encounter_changelist'))
+                messages.warning(request, message)
+                rejects.seek(0)
+                response = StreamingHttpResponse(FileWrapper(rejects),
+                    content_type='text/csv; charset=utf-8')
+                response['Content-Disposition'] = 'attachment; filename=odmitnute.csv'
+                return response
+        return render(request, 'admin/services/encounter/import.html', {'form': form})
+
     def _prefill_by_encounter(self, db_field, kwargs, encounter_id):
         if db_field.name in ('person', 'where', 'performed_by', 'performed_on'):
             try:
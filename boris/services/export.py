@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Raw data export of encounters and their services.
+
+Encounters are read in primary key order in chunks of ``CHUNK_SIZE``, each
+chunk by a single keyset query (``pk > last pk``), followed by one query
+for the services of the chunk and one per service model found in it for
+the model specific fields. Nothing but the current chunk is held in
+memory, so exports of many years run in constant memory and can stream
+into a ``StreamingHttpResponse`` as well as into a file.
+
+Two formats are available: CSV with one line per service (encounters
+without services get one line with empty service columns) and JSON lines
+with one object per encounter listing its services. The CSV has a column
+for every model specific field of the service models in the export (one
+more query before the header), left empty where the field doesn't apply.
+"""
+import csv
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from boris.reporting.tabular import Echo, format_cell
+from boris.services.models import Encounter, Service
+from boris.utils.contenttypes import content_types
+
+
+CHUNK_SIZE = 1000
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+
+# (column, lookup) of the exported encounter values.
+ENCOUNTER_COLUMNS = (
+    ('encounter_id', 'pk'),
+    ('performed_on', 'performed_on'),
+    ('is_by_phone', 'is_by_phone'),
+    ('person_id', 'person_id'),
+    ('person_type', 'person__content_type'),
+    ('town', 'where__title'),
+    ('district', 'where__district__title'),
+    ('group_contact_id', 'group_contact_id'),
+)
+
+SERVICE_COLUMNS = ('service_id', 'service', 'title')
+
+
+def filter_encounters(queryset=None, date_from=None, date_to=None, towns=None):
+    """Applies the filters of the report forms to ``queryset``."""
+    if queryset is None:
+        queryset = Encounter.objects.all()
+    if date_from:
+        queryset = queryset.filter(performed_on__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(performed_on__lte=date_to)
+    if towns:
+        queryset = queryset.filter(where__in=towns)
+    return queryset
+
+
+def detail_fields(model):
+    """Returns attnames of the fields ``model`` adds to ``Service``."""
+    if model is None or model._meta.proxy or model is Service:
+        return ()
+    return tuple(f.attname for f in model._meta.local_fields if not f.primary_key)
+
+
+def detail_columns(queryset):
+    """
+    Returns the union of the ``detail_fields`` of the service models of
+    the encounters in ``queryset``, ordered by model name.
+    """
+    content_type_ids = (Service.objects.filter(encounter__in=queryset.values('pk'))
+                        .order_by().values_list('content_type', flat=True).distinct())
+    models = filter(None, [content_types.get_model(ct_id) for ct_id in content_type_ids])
+    columns = []
+    for model in sorted(models, key=lambda m: m._meta.model_name):
+        columns.extend(f for f in detail_fields(model) if f not in columns)
+    return columns
+
+
+def _model_name(content_type_id):
+    model = content_types.get_model(content_type_id)
+    return model._meta.model_name if model else None
+
+
+def _services(encounter_ids):
+    """Returns {encounter id: [service dict]} for ``encounter_ids``."""
+    services = list(Service.objects.filter(encounter__in=encounter_ids)
+                    .order_by('pk').values('pk', 'encounter', 'content_type', 'title'))
+    by_model = defaultdict(list)
+    for service in services:
+        by_model[content_types.get_model(service['content_type'])].append(service['pk'])
+    details = {}
+    for model, pks in by_model.iteritems():
+        fields = detail_fields(model)
+        if fields:
+            for values in model._base_manager.filter(pk__in=pks).order_by().values('pk', *fields):
+                details[values.pop('pk')] = values
+
+    result = defaultdict(list)
+    for service in services:
+        result[service['encounter']].append({
+            'service_id': service['pk'],
+            'service': _model_name(service['content_type']),
+            'title': service['title'],
+            'details': details.get(service['pk'], {}),
+        })
+    return result
+
+
+def encounter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of encounter dicts (``ENCOUNTER_COLUMNS`` plus
+    ``services``) for all encounters in ``queryset``, ``chunk_size``
+    encounters at a time.
+    """
+    lookups = [lookup for _column, lookup in ENCOUNTER_COLUMNS]
+    queryset = queryset.order_by('pk').values(*lookups)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size].iterator())
+        if not rows:
+            return
+        last_pk = rows[-1]['pk']
+        services = _services([row['pk'] for row in rows])
+        encounters = []
+        for row in rows:
+            encounter = dict((column, row[lookup]) for column, lookup in ENCOUNTER_COLUMNS)
+            encounter['person_type'] = _model_name(encounter['person_type'])
+            encounter['services'] = services.get(row['pk'], [])
+            encounters.append(encounter)
+        yield encounters
+
+
+def csv_lines(queryset, chunk_size=CHUNK_SIZE):
+    """Yields UTF-8 encoded CSV lines for the encounters in ``queryset``."""
+    writer = csv.writer(Echo())
+    columns = [column for column, _lookup in ENCOUNTER_COLUMNS]
+    details = detail_columns(queryset)
+    yield writer.writerow(columns + list(SERVICE_COLUMNS) + details)
+    empty = [{'service_id': None, 'service': None, 'title': None, 'details': {}}]
+    for encounters in encounter_chunks(queryset, chunk_size):
+        for encounter in encounters:
+            head = [format_cell(encounter[column]) for column in columns]
+            for service in encounter['services'] or empty:
+                tail = [format_cell(service[column]) for column in SERVICE_COLUMNS]
+                tail += [format_cell(service['details'].get(column)) for column in details]
+                yield writer.writerow([value.encode('utf-8') for value in head + tail])
+
+
+def jsonl_lines(queryset, chunk_size=CHUNK_SIZE):
+    """Yields one UTF-8 encoded JSON object per encounter in ``queryset``."""
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for encounters in encounter_chunks(queryset, chunk_size):
+        for encounter in encounters:
+            services = []
+            for service in encounter['services']:
+                service = dict(service)
+                service.update(service.pop('details'))
+                services.append(service)
+            line = encoder.encode(dict(encounter, services=services)) + u'\n'
+            yield line.encode('utf-8')
+
+
+WRITERS = {
+    FORMAT_CSV: (csv_lines, 'text/csv; charset=utf-8'),
+    FORMAT_JSONL: (jsonl_lines, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def export(queryset, fmt, chunk_size=CHUNK_SIZE):
+    """Returns an iterator over the lines of the export of ``queryset`` in ``fmt``."""
+    writer = WRITERS[fmt][0]
+    return writer(queryset, chunk_size)
+
+
+def export_response(queryset, fmt, filename='kontakty'):
+    """Returns a response streaming the export of ``queryset`` in ``fmt``."""
+    response = StreamingHttpResponse(export(queryset, fmt), content_type=WRITERS[fmt][1])
+    response['Content-Disposition'] = 'attachment; filename=%s.%s' % (filename, fmt)
+    return response
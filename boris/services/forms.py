@@ -1,3 +1,4 @@
+# -*- coding: utf-8 -*-
 '''
 Created on 2.10.2011
 
@@ -5,10 +6,32 @@ Created on 2.10.2011
 '''
 from form_utils.forms import BetterModelForm, BetterModelFormMetaclass
 
+from django import forms
 from django.forms.widgets import HiddenInput
 from boris.utils.forms import adminform_formfield
 
 
+class EncounterField(forms.Field):
+    """
+    Hidden field holding the encounter the service form was built for.
+    Cleans to that very instance, so the encounter isn't fetched again.
+    """
+    widget = HiddenInput
+
+    def __init__(self, encounter, *args, **kwargs):
+        super(EncounterField, self).__init__(*args, **kwargs)
+        self.encounter = encounter
+
+    def prepare_value(self, value):
+        return getattr(value, 'pk', value)
+
+    def clean(self, value):
+        value = super(EncounterField, self).clean(value)
+        if self.encounter is None or unicode(value) != unicode(self.encounter.pk):
+            raise forms.ValidationError(u'Neplatný kontakt.')
+        return self.encounter
+
+
 class ServiceForm(BetterModelForm):
     @property
     def template_list(self):
@@ -27,9 +50,16 @@ class ServiceForm(BetterModelForm):
 
         super(ServiceForm, self).__init__(*args, **kwargs)
 
-        self.fields['encounter'].widget = HiddenInput()
+        field = self.fields['encounter']
+        self.fields['encounter'] = EncounterField(encounter, label=field.label)
         self.encounter = encounter
 
+    def _get_validation_exclusions(self):
+        # The encounter has been loaded already, don't check it exists.
+        exclude = super(ServiceForm, self)._get_validation_exclusions()
+        exclude.append('encounter')
+        return exclude
+
 
 def serviceform_factory(model, form=ServiceForm, fields=None, excludes=None,
                         fieldsets=None, row_attrs=None,
@@ -68,3 +98,30 @@ def serviceform_factory(model, form=ServiceForm, fields=None, excludes=None,
     }
 
     return BetterModelFormMetaclass(class_name, (form,), form_class_attrs)
+
+
+# Form classes built by ``serviceform_factory``, keyed by service model.
+_form_cache = {}
+
+
+def get_service_form(model):
+    """
+    Returns the default form class for service ``model``. The class is built
+    by ``serviceform_factory`` on first use only.
+    """
+    try:
+        return _form_cache[model]
+    except KeyError:
+        form = _form_cache[model] = serviceform_factory(model)
+        return form
+
+
+def clear_form_cache(model=None):
+    """
+    Drops cached form class of ``model`` (or of all models), e.g. after
+    changing the service ``Options`` in tests.
+    """
+    if model is None:
+        _form_cache.clear()
+    else:
+        _form_cache.pop(model, None)
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk import of historical clients and encounters from CSV.
+
+The input is read in chunks of ``CHUNK_SIZE`` rows. Every chunk is
+validated first: rows go through the model forms the application uses
+(``Client`` fields, the service forms), while towns, services and clients
+are resolved from in-memory maps and uniqueness of client codes is checked
+by one query per chunk. The valid records of the chunk are then inserted by
+``bulk_insert`` in a transaction of their own; invalid rows are written to
+a reject file together with their line numbers and errors, so they can be
+fixed and imported again.
+
+Clients file columns::
+
+    code, sex, first_name, last_name, birthdate, birthdate_year_only, town,
+    [district], primary_drug, primary_drug_usage, close_person, sex_partner
+
+Encounters file columns, one row per service::
+
+    encounter, performed_on, client, town, [district], is_by_phone, service,
+    [<service field>, ...]
+
+``encounter`` is any key of the encounter in the source data, rows of one
+encounter have to follow each other. ``client`` is the client code,
+``service`` the class name of the service (an empty value imports the
+encounter only) and the remaining columns are values of the service fields,
+empty values keep their defaults. An encounter is imported with all its
+services or not at all. Towns are given by title (with district if the
+title is ambiguous) or id.
+"""
+import csv
+from itertools import groupby
+
+from django import forms
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.utils.datastructures import MultiValueDict
+from django.utils.encoding import force_text
+
+from boris.clients import search
+from boris.clients.models import Client, Town
+from boris.services.models import Encounter
+from boris.services.models.core import registry
+from boris.utils.bulk import bulk_insert
+
+
+CHUNK_SIZE = 500
+
+KIND_CLIENTS = 'clients'
+KIND_ENCOUNTERS = 'encounters'
+
+CLIENT_FIELDS = ('code', 'sex', 'first_name', 'last_name', 'birthdate', 'birthdate_year_only',
+                 'primary_drug', 'primary_drug_usage', 'close_person', 'sex_partner')
+ENCOUNTER_FIELDS = ('performed_on', 'is_by_phone')
+
+
+class ImportFileError(ValueError):
+    """The input can't be imported at all, e.g. a required column is missing."""
+
+
+class ClientImportForm(forms.ModelForm):
+    class Meta:
+        model = Client
+        fields = CLIENT_FIELDS
+
+    def validate_unique(self):
+        # Codes are checked for the whole chunk at once.
+        pass
+
+
+class EncounterImportForm(forms.ModelForm):
+    class Meta:
+        model = Encounter
+        fields = ENCOUNTER_FIELDS
+
+
+class TownMap(object):
+    """Resolves towns by title (and district title) or id without queries."""
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.ids = set()
+        self.by_title = {}
+        for pk, title, district in Town.objects.using(using).values_list('pk', 'title', 'district__title'):
+            self.ids.add(pk)
+            self.by_title.setdefault(title.lower(), []).append((district.lower(), pk))
+
+    def resolve(self, value, district=u''):
+        """Returns the id of the town or raises ``forms.ValidationError``."""
+        if value.isdigit() and int(value) in self.ids:
+            return int(value)
+        towns = self.by_title.get(value.lower(), [])
+        if district:
+            towns = [t for t in towns if t[0] == district.lower()]
+        if not towns:
+            raise forms.ValidationError(u'Neznámé město.')
+        if len(towns) > 1:
+            raise forms.ValidationError(u'Nejednoznačné město, uveďte okres.')
+        return towns[0][1]
+
+
+def _error_text(errors):
+    return u'; '.join(u'%s: %s' % (field, u' '.join(force_text(e) for e in errs))
+                      for field, errs in sorted(errors.items()))
+
+
+class Rejects(object):
+    """Writes rejected rows with their line numbers and errors as CSV."""
+    def __init__(self, f, columns, delimiter=','):
+        self.writer = csv.writer(f, delimiter=delimiter)
+        self.columns = columns
+        self.count = 0
+        self.writer.writerow(['line', 'errors'] + [c.encode('utf-8') for c in columns])
+
+    def add(self, line, row, errors):
+        self.count += 1
+        values = [unicode(line), _error_text(errors)] + [row.get(c, u'') for c in self.columns]
+        self.writer.writerow([v.encode('utf-8') for v in values])
+
+
+class ImportResult(object):
+    def __init__(self):
+        self.records = 0
+        self.services = 0
+        self.rejected = 0
+
+
+def read_rows(f, delimiter=','):
+    """Returns (columns, iterator over (line number, row dict)) of a CSV file."""
+    reader = csv.reader(f, delimiter=delimiter)
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise ImportFileError(u'Soubor je prázdný.')
+    columns = [c.decode('utf-8-sig' if i == 0 else 'utf-8').strip().lower()
+               for i, c in enumerate(header)]
+
+    def rows():
+        for line, values in enumerate(reader, 2):
+            if any(values):
+                yield line, dict(zip(columns, [v.decode('utf-8').strip() for v in values]))
+    return columns, rows()
+
+
+class Importer(object):
+    """
+    Base class of the importers. Subclasses define the ``required`` columns,
+    the ``key`` column grouping rows into one record (if any), and
+    ``validate`` and ``insert`` for the records of a chunk.
+    """
+    required = ()
+    key = None
+    # Errors of valid rows rejected with the other rows of their record.
+    record_rejected = {'__all__': [u'Odmítnuto spolu s ostatními řádky záznamu.']}
+
+    def __init__(self, user=None, chunk_size=CHUNK_SIZE, using=DEFAULT_DB_ALIAS):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.using = using
+        self.towns = TownMap(using)
+
+    def chunks(self, rows):
+        """Yields lists of records, a record being a list of (line, row)."""
+        if self.key is None:
+            records = ([item] for item in rows)
+        else:
+            records = (list(group) for _key, group in groupby(rows, lambda item: item[1][self.key]))
+        chunk, size = [], 0
+        for record in records:
+            chunk.append(record)
+            size += len(record)
+            if size >= self.chunk_size:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+
+    def resolve_town(self, row, errors):
+        try:
+            return self.towns.resolve(row.get('town', u''), row.get('district', u''))
+        except forms.ValidationError as e:
+            errors['town'] = e.messages
+
+    def run(self, f, rejects_file, delimiter=','):
+        columns, rows = read_rows(f, delimiter)
+        missing = [c for c in self.required if c not in columns]
+        if missing:
+            raise ImportFileError(u'Chybí sloupce: %s.' % u', '.join(missing))
+        rejects = Rejects(rejects_file, columns, delimiter)
+        result = ImportResult()
+        for chunk in self.chunks(rows):
+            valid = []
+            for record, errors in self.validate(chunk):
+                if errors is None:
+                    valid.append(record)
+                else:
+                    for line, row in record:
+                        rejects.add(line, row, errors.get(line) or self.record_rejected)
+            with transaction.atomic(using=self.using):
+                self.insert(valid, result)
+        result.rejected = rejects.count
+        return result
+
+
+class ClientImporter(Importer):
+    required = ('code', 'sex', 'town')
+
+    def __init__(self, *args, **kwargs):
+        super(ClientImporter, self).__init__(*args, **kwargs)
+        self.codes = set()
+
+    def validate(self, chunk):
+        """Yields (record, None or {line: errors}) for the records of ``chunk``."""
+        codes = [row['code'].upper() for ((_line, row),) in chunk if row.get('code')]
+        existing = set(Client.objects.using(self.using).filter(code__in=codes)
+                       .values_list('code', flat=True))
+        for record in chunk:
+            line, row = record[0]
+            data = dict(row, code=row.get('code', u'').upper())
+            form = ClientImportForm(data)
+            errors = {} if form.is_valid() else dict(form.errors)
+            town = self.resolve_town(row, errors)
+            code = data['code']
+            if code in existing or code in self.codes:
+                errors.setdefault('code', []).append(u'Klient s tímto kódem již existuje.')
+            if errors:
+                yield record, {line: errors}
+                continue
+            self.codes.add(code)
+            client = form.instance
+            client.town_id = town
+            yield client, None
+
+    def insert(self, clients, result):
+        bulk_insert(clients, using=self.using)
+        search.index_objects(Client, [c.pk for c in clients])
+        result.records += len(clients)
+
+
+class EncounterImporter(Importer):
+    required = ('encounter', 'performed_on', 'client', 'town', 'service')
+    key = 'encounter'
+
+    def __init__(self, *args, **kwargs):
+        super(EncounterImporter, self).__init__(*args, **kwargs)
+        self.services = dict((s.__name__.lower(), s) for s in registry.services)
+        self.defaults = {}
+
+    def service_data(self, form_class, row):
+        """Returns form data of a service row, omitted values keep their initials."""
+        if form_class not in self.defaults:
+            unbound = form_class(None)
+            self.defaults[form_class] = dict(
+                (name, unbound[name].value()) for name in unbound.fields
+                if unbound[name].value() is not None)
+        data = MultiValueDict()
+        for name, value in self.defaults[form_class].items():
+            data.setlist(name, value if isinstance(value, (list, tuple)) else [value])
+        for name, field in form_class.base_fields.items():
+            value = row.get(name)
+            if value:
+                if isinstance(field.widget, forms.SelectMultiple):
+                    data.setlist(name, [v.strip() for v in value.split(',')])
+                else:
+                    data[name] = value
+        return data
+
+    def validate_service(self, encounter, row):
+        """Returns (service, None) or (None, errors) for a service row."""
+        cls = self.services.get(row['service'].lower())
+        if cls is None:
+            return None, {'service': [u'Neznámý výkon.']}
+        form_class = cls.form()
+        data = self.service_data(form_class, row)
+        # Multiple choice form fields of services leave checking the choices
+        # to the model field, which fails on invalid ones.
+        for name, field in form_class.base_fields.items():
+            if isinstance(field, forms.MultipleChoiceField):
+                invalid = [v for v in data.getlist(name) if not field.valid_value(v)]
+                if invalid:
+                    return None, {name: [field.error_messages['invalid_choice'] % {'value': invalid[0]}]}
+        form = form_class(encounter, data)
+        # The encounter is set once it's saved.
+        del form.fields['encounter']
+        if not form.is_valid():
+            return None, dict(form.errors)
+        return form.save(commit=False), None
+
+    def validate(self, chunk):
+        codes = set(row['client'].upper() for record in chunk for _line, row in record)
+        clients = dict(Client.objects.using(self.using).filter(code__in=codes)
+                       .values_list('code', 'pk'))
+        for record in chunk:
+            line, row = record[0]
+            errors = {}
+            form = EncounterImportForm(row)
+            if not form.is_valid():
+                errors.update(form.errors)
+            town = self.resolve_town(row, errors)
+            person = clients.get(row['client'].upper())
+            if person is None:
+                errors['client'] = [u'Neznámý klient.']
+            errors = {line: errors} if errors else {}
+
+            encounter = form.instance
+            encounter.person_id, encounter.where_id = person, town
+            services = []
+            for line, row in record:
+                if not row['service']:
+                    continue
+                service, service_errors = self.validate_service(encounter, row)
+                if service_errors:
+                    errors.setdefault(line, {}).update(service_errors)
+                else:
+                    services.append(service)
+            if errors:
+                yield record, errors
+            else:
+                yield (encounter, services), None
+
+    def insert(self, records, result):
+        encounters = bulk_insert([encounter for encounter, _services in records], using=self.using)
+        if self.user is not None:
+            through = Encounter.performed_by.through
+            through.objects.using(self.using).bulk_create(
+                [through(encounter_id=e.pk, user_id=self.user.pk) for e in encounters])
+        services = []
+        for encounter, encounter_services in records:
+            for service in encounter_services:
+                service.encounter = encounter
+                services.append(service)
+        bulk_insert(services, using=self.using)
+        result.records += len(encounters)
+        result.services += len(services)
+
+
+IMPORTERS = {
+    KIND_CLIENTS: ClientImporter,
+    KIND_ENCOUNTERS: EncounterImporter,
+}
+
+
+def import_records(f, kind, rejects_file, delimiter=',', **kwargs):
+    """
+    Imports records of ``kind`` from the CSV file ``f``, writes rejected rows
+    to ``rejects_file`` and returns an ``ImportResult``.
+    """
+    return IMPORTERS[kind](**kwargs).run(f, rejects_file, delimiter)
@@ -0,0 +1,36 @@
+from optparse import make_option
+from timeit import default_timer
+
+from django.core.management.base import NoArgsCommand
+
+from boris.services.forms import clear_form_cache, get_service_form, serviceform_factory
+from boris.services.models import Encounter, service_list
+
+
+class Command(NoArgsCommand):
+    help = 'Measure service form construction time per request, with and without form class caching'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--repeat', type='int', default=200,
+            help='Number of simulated requests per service (default 200).'),
+    )
+
+    def _measure(self, get_form_class, services, repeat):
+        encounter = Encounter()
+        start = default_timer()
+        for _i in xrange(repeat):
+            for service in services:
+                get_form_class(service)(encounter)
+        return (default_timer() - start) / (repeat * len(services))
+
+    def handle_noargs(self, **options):
+        repeat = options['repeat']
+        services = service_list()
+
+        uncached = self._measure(serviceform_factory, services, repeat)
+        clear_form_cache()
+        cached = self._measure(get_service_form, services, repeat)
+
+        self.stdout.write('services: %d, requests per service: %d' % (len(services), repeat))
+        self.stdout.write('uncached: %8.1f us per request' % (uncached * 1e6))
+        self.stdout.write('cached:   %8.1f us per request' % (cached * 1e6))
+        self.stdout.write('speedup:  %8.1fx' % (uncached / cached))
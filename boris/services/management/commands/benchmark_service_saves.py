@@ -0,0 +1,48 @@
+from optparse import make_option
+from timeit import default_timer
+
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import transaction
+
+from boris.services.models import Encounter, bulk_save_services, service_list
+
+
+class Command(NoArgsCommand):
+    help = 'Measure service inserts per second, saving forms one by one and in bulk. Nothing is stored.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--repeat', type='int', default=20,
+            help='Number of services of every kind to insert (default 20).'),
+    )
+
+    def _forms(self, encounter, services, repeat):
+        forms = []
+        for _i in xrange(repeat):
+            for service in services:
+                form = service.form()(encounter, {'encounter': encounter.pk})
+                if form.is_valid():
+                    forms.append(form)
+        return forms
+
+    def _measure(self, save, encounter, services, repeat):
+        with transaction.atomic():
+            start = default_timer()
+            forms = self._forms(encounter, services, repeat)
+            save(forms)
+            elapsed = default_timer() - start
+            transaction.set_rollback(True)
+        return len(forms) / elapsed
+
+    def handle_noargs(self, **options):
+        encounter = Encounter.objects.select_related('person').order_by('-pk').first()
+        if encounter is None:
+            raise CommandError('At least one encounter is needed to attach the services to.')
+        services = service_list(encounter.person)
+
+        one_by_one = self._measure(lambda forms: [f.save() for f in forms],
+                                   encounter, services, options['repeat'])
+        bulk = self._measure(lambda forms: bulk_save_services([f.save(commit=False) for f in forms]),
+                             encounter, services, options['repeat'])
+
+        self.stdout.write('services: %d, inserts per service: %d' % (len(services), options['repeat']))
+        self.stdout.write('one by one: %8.1f inserts/s' % one_by_one)
+        self.stdout.write('bulk:       %8.1f inserts/s' % bulk)
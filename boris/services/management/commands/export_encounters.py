@@ -0,0 +1,44 @@
+import sys
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import transaction
+
+from boris.services.export import CHUNK_SIZE, WRITERS, FORMAT_CSV, export, filter_encounters
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        raise CommandError('Invalid date %r, use YYYY-MM-DD.' % value)
+
+
+class Command(NoArgsCommand):
+    help = 'Export encounters with their services as CSV or JSON lines'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--from', dest='date_from', help='First day (YYYY-MM-DD).'),
+        make_option('--to', dest='date_to', help='Last day (YYYY-MM-DD).'),
+        make_option('--town', dest='towns', action='append', type='int', default=[],
+            help='Id of a town the encounters happened in, can be repeated.'),
+        make_option('--format', default=FORMAT_CSV, choices=sorted(WRITERS),
+            help='Output format: %s (default %s).' % (', '.join(sorted(WRITERS)), FORMAT_CSV)),
+        make_option('--output', '-o', help='Output file (default standard output).'),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+            help='Number of encounters read at once (default %d).' % CHUNK_SIZE),
+    )
+
+    def handle_noargs(self, **options):
+        queryset = filter_encounters(date_from=_parse_date(options['date_from']),
+                                     date_to=_parse_date(options['date_to']),
+                                     towns=options['towns'])
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout
+        try:
+            # One transaction for a consistent view of the data.
+            with transaction.atomic():
+                for line in export(queryset, options['format'], options['chunk_size']):
+                    out.write(line)
+        finally:
+            if options['output']:
+                out.close()
@@ -0,0 +1,42 @@
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from boris.services.importer import CHUNK_SIZE, IMPORTERS, ImportFileError, import_records
+
+
+class Command(BaseCommand):
+    args = '<%s> <file.csv>' % '|'.join(sorted(IMPORTERS))
+    help = 'Import historical clients or encounters with their services from CSV'
+    option_list = BaseCommand.option_list + (
+        make_option('--rejects', help='File for rejected rows (default <file>.rejects.csv).'),
+        make_option('--delimiter', default=',', help='Column delimiter (default ",").'),
+        make_option('--user', help='Username recorded as the worker of imported encounters.'),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+            help='Number of rows imported at once (default %d).' % CHUNK_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2 or args[0] not in IMPORTERS:
+            raise CommandError('Usage: import_records %s' % self.args)
+        kind, path = args
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('Unknown user %r.' % options['user'])
+
+        rejects_path = options['rejects'] or path + '.rejects.csv'
+        with open(path, 'rb') as f, open(rejects_path, 'wb') as rejects:
+            try:
+                result = import_records(f, kind, rejects, delimiter=options['delimiter'],
+                                        user=user, chunk_size=options['chunk_size'])
+            except ImportFileError as e:
+                raise CommandError(unicode(e).encode('utf-8'))
+
+        self.stdout.write('Imported %d %s, %d services, rejected %d rows.' % (
+            result.records, kind, result.services, result.rejected))
+        if result.rejected:
+            self.stdout.write('Rejected rows were written to %s.' % rejects_path)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0018_delete_pregnancytest'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='encounter',
+            index_together=set([('performed_on', 'where', 'person'), ('person', 'performed_on')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='service',
+            index_together=set([('content_type', 'encounter'), ('encounter', 'content_type')]),
+        ),
+    ]
@@ -8,6 +8,7 @@ from datetime import date
 import operator
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import SET_NULL
 from django.utils.encoding import force_unicode
@@ -19,7 +20,9 @@ from model_utils.models import TimeStampedModel
 
 from fragapy.common.models.adminlink import AdminLinkMixin
 
-from boris.services.forms import serviceform_factory
+from boris.services.forms import get_service_form
+from boris.utils.bulk import bulk_insert
+from boris.utils.contenttypes import content_types
 
 
 class ProxyInheritanceManager(InheritanceManager):
@@ -33,9 +36,7 @@ class ProxyInheritanceManager(InheritanceManager):
         qset = super(ProxyInheritanceManager, self).get_query_set()
         meta = self.model._meta
         if meta.proxy:
-            content_type = ContentType.objects.get_by_natural_key(meta.app_label,
-                meta.object_name.lower())
-            return qset.filter(content_type=content_type)
+            return qset.filter(content_type=content_types.get_id(self.model))
         return qset
 
 
@@ -68,6 +69,9 @@ class Encounter(models.Model, AdminLinkMixin):
     group_contact = models.ForeignKey('clients.GroupContact',
         verbose_name=_(u'Přidružená skupina'), null=True, blank=True,
                                       on_delete=SET_NULL)
+    # Set for encounters created offline and uploaded by ``boris.services.sync``.
+    uuid = models.CharField(max_length=36, unique=True, null=True, blank=True,
+        editable=False, verbose_name=_(u'UUID'))
 
     objects = EncounterManager()
 
@@ -76,6 +80,12 @@ class Encounter(models.Model, AdminLinkMixin):
         verbose_name = _(u'Kontakt')
         verbose_name_plural = _(u'Kontakty')
         ordering = ('-performed_on',)
+        # Reports filter by date range and town and count distinct persons,
+        # person pages list encounters by date.
+        index_together = (
+            ('performed_on', 'where', 'person'),
+            ('person', 'performed_on'),
+        )
 
     def service_count(self):
         return self.services.all().count()
@@ -85,7 +95,15 @@ class Encounter(models.Model, AdminLinkMixin):
         return unicode(self.person)
 
     def is_editable(self):
-        return self.group_contact is None
+        from boris.reporting.models import FrozenPeriod
+        return self.group_contact_id is None and \
+            not FrozenPeriod.objects.is_frozen(self.performed_on)
+
+    def clean(self):
+        super(Encounter, self).clean()
+        from boris.reporting.models import FrozenPeriod
+        if FrozenPeriod.objects.is_frozen(self.performed_on):
+            raise ValidationError(_(u'Období kontaktu je uzavřené pro výkaznictví.'))
 
 
 class ServiceOptions(object):
@@ -101,6 +119,7 @@ class ServiceOptions(object):
         self.form_template = None
         self.limited_to = ()
         self.is_available = lambda person: False
+        self.availability_test = None  # Custom ``is_available`` if given.
         self.fields = None
         self.excludes = None
         self.row_attrs = None
@@ -130,27 +149,97 @@ class ServiceOptions(object):
             return ((None, {'fields': fields}),)
 
 
+def person_type_name(person):
+    """
+    Returns name of the Person subclass ``person`` belongs to. Unlike
+    ``person.cast().__class__.__name__`` it doesn't hit the database.
+    """
+    content_type_id = getattr(person, 'content_type_id', None)
+    if content_type_id is not None:
+        model = content_types.get_model(content_type_id)
+        if model is not None:
+            return model.__name__
+    return person.__class__.__name__
+
+
+class ServiceRegistry(object):
+    """
+    Index of registered services.
+
+    Keeps services by class name, sorted by codenumber and, for every person
+    type, the services which are not limited to other person types.
+    """
+    def __init__(self):
+        self.services = []
+        self._by_name = {}
+        self._clear_cache()
+
+    def _clear_cache(self):
+        self._ordered = None
+        self._by_person_type = {}
+
+    def register(self, model):
+        self.services.append(model)
+        self._by_name.setdefault(model.__name__, model)
+        self._clear_cache()
+
+    def get(self, class_name):
+        try:
+            return self._by_name[class_name]
+        except KeyError:
+            raise ValueError('Service `%s` is not registered' % class_name)
+
+    @property
+    def ordered(self):
+        if self._ordered is None:
+            self._ordered = tuple(sorted(self.services, key=lambda x: x.service.codenumber))
+        return self._ordered
+
+    def for_person_type(self, type_name):
+        if type_name not in self._by_person_type:
+            self._by_person_type[type_name] = tuple(
+                s for s in self.ordered
+                if not s.service.limited_to or type_name in s.service.limited_to
+            )
+        return self._by_person_type[type_name]
+
+    def for_person(self, person):
+        """
+        Returns services available for ``person``. Only services with
+        a custom ``is_available`` test have to call it.
+        """
+        return [
+            s for s in self.for_person_type(person_type_name(person))
+            if s.service.availability_test is None or s.service.availability_test(person)
+        ]
+
+registry = ServiceRegistry()
+
+
+def _group_service_title(instance, service):
+    return service._meta.verbose_name + ' (%s)' % instance.type.title
+
+
 class ServiceMetaclass(type(models.Model)):
-    registered_services = []
+    registered_services = registry.services
 
     def __new__(cls, name, bases, attrs):
         new_cls = super(ServiceMetaclass, cls).__new__(cls, name, bases, attrs)
 
-        if not new_cls._meta.abstract:
-            cls.registered_services.append(new_cls)
-
         service_meta = {
             'title': new_cls._meta.verbose_name,
             'description_template': 'services/desc/%s.html' % name.lower(),
             'is_available': lambda person: not new_cls._meta.abstract,
+            'availability_test': None,
         }
         attrs_service_meta = attrs.pop('Options', None)
 
         if attrs_service_meta:
             service_meta.update(attrs_service_meta.__dict__)
+            service_meta['availability_test'] = attrs_service_meta.__dict__.get('is_available')
 
         def specific_person_passes_test(person_classes, func, person):
-            if person.cast().__class__.__name__ in person_classes:
+            if person_type_name(person) in person_classes:
                 return func(person)
             return False
 
@@ -164,6 +253,9 @@ class ServiceMetaclass(type(models.Model)):
         new_cls.service = ServiceOptions(new_cls)
         new_cls.service.__dict__.update(service_meta)
 
+        if not new_cls._meta.abstract:
+            registry.register(new_cls)
+
         return new_cls
 
 
@@ -227,12 +319,18 @@ class Service(TimeStampedModel):
     title = models.CharField(max_length=255, editable=False,
         verbose_name=_(u'Název'))
     content_type = models.ForeignKey(ContentType, editable=False)
+    uuid = models.CharField(max_length=36, unique=True, null=True, blank=True,
+        editable=False, verbose_name=_(u'UUID'))
 
     objects = ProxyInheritanceManager()
 
     class Meta:
         app_label = 'services'
         ordering = ('encounter',)
+        index_together = (
+            ('encounter', 'content_type'),
+            ('content_type', 'encounter'),
+        )
 
     class Options:
         is_available = lambda person: False
@@ -246,16 +344,13 @@ class Service(TimeStampedModel):
 
     @classmethod
     def real_content_type(cls):
-        # @attention: instead of using get_for_model which doesn't respect
-        # proxy models content types, use get_by_natural key as a workaround
-        return ContentType.objects.get_by_natural_key(cls._meta.app_label,
-                                                      cls._meta.object_name.lower())
+        # @attention: get_for_model doesn't respect proxy models content types
+        return content_types.get(cls)
 
     def save(self, *args, **kwargs):
-        if self.encounter.group_contact:
-            from boris.services.models.k import _group_service_title
-            from boris.services.models import GroupCounselling
-            self.title = _group_service_title(self.encounter.group_contact, GroupCounselling)
+        if self.encounter.group_contact_id is not None:
+            self.title = _group_service_title(self.encounter.group_contact,
+                                              registry.get('GroupCounselling'))
         return super(Service, self).save(*args, **kwargs)
 
     def clean(self):
@@ -277,16 +372,29 @@ class Service(TimeStampedModel):
     def form(cls, *args, **kwargs):
         """
         Returns completely initialized form class for service editing.
+        The class is cached, see ``boris.services.forms.clear_form_cache``.
         """
-        return serviceform_factory(cls)
+        return get_service_form(cls)
+
+    @classmethod
+    def class_is_editable(cls):
+        """
+        Returns True if services of this class are user-editable - if they
+        have something what a user can change. Depends only on the fields of
+        the class, so it is computed once.
+        """
+        if '_class_is_editable' not in cls.__dict__:
+            skip_fields = ('encounter', 'id', 'service_ptr')
+            cls._class_is_editable = any(
+                [f.editable for f in cls._meta.fields if f.name not in skip_fields])
+        return cls._class_is_editable
 
     def is_editable(self):
         """
         Returns True if this service is user-editable - if it has something
         what a user can change.
         """
-        skip_fields = ('encounter', 'id', 'service_ptr')
-        return any([f.editable for f in self._meta.fields if f.name not in skip_fields])
+        return self.class_is_editable()
 
     @classmethod
     def class_name(cls):
@@ -316,17 +424,65 @@ def service_list(person=None):
     to `person` will be listed.
     """
     if person:
-        services = (
-            s for s in Service.registered_services if s.service.is_available(person)
-        )
-    else:
-        services = Service.registered_services
-    return sorted(services, key=lambda x: x.service.codenumber)
+        return registry.for_person(person)
+    return list(registry.ordered)
+
+
+def cast_services(services):
+    """
+    Returns a list of ``services`` cast to their subclasses like ``cast()``
+    does, but with a single query per concrete subclass instead of one per
+    service. Proxy subclasses are built from the loaded rows directly.
+    """
+    services = list(services)
+    by_class = {}
+    for s in services:
+        model = content_types.get_model(s.content_type_id)
+        by_class.setdefault(model, []).append(s)
+
+    casted = {}
+    for model, instances in by_class.iteritems():
+        if model is None or model._meta.concrete_model is Service:
+            for s in instances:
+                if model is None or isinstance(s, model):
+                    casted[s.pk] = s
+                    continue
+                obj = model(**dict((f.attname, getattr(s, f.attname))
+                                   for f in model._meta.concrete_fields))
+                obj._state.adding = False
+                obj._state.db = s._state.db
+                casted[s.pk] = obj
+        else:
+            casted.update(model._base_manager.in_bulk([s.pk for s in instances]))
+    return [casted.get(s.pk, s) for s in services]
+
+
+def bulk_save_services(services):
+    """
+    Inserts new ``services`` by ``bulk_insert``, i.e. with a handful of
+    queries for the ``Service`` table and one per subclass table, and sets
+    their primary keys.
+
+    Titles and content types are filled in the way ``clean()`` and
+    ``save()`` do it.
+    """
+    services = list(services)
+    group_titles = {}
+    for s in services:
+        if s.content_type_id is None:
+            s.content_type = s.real_content_type()
+        if not s.title:
+            s.title = force_unicode(s._prepare_title())
+        group_contact_id = s.encounter.group_contact_id
+        if group_contact_id is not None:
+            if group_contact_id not in group_titles:
+                group_titles[group_contact_id] = _group_service_title(
+                    s.encounter.group_contact, registry.get('GroupCounselling'))
+            s.title = group_titles[group_contact_id]
+    bulk_insert(services)
+    return services
 
 
 def get_model_for_class_name(class_name):
     """Returns Service model class for given name"""
-    for s in Service.registered_services:
-        if s.__name__ == class_name:
-            return s
-    raise ValueError('Service `%s` is not registered' % class_name)
+    return registry.get(class_name)
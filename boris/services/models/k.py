@@ -8,10 +8,6 @@ from boris.services.models.basic import _boolean_stats
 from .core import Service
 
 
-def _group_service_title(instance, service):
-    return service._meta.verbose_name + ' (%s)' % instance.type.title
-
-
 def _group_counselling_stats(model, filtering, _type):
     """Get stats for choice fields for any service class."""
     stats = []
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Synchronization of data recorded offline in the field.
+
+Field teams record encounters with their services and syringe collections
+on a device without connectivity and upload the day's work in one batch.
+Every record carries a UUID generated on the device, so uploading the same
+batch again (e.g. after a lost response) updates the records instead of
+duplicating them. A batch is saved in one transaction: either all its
+records are valid and saved or nothing is.
+
+The response carries a delta of the data the device needs for recording:
+clients changed since the previous sync, and towns and group contact types
+if they changed at all. The sync token returned with the delta is sent with
+the next batch. Deleted clients are not reported.
+"""
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+
+from django import forms
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.encoding import force_text
+
+from boris.clients.models import Client, GroupContactType, Person, Town
+from boris.services.models import Encounter, Service
+from boris.services.models.core import cast_services, get_model_for_class_name
+from boris.syringes.models import SyringeCollection
+from boris.utils.bulk import bulk_insert
+
+
+TOKEN_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+# Clients saved in transactions running while the token was issued may
+# have an older modification time, the delta reaches back a bit.
+TOKEN_OVERLAP = timedelta(minutes=1)
+
+CLIENT_FIELDS = ('id', 'code', 'sex', 'first_name', 'last_name', 'town')
+TOWN_FIELDS = ('id', 'title', 'district')
+GROUP_CONTACT_TYPE_FIELDS = ('id', 'key', 'title')
+
+
+class EncounterSyncForm(forms.ModelForm):
+    class Meta:
+        model = Encounter
+        fields = ('performed_on', 'is_by_phone')
+
+
+class SyringeCollectionSyncForm(forms.ModelForm):
+    class Meta:
+        model = SyringeCollection
+        fields = ('count', 'date', 'location')
+
+
+def parse_uuid(value):
+    """Returns the canonical form of the UUID ``value`` or None if invalid."""
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _errors(errors):
+    return dict((field, [force_text(e) for e in errs]) for field, errs in errors.items())
+
+
+def _items(data, name):
+    """Returns the list of records ``name`` of ``data``, raises ValueError if malformed."""
+    items = data.get(name) or []
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError('%s must be a list of objects.' % name)
+    return items
+
+
+def _digest(rows):
+    return hashlib.sha1(repr(rows)).hexdigest()[:16]
+
+
+def parse_token(token):
+    """Returns (time, towns digest, group contact types digest) or None."""
+    try:
+        time, towns, types = token.split('-')
+        return datetime.strptime(time, TOKEN_TIME_FORMAT), towns, types
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_delta(token=None):
+    """Returns the changes since ``token`` along with a new token."""
+    now = datetime.now()
+    since = parse_token(token)
+    towns = list(Town.objects.order_by('pk').values_list(*TOWN_FIELDS))
+    types = list(GroupContactType.objects.order_by('pk').values_list(*GROUP_CONTACT_TYPE_FIELDS))
+    towns_digest, types_digest = _digest(towns), _digest(types)
+
+    clients = Client.objects.order_by('pk')
+    if since is not None:
+        clients = clients.filter(modified__gte=since[0] - TOKEN_OVERLAP)
+    return {
+        'token': '-'.join((now.strftime(TOKEN_TIME_FORMAT), towns_digest, types_digest)),
+        'clients': [dict(zip(CLIENT_FIELDS, c)) for c in clients.values_list(*CLIENT_FIELDS)],
+        'towns': None if since and since[1] == towns_digest else
+            [dict(zip(TOWN_FIELDS, t)) for t in towns],
+        'group_contact_types': None if since and since[2] == types_digest else
+            [dict(zip(GROUP_CONTACT_TYPE_FIELDS, t)) for t in types],
+    }
+
+
+class SyncBatch(object):
+    """
+    Validates and saves one uploaded batch::
+
+        {
+            "token": <token of the previous sync or null>,
+            "encounters": [{
+                "uuid": "...", "person": <id>, "where": <town id>,
+                "performed_on": "2015-06-01", "is_by_phone": false,
+                "performed_by": [<user id>, ...],
+                "services": [
+                    {"uuid": "...", "service": "HarmReduction", "data": {"in_count": 10, ...}},
+                    ...
+                ]
+            }, ...],
+            "syringe_collections": [{
+                "uuid": "...", "town": <town id>, "date": "2015-06-01",
+                "count": 10, "location": "...", "persons": [<user id>, ...]
+            }, ...]
+        }
+
+    ``performed_by`` and ``persons`` default to the uploading user. Omitted
+    service fields keep their current (or initial) values. Related objects
+    are checked and existing records loaded by one query per kind for the
+    whole batch.
+    """
+    def __init__(self, user, data):
+        self.user = user
+        self.encounters = _items(data, 'encounters')
+        self.collections = _items(data, 'syringe_collections')
+        self.services = [(i, s) for i, e in enumerate(self.encounters)
+                         for s in _items(e, 'services')]
+        self.seen = set()
+        self.load()
+
+    def load(self):
+        """Loads existing records and the related objects referenced by the batch."""
+        def uuids(items):
+            return [u for u in (parse_uuid(item.get('uuid')) for item in items) if u]
+
+        def ids(items, *names):
+            values = set()
+            for item in items:
+                for name in names:
+                    value = item.get(name)
+                    values.update(value if isinstance(value, list) else [value])
+            return [v for v in values if isinstance(v, (int, long))]
+
+        self.existing_encounters = dict(
+            (e.uuid, e) for e in Encounter.objects.filter(uuid__in=uuids(self.encounters)))
+        self.existing_services = dict((s.uuid, s) for s in cast_services(
+            Service.objects.filter(uuid__in=uuids([s for _i, s in self.services]))))
+        self.existing_collections = dict(
+            (c.uuid, c) for c in SyringeCollection.objects.filter(uuid__in=uuids(self.collections)))
+        self.persons = set(Person.objects.filter(
+            pk__in=ids(self.encounters, 'person')).values_list('pk', flat=True))
+        self.towns = set(Town.objects.filter(
+            pk__in=ids(self.encounters, 'where') + ids(self.collections, 'town'))
+            .values_list('pk', flat=True))
+        self.users = set(User.objects.filter(
+            pk__in=ids(self.encounters, 'performed_by') + ids(self.collections, 'persons'))
+            .values_list('pk', flat=True))
+
+    def check_uuid(self, item, errors):
+        value = parse_uuid(item.get('uuid'))
+        if value is None:
+            errors['uuid'] = [u'Neplatné UUID.']
+        elif value in self.seen:
+            errors['uuid'] = [u'UUID je v dávce vícekrát.']
+        self.seen.add(value)
+        return value
+
+    def check_ids(self, item, name, valid, errors, message):
+        value = item.get(name)
+        if not isinstance(value, (int, long)) or value not in valid:
+            errors[name] = [message]
+        return value
+
+    def check_users(self, item, name, errors):
+        users = item.get(name) or [self.user.pk]
+        valid = self.users | set([self.user.pk])
+        if not isinstance(users, list) or \
+                any(not isinstance(u, (int, long)) or u not in valid for u in users):
+            errors[name] = [u'Neznámý pracovník.']
+        return users
+
+    def validate_encounter(self, item):
+        """Returns (encounter, users, errors) for an encounter item."""
+        errors = {}
+        uuid = self.check_uuid(item, errors)
+        existing = self.existing_encounters.get(uuid)
+        if existing is not None and not existing.is_editable():
+            errors['uuid'] = [u'Kontakt nelze upravovat.']
+        form = EncounterSyncForm(item, instance=existing)
+        if not form.is_valid():
+            errors.update(_errors(form.errors))
+        person = self.check_ids(item, 'person', self.persons, errors, u'Neznámá osoba.')
+        where = self.check_ids(item, 'where', self.towns, errors, u'Neznámé město.')
+        users = self.check_users(item, 'performed_by', errors)
+        encounter = form.instance
+        encounter.uuid, encounter.person_id, encounter.where_id = uuid, person, where
+        return encounter, users, errors or None
+
+    def validate_service(self, encounter, item):
+        """Returns (service, errors) for a service item of a saved ``encounter``."""
+        errors = {}
+        uuid = self.check_uuid(item, errors)
+        try:
+            cls = get_model_for_class_name(item.get('service'))
+        except (ValueError, TypeError):
+            return None, dict(errors, service=[u'Neznámý výkon.'])
+        existing = self.existing_services.get(uuid)
+        if existing is not None and (existing.__class__ is not cls or
+                                     existing.encounter_id != encounter.pk):
+            return None, dict(errors, uuid=[u'UUID patří jinému výkonu.'])
+        if errors:
+            return None, errors
+
+        form_class = cls.form()
+        data = dict(item.get('data') or {})
+        # Omitted fields keep their current or initial values.
+        unbound = form_class(encounter, instance=existing)
+        for name in unbound.fields:
+            if name not in data and unbound[name].value() is not None:
+                data[name] = unbound[name].value()
+        data['encounter'] = encounter.pk
+        form = form_class(encounter, data, instance=existing)
+        if not form.is_valid():
+            return None, _errors(form.errors)
+        service = form.save(commit=False)
+        service.uuid = uuid
+        return service, None
+
+    def validate_collection(self, item):
+        errors = {}
+        uuid = self.check_uuid(item, errors)
+        form = SyringeCollectionSyncForm(item, instance=self.existing_collections.get(uuid))
+        if not form.is_valid():
+            errors.update(_errors(form.errors))
+        town = self.check_ids(item, 'town', self.towns, errors, u'Neznámé město.')
+        users = self.check_users(item, 'persons', errors)
+        collection = form.instance
+        collection.uuid, collection.town_id = uuid, town
+        return collection, users, errors or None
+
+    def save(self, objs, users_field=None):
+        """Inserts new ``objs`` in bulk, updates existing ones."""
+        new = [(obj, users) for obj, users in objs if obj.pk is None]
+        for obj, users in objs:
+            if obj.pk is not None:
+                obj.save()
+                if users_field:
+                    getattr(obj, users_field).add(*users)
+        bulk_insert([obj for obj, _users in new])
+        if users_field and new:
+            field = new[0][0]._meta.get_field(users_field)
+            through = field.rel.through
+            source, target = field.m2m_column_name(), field.m2m_reverse_name()
+            through.objects.bulk_create([through(**{source: obj.pk, target: user})
+                                         for obj, users in new for user in set(users)])
+
+    def process(self):
+        """
+        Validates and saves the batch, returns the result for every record.
+        Services are validated once their encounters are valid and saved.
+        """
+        encounters = [self.validate_encounter(item) for item in self.encounters]
+        collections = [self.validate_collection(item) for item in self.collections]
+        services = []
+        ok = all(errors is None for _obj, _users, errors in encounters + collections)
+        if ok:
+            self.save([(e, users) for e, users, _errors in encounters], 'performed_by')
+            self.save([(c, users) for c, users, _errors in collections], 'persons')
+            services = [self.validate_service(encounters[index][0], item)
+                        for index, item in self.services]
+            ok = all(errors is None for _service, errors in services)
+
+        def results(items, records):
+            return [{
+                'uuid': item.get('uuid'),
+                'id': record[0].pk if ok else None,
+                'errors': record[-1],
+            } for item, record in zip(items, records)]
+
+        if ok:
+            self.save([(s, None) for s, _errors in services])
+        return {
+            'ok': ok,
+            'encounters': results(self.encounters, encounters),
+            'syringe_collections': results(self.collections, collections),
+            'services': results([item for _i, item in self.services], services),
+        }
+
+
+def sync(user, data):
+    """
+    Saves the batch ``data`` uploaded by ``user`` in one transaction and
+    returns the results for every record together with the delta since the
+    batch token.
+    """
+    with transaction.atomic():
+        response = SyncBatch(user, data).process()
+        if not response['ok']:
+            transaction.set_rollback(True)
+    response['delta'] = get_delta(data.get('token'))
+    return response
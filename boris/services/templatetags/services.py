@@ -14,16 +14,18 @@ register = template.Library()
 
 @register.inclusion_tag('services/interface.html')
 def render_service_interface(encounter):
+    person = encounter.person.cast()
     return {
         'encounter': encounter,
+        'person': person,
         'services_done': encounter.services.all(),
-        'service_list': service_list(encounter.person)
+        'service_list': service_list(person)
     }
 
 
 @register.inclusion_tag('services/inc/option.html')
-def render_service_option(service, encounter):
+def render_service_option(service, person):
     return {
         'service': service,
-        'is_default': encounter.person.cast().is_default_service(service)
+        'is_default': person.is_default_service(service)
     }
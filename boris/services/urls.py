@@ -11,4 +11,6 @@ urlpatterns = patterns('boris.services.views',
 #    url(r'list-for-client/(?P<client_id>\d+)/$', 'services_list', name='services_list'),
     url(r'list-for-encounter/(?P<encounter_id>\d+)/$', 'services_list', name='services_list'),
     url(r'drop/(?P<service_id>\d+)/$', 'drop_service', name='services_drop'),
+    url(r'bulk/$', 'bulk_entry', name='services_bulk_entry'),
+    url(r'sync/$', 'sync_batch', name='services_sync'),
 )
\ No newline at end of file
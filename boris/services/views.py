@@ -1,3 +1,4 @@
+# -*- coding: utf-8 -*-
 '''
 Created on 2.10.2011
 
@@ -5,14 +6,21 @@ Created on 2.10.2011
 '''
 import anyjson
 
+from django import forms
+from django.contrib.auth.decorators import permission_required
+from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, Http404
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.shortcuts import render, get_object_or_404
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext as _
 from django.template.context import RequestContext
 from django.template.loader import render_to_string
 
 from boris.services.models.core import get_model_for_class_name, Service, \
-    Encounter
+    Encounter, bulk_save_services, cast_services
+from boris.services.sync import sync
 
 
 class HandleForm(object):
@@ -23,6 +31,8 @@ class HandleForm(object):
             raise Http404
 
         encounter = get_object_or_404(Encounter, pk=encounter_id)
+        if not encounter.is_editable():
+            raise PermissionDenied
         ctx = {
             'encounter': encounter,
             'cls': service_cls,
@@ -33,6 +43,9 @@ class HandleForm(object):
 
         if ctx['is_edit']:
             obj = get_object_or_404(cls, pk=object_id)
+            # The service must not leave a frozen period either.
+            if obj.encounter_id != encounter.pk and not obj.encounter.is_editable():
+                raise PermissionDenied
             ctx.update({
                 'obj': obj,
                 'action_link': reverse('services_handle_form_change', kwargs={
@@ -60,8 +73,19 @@ class HandleForm(object):
         if request.method == 'POST':
             form = ctx['form']
             if form.is_valid():
-                form.save()
-                resp = {'ok': True}
+                if ctx['is_edit']:
+                    obj = form.save()
+                else:
+                    obj = bulk_save_services([form.save(commit=False)])[0]
+                # Send back just the changed row of the service list.
+                resp = {
+                    'ok': True,
+                    'id': obj.pk,
+                    'row': render_to_string('services/inc/service_row.html', {
+                        's': obj,
+                        'encounter_editable': ctx['encounter'].is_editable(),
+                    }, context_instance=RequestContext(request))
+                }
             else:
                 resp = {
                     'ok': False,
@@ -77,16 +101,148 @@ handle_form = HandleForm()
 
 def services_list(request, encounter_id):
     encounter = get_object_or_404(Encounter, pk=encounter_id)
-    services_done = Service.objects.filter(encounter=encounter_id)
+    services_done = cast_services(Service.objects.filter(encounter=encounter_id))
     return render(request, 'services/list.html', {'encounter': encounter,
-        'services_done': services_done})
+        'encounter_editable': encounter.is_editable(), 'services_done': services_done})
 
 
 def drop_service(request, service_id):
     try:
         service = Service.objects.select_subclasses().filter(pk=service_id)[0]
-        service.delete()
-        return HttpResponse('OK')
     except IndexError:
         raise Http404
+    if not service.encounter.is_editable():
+        raise PermissionDenied
+    service.delete()
+    return HttpResponse('OK')
+
+
+
+class EncounterForm(forms.ModelForm):
+    class Meta:
+        model = Encounter
+        fields = ('person', 'performed_by', 'performed_on', 'where', 'is_by_phone')
+
 
+def _errors(errors):
+    return dict((field, [force_text(e) for e in errs]) for field, errs in errors.items())
+
+
+class BulkEntry(object):
+    """
+    Records an encounter together with any number of services at once.
+
+    Expects a POSTed JSON document::
+
+        {
+            "encounter": <id of an existing encounter> or {
+                "person": <id>, "performed_on": "2014-10-01", "where": <id>,
+                "is_by_phone": false, "performed_by": [<user id>, ...]
+            },
+            "services": [
+                {"service": "HarmReduction", "data": {"in_count": 10, ...}},
+                ...
+            ]
+        }
+
+    All services are validated with their usual forms (omitted fields keep
+    their initial values) and saved in one transaction, or nothing is saved
+    at all. The response contains the result for every service and the
+    rendered list of the encounter services.
+    """
+    def get_encounter(self, request, data):
+        if isinstance(data, dict):
+            data = dict(data)
+            data.setdefault('performed_by', [request.user.pk])
+            form = EncounterForm(data)
+            if not form.is_valid():
+                return None, _errors(form.errors)
+            return form.save(), None
+        try:
+            return Encounter.objects.get(pk=data), None
+        except (Encounter.DoesNotExist, ValueError, TypeError):
+            return None, {'encounter': [_(u'Kontakt neexistuje.')]}
+
+    def get_forms(self, encounter, services):
+        result = []
+        for item in services:
+            try:
+                cls = get_model_for_class_name(item['service'])
+                data = dict(item.get('data') or {})
+            except (ValueError, KeyError, TypeError):
+                result.append((None, {'service': [_(u'Neznámý výkon.')]}))
+                continue
+            form_class = cls.form()
+            # Omitted fields keep their initial values, as in the service forms.
+            unbound = form_class(encounter)
+            for name in unbound.fields:
+                if name not in data and unbound[name].value() is not None:
+                    data[name] = unbound[name].value()
+            data['encounter'] = encounter.pk
+            form = form_class(encounter, data)
+            result.append((form, None if form.is_valid() else _errors(form.errors)))
+        return result
+
+    def save(self, service_forms):
+        """Saves valid ``service_forms``, inserting proxy services in one query."""
+        bulk_save_services([form.save(commit=False) for form in service_forms])
+
+    @transaction.atomic
+    def process(self, request, data):
+        encounter, errors = self.get_encounter(request, data.get('encounter'))
+        if encounter is None:
+            return {'ok': False, 'errors': errors}
+        if not encounter.is_editable():
+            return {'ok': False, 'errors': {'encounter': [_(u'Kontakt nelze upravovat.')]}}
+
+        results = self.get_forms(encounter, data.get('services') or [])
+        ok = all(errs is None for form, errs in results)
+        if ok:
+            self.save([form for form, errs in results])
+        else:
+            transaction.set_rollback(True)
+        return {
+            'ok': ok,
+            'encounter': encounter.pk if ok else None,
+            'services': [{'ok': errs is None, 'errors': errs} for form, errs in results],
+        }
+
+    def __call__(self, request):
+        if request.method != 'POST':
+            raise Http404
+        try:
+            data = anyjson.deserialize(request.body)
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            return HttpResponseBadRequest('Invalid JSON document.')
+
+        resp = self.process(request, data)
+        if resp['ok']:
+            encounter = Encounter.objects.get(pk=resp['encounter'])
+            resp['content'] = render_to_string('services/list.html', {
+                'encounter': encounter,
+                'encounter_editable': encounter.is_editable(),
+                'services_done': cast_services(encounter.services.all()),
+            }, context_instance=RequestContext(request))
+        return HttpResponse(anyjson.dumps(resp), content_type='application/json')
+
+bulk_entry = permission_required('services.add_encounter', raise_exception=True)(BulkEntry())
+
+
+@permission_required('services.add_encounter', raise_exception=True)
+def sync_batch(request):
+    """
+    Uploads a batch of records made offline and returns the changes since
+    the last sync, see ``boris.services.sync``.
+    """
+    if request.method != 'POST':
+        raise Http404
+    try:
+        data = anyjson.deserialize(request.body)
+        if not isinstance(data, dict):
+            raise ValueError
+        resp = sync(request.user, data)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid JSON document.')
+    return HttpResponse(anyjson.dumps(resp), content_type='application/json')
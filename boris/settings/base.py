@@ -158,3 +158,10 @@ UTILITY_WORK_CHOICES = [('fp', 'FIELD_PROGRAMME', u'1) Terénní programy'),
                         ('sub', 'SUBSTITUTION', u'9) Substituce'),
                         ('amb', 'AMBULANT_TREATMENT', u'10) Ambulantní léčba'),
                         ('o', 'OTHER', u'11) jiné')]
+
+# REPORTING ------------------------------------------------------------------
+# First month of the fiscal year used by the date dimension.
+REPORTING_FISCAL_YEAR_START = 1
+# Secret key for pseudonymizing client codes in the research export. Keep it
+# the same across exports so that pseudonyms stay comparable.
+RESEARCH_EXPORT_KEY = None
@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.utils.translation import ugettext_lazy as _
 
 from boris.syringes.models import SyringeCollection
-from boris.utils.admin import BorisBaseAdmin, textual
+from boris.utils.admin import BorisBaseAdmin, related_list, textual
 
 
 class SyringeCollectionAdmin(BorisBaseAdmin):
@@ -16,10 +16,10 @@ class SyringeCollectionAdmin(BorisBaseAdmin):
     date_hierarchy = 'date'
     fields = ('count', 'town', 'date', 'location', 'persons')
     ordering = ('-date',)
+    list_count_mode = 'estimate'
+    list_keyset_pagination = True
 
-    @textual(_(u'Kdo'))
-    def user_list(self, obj):
-        return u'<br />'.join([unicode(s) for s in obj.persons.all()])
+    user_list = related_list('persons', _(u'Kdo'))
 
     @textual(_(u'Kde (např. u silnice)'), 'location')
     def location_display(self, obj):
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from boris.reporting.management.install_views import views_reinstalled
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syringes', '0002_syringecollection_indexes'),
+        ('reporting', '0003_views'),
+    ]
+
+    operations = views_reinstalled('0003_views',
+        migrations.AddField(
+            model_name='syringecollection',
+            name='uuid',
+            field=models.CharField(max_length=36, unique=True, null=True, verbose_name='UUID', blank=True, editable=False),
+            preserve_default=True,
+        ),
+    )
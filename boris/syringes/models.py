@@ -1,3 +1,5 @@
+# -*- coding: utf-8 -*-
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
@@ -14,12 +16,24 @@ class SyringeCollection(models.Model, AdminLinkMixin):
     date = models.DateField(verbose_name=_('when'))
     location = models.CharField(max_length=255, verbose_name=_('location'),
         blank=True)
+    uuid = models.CharField(max_length=36, unique=True, null=True, blank=True,
+        editable=False, verbose_name=_(u'UUID'))
 
     class Meta:
         verbose_name = _('syringe collection')
         verbose_name_plural = _('syringe collections')
+        index_together = (('date', 'town'),)
 
     def __unicode__(self):
         return _(u'%(count)sks v %(town)s, %(date)s') % {
             'count': self.count, 'town': self.town, 'date': date_format(self.date)
         }
+
+    def clean(self):
+        super(SyringeCollection, self).clean()
+        from boris.reporting.models import FrozenPeriod
+        dates = [self.date]
+        if self.pk is not None:
+            dates += SyringeCollection.objects.filter(pk=self.pk).values_list('date', flat=True)
+        if any(FrozenPeriod.objects.is_frozen(day) for day in dates):
+            raise ValidationError(_(u'Období sběru je uzavřené pro výkaznictví.'))
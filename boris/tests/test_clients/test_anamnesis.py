@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from nose import tools
+
+from boris.classification import DISEASES, DRUGS, RISKY_BEHAVIOR_KIND
+from boris.clients.models import Anamnesis, DiseaseTest, DrugUsage, RiskyManners
+from boris.tests.helpers import get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+class TestAnamnesisData(InitialDataTestCase):
+    def setUp(self):
+        user = get_tst_usr()
+        self.anamneses = []
+        for i in xrange(3):
+            client = get_tst_client('KLIENT%02d' % i)
+            a = Anamnesis.objects.create(client=client, filled_when=date(2014, 1, 1),
+                                         filled_where=client.town, author=user,
+                                         been_cured_before=False, been_cured_currently=False)
+            DrugUsage.objects.create(anamnesis=a, drug=DRUGS.THC, first_try_age=15,
+                                     is_primary=False)
+            DrugUsage.objects.create(anamnesis=a, drug=DRUGS.METHAMPHETAMINE, first_try_age=18,
+                                     first_try_iv_age=19, is_primary=True)
+            DiseaseTest.objects.create(anamnesis=a, disease=DISEASES.HIV)
+            RiskyManners.objects.create(anamnesis=a, behavior=RISKY_BEHAVIOR_KIND.SYRINGE_SHARING)
+            self.anamneses.append(a)
+
+    def touch(self, a):
+        return (a.drug_info, a.disease_test_results, a.overall_first_try_age,
+                a.intravenous_first_try_age, a.is_intravenous_user,
+                a.risky_manner(RISKY_BEHAVIOR_KIND.SYRINGE_SHARING))
+
+    def test_properties(self):
+        a = Anamnesis.objects.get(pk=self.anamneses[0].pk)
+        drugs, tests, overall, iv, _is_iv, rm = self.touch(a)
+        tools.assert_equals([DRUGS.METHAMPHETAMINE, DRUGS.THC], [d.drug for d in drugs])
+        tools.assert_equals(DISEASES.HIV, tests[u'HIV'].disease)
+        tools.assert_equals((15, 19), (overall, iv))
+        tools.assert_equals(RISKY_BEHAVIOR_KIND.SYRINGE_SHARING, rm.behavior)
+        tools.assert_true(a.risky_manner(RISKY_BEHAVIOR_KIND.INTRAVENOUS_APPLICATION) is None)
+
+    def test_properties_are_memoized(self):
+        a = Anamnesis.objects.get(pk=self.anamneses[0].pk)
+        with self.assertNumQueries(3):
+            self.touch(a)
+            self.touch(a)
+
+    def test_load_related_data(self):
+        with self.assertNumQueries(4):
+            anamneses = Anamnesis.load_related_data(Anamnesis.objects.all())
+            for a in anamneses:
+                self.touch(a)
+        tools.assert_equals([2, 2, 2], [len(a.drug_info) for a in anamneses])
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from nose import tools
+
+from boris.clients.models import GroupContact, GroupContactType
+from boris.services.models import Encounter, GroupCounselling, Service
+from boris.tests.helpers import get_tst_client, get_tst_town, get_tst_usr, InitialDataTestCase
+
+
+class TestGroupContactSync(InitialDataTestCase):
+    def setUp(self):
+        self.town = get_tst_town()
+        self.user = get_tst_usr()
+        self.type = GroupContactType.objects.create(title=u'Skupina', key=99)
+        self.clients = [get_tst_client('KLIENT%02d' % i) for i in xrange(3)]
+        self.gc = GroupContact.objects.create(town=self.town, date=date(2014, 3, 1), type=self.type)
+        self.gc.users.add(self.user)
+
+    def group_services(self):
+        return Service.objects.filter(encounter__group_contact=self.gc,
+                                      content_type=GroupCounselling.real_content_type())
+
+    def test_creates_encounters(self):
+        self.gc.clients = self.clients
+        encounters = Encounter.objects.filter(group_contact=self.gc)
+        tools.assert_equals(set(e.person_id for e in encounters), set(c.pk for c in self.clients))
+        for e in encounters:
+            tools.assert_equals([self.user], list(e.performed_by.all()))
+            tools.assert_equals(date(2014, 3, 1), e.performed_on)
+        tools.assert_equals(3, self.group_services().count())
+        tools.assert_true(all(s.title.endswith(u'(Skupina)') for s in self.group_services()))
+
+    def test_sync_is_idempotent(self):
+        self.gc.clients = self.clients
+        self.gc.clients = self.clients
+        self.gc.save()
+        tools.assert_equals(3, Encounter.objects.filter(group_contact=self.gc).count())
+        tools.assert_equals(3, self.group_services().count())
+
+    def test_keeps_other_services_of_removed_client(self):
+        self.gc.clients = self.clients
+        e = Encounter.objects.get(group_contact=self.gc, person=self.clients[0])
+        other_ct = Service.real_content_type()
+        Service.objects.create(encounter=e, title=u'Jiná', content_type=other_ct)
+        self.gc.clients = self.clients[1:]
+        e = Encounter.objects.get(pk=e.pk)
+        tools.assert_equals([other_ct.pk], [s.content_type_id for s in e.services.all()])
+
+    def test_updates_date_and_users(self):
+        self.gc.clients = self.clients
+        other = get_tst_usr('jinyuzivatel')
+        self.gc.users = [other]
+        self.gc.date = date(2014, 4, 1)
+        self.gc.save()
+        for e in Encounter.objects.filter(group_contact=self.gc):
+            tools.assert_equals(date(2014, 4, 1), e.performed_on)
+            tools.assert_equals([other], list(e.performed_by.all()))
+
+    def test_constant_number_of_queries(self):
+        self.gc.clients = self.clients[:1]
+        with CaptureQueriesContext(connection) as small:
+            self.gc.clients = self.clients
+        more = [get_tst_client('DALSI%02d' % i) for i in xrange(20)]
+        self.gc.clients = self.clients[:1]
+        with CaptureQueriesContext(connection) as big:
+            self.gc.clients = self.clients + more
+        tools.assert_equals(len(small), len(big))
+
+    def test_removing_all_clients(self):
+        self.gc.clients = self.clients
+        self.gc.clients = []
+        tools.assert_false(Encounter.objects.filter(group_contact=self.gc).exists())
+
+    def test_clear(self):
+        self.gc.clients = self.clients
+        self.gc.clients.clear()
+        tools.assert_false(Encounter.objects.filter(group_contact=self.gc).exists())
+
+    def test_clear_groups_of_client(self):
+        self.gc.clients = self.clients
+        self.clients[0].groupcontact_set.clear()
+        encounters = Encounter.objects.filter(group_contact=self.gc)
+        tools.assert_equals(set(c.pk for c in self.clients[1:]),
+                            set(encounters.values_list('person', flat=True)))
+
+    def test_admin_syncs_once_and_keeps_encounters(self):
+        self.gc.clients = self.clients
+        pks = set(Encounter.objects.filter(group_contact=self.gc).values_list('pk', flat=True))
+        self.client.login(username=self.user.username, password=self.user.cleartext_password)
+        data = {'type': self.type.pk, 'town': self.town.pk, 'date': '2014-03-02', 'note': '',
+                'users': [self.user.pk], 'clients': [c.pk for c in self.clients]}
+        url = reverse('admin:clients_groupcontact_change', args=[self.gc.pk])
+        with CaptureQueriesContext(connection) as queries:
+            tools.assert_equals(302, self.client.post(url, data).status_code)
+        encounters = Encounter.objects.filter(group_contact=self.gc)
+        tools.assert_equals(pks, set(encounters.values_list('pk', flat=True)))
+        tools.assert_true(all(e.performed_on == date(2014, 3, 2) for e in encounters))
+        tools.assert_equals(1, len([q for q in queries if 'UPDATE "services_encounter"' in q['sql']]))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from nose import tools
+
+from boris.clients import search
+from boris.clients.models import Client, Person, Town, SearchToken
+from boris.tests.helpers import get_tst_client, get_tst_town, InitialDataTestCase
+
+
+class TestTokenize(InitialDataTestCase):
+    def test_prefixes_without_diacritics(self):
+        tokens = search.tokenize(u'Čáp Ab')
+        tools.assert_equals(set(tokens), set([u'c', u'ca', u'cap', u'a', u'ab']))
+
+    def test_whole_word_ranks_higher(self):
+        tokens = search.tokenize(u'novak', weight=2)
+        tools.assert_true(tokens[u'novak'] > tokens[u'nova'])
+
+
+class TestSearchIndex(InitialDataTestCase):
+    def setUp(self):
+        self.client1 = get_tst_client('KAREL01', {'first_name': u'Karel', 'last_name': u'Nováček'})
+        self.client2 = get_tst_client('NOVAK02', {'first_name': u'Petr', 'last_name': u'Dvořák'})
+
+    def test_index_follows_saves(self):
+        tools.assert_true(SearchToken.objects.filter(scope='person', object_id=self.client1.pk,
+                                                     token=u'novacek').exists())
+        self.client1.last_name = u'Svoboda'
+        self.client1.save()
+        tools.assert_false(SearchToken.objects.filter(object_id=self.client1.pk,
+                                                      token=u'novacek').exists())
+
+    def test_index_follows_deletes(self):
+        pk = self.client2.pk
+        self.client2.delete()
+        tools.assert_false(SearchToken.objects.filter(scope='person', object_id=pk).exists())
+
+    def test_indexed_lookup(self):
+        found = Client.objects.filter(id__indexed=u'nov')
+        tools.assert_equals(set(found), set([self.client1, self.client2]))
+        found = Client.objects.filter(id__indexed=u'dvor')
+        tools.assert_equals(list(found), [self.client2])
+
+    def test_indexed_lookup_on_person(self):
+        self.client1.title = u'KAREL01'
+        self.client1.save()
+        tools.assert_equals(list(Person.objects.filter(id__indexed=u'kar')), [self.client1.person_ptr])
+
+    def test_filter_queryset_ranks_code_first(self):
+        found = list(search.filter_queryset(Client.objects.all(), u'novak'))
+        tools.assert_equals(found, [self.client2])
+        found = list(search.filter_queryset(Client.objects.all(), u'nov'))
+        tools.assert_equals(found, [self.client2, self.client1])
+
+    def test_filter_queryset_requires_all_words(self):
+        found = search.filter_queryset(Client.objects.all(), u'karel nov')
+        tools.assert_equals(list(found), [self.client1])
+
+    def test_rebuild_index(self):
+        SearchToken.objects.all().delete()
+        search.rebuild_index()
+        tools.assert_equals(list(Client.objects.filter(id__indexed=u'petr')), [self.client2])
+
+    def test_town_lookup(self):
+        town = get_tst_town()
+        tools.assert_true(town in Town.objects.filter(id__indexed=u'rako'))
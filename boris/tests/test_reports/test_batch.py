@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.core.urlresolvers import reverse
+from nose import tools
+
+from boris.clients.models import Town
+from boris.reporting.batch import TownStatsBatch
+from boris.reporting.management.install_views import install_views
+from boris.services.models import HarmReduction
+from boris.syringes.models import SyringeCollection
+from boris.tests.helpers import create_service, get_tst_client, get_tst_town, get_tst_usr, \
+    InitialDataTestCase
+
+
+class TestTownStatsBatch(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        town1 = get_tst_town()
+        # Two towns of one district, the same clients in both and in more
+        # months, so distinct counts differ from the sums of the cells.
+        town2 = Town.objects.create(title=u'Lubna', district=town1.district)
+        town3 = get_tst_town()
+        client1 = get_tst_client('c1', {'town': town1})
+        client2 = get_tst_client('c2', {'town': town3})
+        for day, town in ((date(2011, 3, 1), town1), (date(2011, 3, 2), town2),
+                          (date(2011, 4, 1), town1), (date(2010, 4, 1), town1)):
+            create_service(HarmReduction, client1, day, town, {'in_count': day.day})
+        create_service(HarmReduction, client2, date(2011, 3, 5), town3, {'in_count': 7})
+        SyringeCollection.objects.create(date=date(2011, 4, 2), town=town2, count=4, location='')
+
+    def test_reports_match_separate_reports(self):
+        batch = TownStatsBatch(2011)
+        for report in batch.reports:
+            tools.assert_equals(report.__class__(2011).get_data(), report.get_data())
+
+    def test_one_query_per_aggregation(self):
+        batch = TownStatsBatch(2011)
+        aggregations = len(batch.reports[0].aggregation_classes)
+        # One for each aggregation and the towns or districts of each report.
+        with self.assertNumQueries(aggregations + len(batch.reports)):
+            for report in batch.reports:
+                report.get_data()
+
+    def test_download_all(self):
+        user = get_tst_usr()
+        self.client.login(username=user.username, password=user.cleartext_password)
+        res = self.client.post(reverse('reporting_towns_all'), {'all-year': 2011})
+        tools.assert_equals('attachment; filename=stat_mesta_okresy_2011.xlsx',
+                            res['Content-Disposition'])
+        tools.assert_true(''.join(res.streaming_content).startswith('PK'))
+        tools.assert_equals(302, self.client.post(reverse('reporting_towns_all'), {}).status_code)
+        tools.assert_true('batch_form' in self.client.get(reverse('reporting_towns')).context)
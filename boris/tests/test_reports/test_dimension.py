@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from nose import tools
+
+from boris.reporting.dimension import date_attributes, fill_date_dimension, fiscal_period
+from boris.reporting.models import DateDimension
+
+
+class TestDateDimension(TestCase):
+    def test_attributes(self):
+        attrs = date_attributes(date(2015, 1, 1))
+        tools.assert_equals((2015, 1, 1), (attrs['year'], attrs['month'], attrs['quarter']))
+        # 2015-01-01 belongs to the first ISO week of 2015, 2016-01-01 to the last one of 2015.
+        tools.assert_equals((1, 2015), (attrs['week'], attrs['week_year']))
+        attrs = date_attributes(date(2016, 1, 1))
+        tools.assert_equals((53, 2015), (attrs['week'], attrs['week_year']))
+        tools.assert_equals(4, date_attributes(date(2016, 12, 31))['quarter'])
+
+    def test_fiscal_period(self):
+        tools.assert_equals((2015, 3), fiscal_period(date(2015, 3, 10)))
+        tools.assert_equals((2014, 12), fiscal_period(date(2015, 6, 30), start_month=7))
+        tools.assert_equals((2015, 1), fiscal_period(date(2015, 7, 1), start_month=7))
+
+    @override_settings(REPORTING_FISCAL_YEAR_START=10)
+    def test_fiscal_year_start_setting(self):
+        attrs = date_attributes(date(2015, 1, 5))
+        tools.assert_equals((2014, 4), (attrs['fiscal_year'], attrs['fiscal_period']))
+
+    def test_fill_adds_missing_days(self):
+        # Days past the range the migration fills.
+        days = DateDimension.objects.filter(date__year=2100)
+        tools.assert_equals(31, fill_date_dimension(date(2100, 1, 1), date(2100, 1, 31)))
+        tools.assert_equals(28, fill_date_dimension(date(2100, 1, 15), date(2100, 2, 28)))
+        tools.assert_equals(59, days.count())
+        tools.assert_equals(1, days.get(date=date(2100, 2, 28)).quarter)
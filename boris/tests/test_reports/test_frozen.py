@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from nose import tools
+
+from boris.clients.models import GroupContact, GroupContactType
+from boris.reporting.frozen import freeze
+from boris.reporting.management.install_views import install_views
+from boris.reporting.models import FrozenPeriod
+from boris.reporting.reports.monthly_stats import MonthlyStatsByTown, StatsByTownInPeriod
+from boris.reporting.reports.services import ServiceReport
+from boris.reporting.reports.yearly_stats import YearlyStatsByTown
+from boris.services.models import Encounter, HarmReduction
+from boris.syringes.models import SyringeCollection
+from boris.tests.helpers import create_service, get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+def stats(report):
+    return [(unicode(title), values) for title, values in report.get_data()]
+
+
+class TestFrozenPeriods(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        self.client_obj = get_tst_client()
+        self.town = self.client_obj.town
+        create_service(HarmReduction, self.client_obj, date(2011, 11, 1), self.town, {'in_count': 5})
+        create_service(HarmReduction, self.client_obj, date(2011, 12, 1), self.town, {'in_count': 3})
+        self.other = get_tst_client('other', {'town': self.town})
+
+    def tearDown(self):
+        FrozenPeriod.objects.clear_cache()
+
+    def add_encounter(self, day):
+        return Encounter.objects.create(person=self.other, performed_on=day, where=self.town)
+
+    def test_yearly_report_reuses_frozen_year(self):
+        before = stats(YearlyStatsByTown(2011))
+        freeze(FrozenPeriod(year=2011))
+        self.add_encounter(date(2011, 11, 2))
+        tools.assert_equals(before, stats(YearlyStatsByTown(2011)))
+        value = FrozenPeriod.objects.get().values.get(grouping='year,town',
+                                                      aggregation='EncounterCount')
+        tools.assert_equals((u'2011,%s' % self.town.pk, 2), (value.key, value.value))
+
+        # Towns, the period and the values of both groupings.
+        with self.assertNumQueries(4):
+            YearlyStatsByTown(2011).get_data()
+
+        FrozenPeriod.objects.all().delete()
+        tools.assert_not_equals(before, stats(YearlyStatsByTown(2011)))
+
+    def test_frozen_months_combined_with_computed(self):
+        freeze(FrozenPeriod(year=2011, month=11))
+        self.add_encounter(date(2011, 11, 2))
+        self.add_encounter(date(2011, 12, 2))
+        data = dict(MonthlyStatsByTown(2011).get_data())
+        # Totals of all towns are the last values.
+        counts = dict((unicode(title), values[-1]) for title, values in data[11])
+        tools.assert_equals(1, counts[u'Počet klientů'])
+        counts = dict((unicode(title), values[-1]) for title, values in data[12])
+        tools.assert_equals(2, counts[u'Počet klientů'])
+
+    def test_period_reports_reuse_frozen_month(self):
+        freeze(FrozenPeriod(year=2011, month=11))
+        self.add_encounter(date(2011, 11, 2))
+        period = (date(2011, 11, 1), date(2011, 11, 30))
+        counts = dict(StatsByTownInPeriod(*period, towns=None).get_data())
+        tools.assert_equals(1, counts[u'Počet kontaktů celkem'][-1])
+        tools.assert_equals(u'1 (1)', ServiceReport(*period).get_stats()[0][1][0][1])
+        tools.assert_equals(u'2 (2)', ServiceReport(*period).compute_stats()[0][1][0][1])
+
+    def test_edits_in_frozen_period_rejected(self):
+        encounter = Encounter.objects.get(performed_on=date(2011, 11, 1))
+        collection = SyringeCollection.objects.create(date=date(2011, 11, 3), town=self.town,
+                                                      count=1, location='')
+        freeze(FrozenPeriod(year=2011, month=11))
+        tools.assert_false(encounter.is_editable())
+        tools.assert_true(Encounter.objects.get(performed_on=date(2011, 12, 1)).is_editable())
+        tools.assert_raises(ValidationError, Encounter(person=self.client_obj, where=self.town,
+                                                       performed_on=date(2011, 11, 5)).full_clean)
+        collection.date = date(2011, 12, 3)
+        tools.assert_raises(ValidationError, collection.full_clean)
+
+    def test_service_views_reject_frozen_encounters(self):
+        user = get_tst_usr()
+        self.client.login(username=user.username, password=user.cleartext_password)
+        frozen = Encounter.objects.get(performed_on=date(2011, 11, 1))
+        open_encounter = Encounter.objects.get(performed_on=date(2011, 12, 1))
+        service = frozen.services.get()
+        freeze(FrozenPeriod(year=2011, month=11))
+
+        url = reverse('services_handle_form_add', kwargs={
+            'encounter_id': frozen.pk, 'service_cls': 'HarmReduction'})
+        tools.assert_equals(403, self.client.post(url, {'in_count': 1}).status_code)
+        # Moving a service out of the frozen period changes it as well.
+        url = reverse('services_handle_form_change', kwargs={
+            'encounter_id': open_encounter.pk, 'service_cls': 'HarmReduction',
+            'object_id': service.pk})
+        tools.assert_equals(403, self.client.post(url, {'in_count': 1}).status_code)
+        url = reverse('services_drop', kwargs={'service_id': service.pk})
+        tools.assert_equals(403, self.client.post(url).status_code)
+        tools.assert_equals([service.pk], list(frozen.services.values_list('pk', flat=True)))
+
+        url = reverse('services_drop', kwargs={'service_id': open_encounter.services.get().pk})
+        tools.assert_equals(200, self.client.post(url).status_code)
+
+    def test_group_contacts_in_frozen_period_rejected(self):
+        user = get_tst_usr()
+        self.client.login(username=user.username, password=user.cleartext_password)
+        group_type = GroupContactType.objects.create(title=u'Skupina', key=99)
+        frozen = GroupContact.objects.create(town=self.town, date=date(2011, 11, 2), type=group_type)
+        frozen.clients.add(self.other)
+        open_group = GroupContact.objects.create(town=self.town, date=date(2011, 12, 2),
+                                                 type=group_type)
+        freeze(FrozenPeriod(year=2011, month=11))
+
+        tools.assert_raises(ValidationError, frozen.full_clean)
+        # Moving the group contact out of the frozen period changes it as well.
+        frozen.date = date(2011, 12, 3)
+        tools.assert_raises(ValidationError, frozen.full_clean)
+        open_group.date = date(2011, 11, 3)
+        tools.assert_raises(ValidationError, open_group.full_clean)
+        open_group.date = date(2011, 12, 3)
+        open_group.full_clean()
+
+        with tools.assert_raises(ValidationError), transaction.atomic():
+            frozen.clients.remove(self.other)
+        with tools.assert_raises(ValidationError), transaction.atomic():
+            frozen.delete()
+        url = reverse('admin:clients_groupcontact_delete', args=(frozen.pk,))
+        tools.assert_equals(403, self.client.post(url, {'post': 'yes'}).status_code)
+        tools.assert_equals([date(2011, 11, 2)], list(Encounter.objects.filter(
+            group_contact=frozen).values_list('performed_on', flat=True)))
+
+    def test_admin_freezes_period(self):
+        user = get_tst_usr()
+        self.client.login(username=user.username, password=user.cleartext_password)
+        res = self.client.post(reverse('admin:reporting_frozenperiod_add'), {'year': 2011, 'month': ''})
+        tools.assert_equals(302, res.status_code)
+        period = FrozenPeriod.objects.get()
+        tools.assert_equals((None, user), (period.month, period.frozen_by))
+        tools.assert_true(period.values.exists())
+        res = self.client.post(reverse('admin:reporting_frozenperiod_add'), {'year': 2011, 'month': ''})
+        tools.assert_equals(200, res.status_code)
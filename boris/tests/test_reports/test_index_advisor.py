@@ -0,0 +1,28 @@
+from datetime import date
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from nose import tools
+
+from boris.reporting.management.commands.index_advisor import explain_sqlite
+from boris.services.models import Encounter
+from boris.tests.helpers import get_tst_client, InitialDataTestCase
+
+
+class TestIndexAdvisor(InitialDataTestCase):
+    def test_runs_all_reports(self):
+        client = get_tst_client()
+        Encounter.objects.create(person=client, where=client.town, performed_on=date(2014, 2, 1))
+        out = StringIO()
+        call_command('index_advisor', year=2014, stdout=out)
+        output = out.getvalue()
+        tools.assert_true('HygieneReport (kind=2)' in output)
+        tools.assert_true(output.strip().endswith('flagged queries'))
+
+    def test_explain_uses_composite_index(self):
+        if connection.vendor != 'sqlite':
+            return
+        qs = Encounter.objects.filter(performed_on__gte=date(2014, 1, 1), where=1).order_by()
+        sql, params = qs.values_list('person', flat=True).query.sql_with_params()
+        tools.assert_equals([], explain_sqlite(connection.cursor(), sql, params))
@@ -0,0 +1,112 @@
+from datetime import date
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from nose import tools
+
+from boris.clients.models import Town
+from boris.reporting.forms import OUTPUT_CSV
+from boris.reporting.management.install_views import install_views
+from boris.reporting.frozen import freeze
+from boris.reporting.models import FrozenPeriod, PregeneratedReport
+from boris.reporting.pregenerated import find, is_frozen, parameters_key, period_reports, \
+    pregenerate
+from boris.reporting.reports.services import ServiceReport
+from boris.reporting.reports.yearly_stats import YearlyStatsByTown
+from boris.services.models import Encounter
+from boris.tests.helpers import get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+class TestPregeneratedReports(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        client = get_tst_client()
+        Encounter.objects.create(person=client, performed_on=date(2011, 5, 1), where=client.town)
+        FrozenPeriod.objects.create(year=2011)
+
+    def tearDown(self):
+        FrozenPeriod.objects.clear_cache()
+
+    def test_parameters_key(self):
+        # Form data of a matching request.
+        parameters = {'date_from': date(2011, 5, 1), 'date_to': date(2011, 5, 31),
+                      'towns': Town.objects.none(), 'person': None}
+        tools.assert_equals(u'date_from=2011-05-01&date_to=2011-05-31', parameters_key(parameters))
+        tools.assert_true(parameters_key(parameters) in [
+            parameters_key(p) for cls, p in period_reports(2011, 5) if cls is ServiceReport])
+        parameters['towns'] = Town.objects.all()
+        tools.assert_equals(u'date_from=2011-05-01&date_to=2011-05-31&towns=%s' % Town.objects.get().pk,
+                            parameters_key(parameters))
+
+    def test_period_reports(self):
+        tools.assert_equals(3, len(period_reports(2011, 5)))
+        tools.assert_equals(8, len(period_reports(2011)))
+
+    def test_stores_all_outputs(self):
+        outputs = pregenerate(YearlyStatsByTown, {'year': 2011})
+        tools.assert_equals(4, len(outputs))
+        csv = find(YearlyStatsByTown, OUTPUT_CSV, {'year': 2011})
+        tools.assert_equals('text/csv; charset=utf-8', csv.content_type)
+        tools.assert_true(bytes(csv.content).startswith('2011,'))
+        tools.assert_equals(None, find(YearlyStatsByTown, OUTPUT_CSV, {'year': 2012}))
+
+    def test_only_frozen_periods_served(self):
+        pregenerate(ServiceReport, {'date_from': date(2012, 1, 1), 'date_to': date(2012, 2, 29)})
+        FrozenPeriod.objects.create(year=2012, month=1)
+        tools.assert_false(is_frozen({'date_from': date(2012, 1, 1), 'date_to': date(2012, 2, 29)}))
+        tools.assert_equals(None, find(ServiceReport, OUTPUT_CSV,
+                                       {'date_from': date(2012, 1, 1), 'date_to': date(2012, 2, 29)}))
+        FrozenPeriod.objects.create(year=2012, month=2)
+        tools.assert_true(find(ServiceReport, OUTPUT_CSV,
+                               {'date_from': date(2012, 1, 1), 'date_to': date(2012, 2, 29)}))
+
+    def test_freezing_discards_outputs(self):
+        pregenerate(YearlyStatsByTown, {'year': 2011})
+        pregenerate(ServiceReport, {'date_from': date(2011, 5, 1), 'date_to': date(2011, 5, 31),
+                                    'towns': [], 'person': None})
+        pregenerate(YearlyStatsByTown, {'year': 2012})
+        freeze(FrozenPeriod.objects.get(year=2011))
+        tools.assert_equals(set(['year=2012']),
+                            set(PregeneratedReport.objects.values_list('parameters', flat=True)))
+
+    def test_command(self):
+        call_command('pregenerate_reports', year=2011, month=5, stdout=StringIO())
+        tools.assert_equals(3 * 4, PregeneratedReport.objects.count())
+        out = StringIO()
+        call_command('pregenerate_reports', year=2012, stdout=out)
+        tools.assert_true('not frozen' in out.getvalue())
+        tools.assert_equals(3 * 4, PregeneratedReport.objects.count())
+
+
+class TestPregeneratedInterface(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        user = get_tst_usr()
+        self.client.login(username=user.username, password=user.cleartext_password)
+        FrozenPeriod.objects.create(year=2011)
+        pregenerate(YearlyStatsByTown, {'year': 2011})
+        PregeneratedReport.objects.filter(display_type=OUTPUT_CSV).update(content='stored')
+
+    def tearDown(self):
+        FrozenPeriod.objects.clear_cache()
+
+    def post(self, year, **extra):
+        data = dict({'yearbytown-year': year, 'yearbytown-display': OUTPUT_CSV}, **extra)
+        return self.client.post(reverse('reporting_yearlystatsbytowntab'), data)
+
+    def test_serves_stored_output(self):
+        res = self.post(2011)
+        tools.assert_equals('stored', res.content)
+        tools.assert_equals('attachment; filename=stat_rocni_podle_mesta.csv',
+                            res['Content-Disposition'])
+        tools.assert_not_equals('stored', ''.join(self.post(2012).streaming_content))
+
+    def test_unfrozen_period_computed(self):
+        FrozenPeriod.objects.all().delete()
+        tools.assert_not_equals('stored', ''.join(self.post(2011).streaming_content))
+
+    def test_recompute(self):
+        res = self.post(2011, recompute='1')
+        tools.assert_true(res.content.startswith('2011,'))
+        tools.assert_equals(res.content, bytes(find(YearlyStatsByTown, OUTPUT_CSV, {'year': 2011}).content))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+from datetime import date
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test.utils import override_settings
+from nose import tools
+
+from boris.classification import DISEASES, DRUGS, RISKY_BEHAVIOR_KIND
+from boris.clients.models import Anamnesis, DiseaseTest, DrugUsage, RiskyManners
+from boris.reporting.management.install_views import install_views
+from boris.reporting.research import pseudonym, research_lines
+from boris.services.models import Address, HarmReduction
+from boris.tests.helpers import create_service, get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+class TestResearchDataset(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        user = get_tst_usr()
+        self.clients = [get_tst_client('KLIENT%02d' % i) for i in xrange(3)]
+        client = self.clients[0]
+        a = Anamnesis.objects.create(client=client, filled_when=date(2014, 5, 1),
+                                     filled_where=client.town, author=user,
+                                     been_cured_before=False, been_cured_currently=True)
+        DrugUsage.objects.create(anamnesis=a, drug=DRUGS.HEROIN, first_try_age=17, is_primary=True)
+        RiskyManners.objects.create(anamnesis=a, behavior=RISKY_BEHAVIOR_KIND.SYRINGE_SHARING)
+        DiseaseTest.objects.create(anamnesis=a, disease=DISEASES.HIV, date=date(2014, 5, 1))
+        create_service(HarmReduction, client, date(2014, 6, 1), client.town)
+        create_service(HarmReduction, client, date(2015, 6, 1), client.town)
+        create_service(Address, client, date(2015, 7, 1), client.town)
+
+    def records(self, **kwargs):
+        return [json.loads(line) for line in research_lines('tajne', **kwargs)]
+
+    def test_record(self):
+        record = self.records()[0]
+        tools.assert_equals(pseudonym(u'KLIENT00', 'tajne'), record['pseudonym'])
+        tools.assert_equals(1980, record['birth_year'])
+        tools.assert_equals({'2014': 1, '2015': 2}, record['encounters'])
+        tools.assert_equals({'2014': {'harmreduction': 1}, '2015': {'harmreduction': 1, 'address': 1}},
+                            record['services'])
+        anamnesis = record['anamnesis']
+        tools.assert_equals((2014, True), (anamnesis['filled_year'], anamnesis['been_cured_currently']))
+        tools.assert_equals([DRUGS.HEROIN], [d['drug'] for d in anamnesis['drug_usages']])
+        tools.assert_equals([RISKY_BEHAVIOR_KIND.SYRINGE_SHARING],
+                            [r['behavior'] for r in anamnesis['risky_manners']])
+        tools.assert_equals([{'disease': DISEASES.HIV, 'result': 0, 'year': 2014}],
+                            anamnesis['disease_tests'])
+
+    def test_no_identifying_data(self):
+        content = ''.join(research_lines('tajne'))
+        for client in self.clients:
+            tools.assert_false(client.code in content)
+            tools.assert_false(client.town.title in content.replace(client.town.district.title, ''))
+        tools.assert_false('1980-10-10' in content)
+
+    def test_pseudonyms_depend_on_key(self):
+        tools.assert_equals(pseudonym(u'abc', 'k1'), pseudonym(u'ABC', 'k1'))
+        tools.assert_not_equal(pseudonym(u'abc', 'k1'), pseudonym(u'abc', 'k2'))
+
+    def test_queries_per_chunk(self):
+        # Clients, anamneses, yearly encounter and service counts for every
+        # chunk, drug usages, disease tests and risky manners for the chunk
+        # with an anamnesis and a last empty chunk.
+        with self.assertNumQueries(2 * 4 + 3 + 1):
+            tools.assert_equals(3, len(self.records(chunk_size=2)))
+
+    @override_settings(RESEARCH_EXPORT_KEY=None)
+    def test_command_requires_key(self):
+        tools.assert_raises(CommandError, call_command, 'export_research_dataset')
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command('export_research_dataset', key='tajne', output=path)
+            with open(path) as f:
+                tools.assert_equals(3, len(f.readlines()))
+        finally:
+            os.remove(path)
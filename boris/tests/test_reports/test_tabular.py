@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+from django.test.client import RequestFactory
+from nose import tools
+
+from boris.reporting.core import report_response
+from boris.reporting.forms import OUTPUT_BROWSER, OUTPUT_CSV, OUTPUT_OFFICE
+from boris.reporting.management.install_views import install_views
+from boris.reporting.reports.yearly_stats import YearlyStatsByTown
+from boris.reporting.tabular import Table, csv_chunks, format_cell, render_html
+from boris.services.models import Encounter
+from boris.tests.helpers import get_tst_client, InitialDataTestCase
+
+
+class TestWriters(TestCase):
+    def setUp(self):
+        self.tables = [
+            Table(u'A', [u'Město', u'Počet'], [[u'<Praha>', 3], [u'Brno, venkov', None]]),
+            Table(u'B', None, [[date(2015, 3, 1), 1.5]]),
+        ]
+
+    def test_format_cell(self):
+        tools.assert_equals([u'', u'3', u'01.03.2015', u'True'],
+                            [format_cell(v) for v in (None, 3, date(2015, 3, 1), True)])
+
+    def test_html(self):
+        html = render_html(self.tables)
+        tools.assert_true(u'<tr><th>Město</th><th>Počet</th></tr>' in html)
+        tools.assert_true(u'<tr><td>&lt;Praha&gt;</td><td>3</td></tr>' in html)
+        tools.assert_true(u'<tr><td>01.03.2015</td><td>1.5</td></tr>' in html)
+        tools.assert_equals(2, html.count(u'<table'))
+
+    def test_csv(self):
+        tools.assert_equals('Město,Počet\r\n<Praha>,3\r\n"Brno, venkov",\r\n\r\n01.03.2015,1.5\r\n',
+                            ''.join(csv_chunks(self.tables)))
+
+
+class TestTabularReports(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        self.client = get_tst_client()
+        Encounter.objects.create(person=self.client, performed_on=date(2015, 3, 1), where=self.client.town)
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+
+    def test_outputs_share_the_tables(self):
+        report = YearlyStatsByTown(2015)
+        table = report.get_tables()[0]
+        tools.assert_equals([2015, self.client.town.title, u'Celkem'], table.header)
+        tools.assert_equals(len(report.aggregations), len(table.rows))
+        row = u'<tr><td>%s</td><td>1</td><td>1</td></tr>' % table.rows[0][0]
+        for display_type in (OUTPUT_BROWSER, OUTPUT_OFFICE):
+            content = report_response(YearlyStatsByTown, self.request, display_type, year=2015).content
+            tools.assert_true(row.encode('utf-8') in content)
+        response = report_response(YearlyStatsByTown, self.request, OUTPUT_CSV, year=2015)
+        lines = ''.join(response.streaming_content).splitlines()
+        tools.assert_equals(('%s,1,1' % table.rows[0][0]).encode('utf-8'), lines[1])
@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.db import connection
+from nose import tools
+
+from boris.reporting.dimension import date_attributes, fill_date_dimension
+from boris.reporting.management.install_views import install_views, view_statements
+from boris.reporting.models import SearchEncounter, SearchSyringeCollection
+from boris.services.models import Encounter
+from boris.syringes.models import SyringeCollection
+from boris.tests.helpers import get_tst_client, InitialDataTestCase
+
+
+class TestReportingViews(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        self.client = get_tst_client()
+
+    def test_statements_for_all_backends(self):
+        for vendor in ('mysql', 'postgresql', 'sqlite'):
+            tools.assert_equals(6 if vendor != 'mysql' else 3, len(view_statements(vendor)))
+        tools.assert_raises(NotImplementedError, view_statements, 'oracle')
+
+    def test_date_parts_match_dimension(self):
+        # Year boundaries are where ISO weeks and calendar years disagree.
+        days = [date(2015, 12, 28), date(2016, 1, 1), date(2016, 1, 4), date(2016, 7, 15),
+                date(2016, 12, 31), date(2018, 12, 31)]
+        for day in days:
+            Encounter.objects.create(person=self.client, performed_on=day, where=self.client.town)
+            SyringeCollection.objects.create(date=day, town=self.client.town, count=1, location='')
+        for model in (SearchEncounter, SearchSyringeCollection):
+            for row in model.objects.order_by('performed_on'):
+                attrs = date_attributes(row.performed_on)
+                tools.assert_equals((attrs['year'], attrs['month'], attrs['quarter'], attrs['week']),
+                                    (row.year, row.month, row.quarter, row.week))
+
+    def test_dimension_attributes(self):
+        fill_date_dimension(date(2016, 1, 1), date(2016, 1, 31))
+        for day in (date(2016, 1, 1), date(2200, 1, 1)):
+            Encounter.objects.create(person=self.client, performed_on=day, where=self.client.town)
+        rows = SearchEncounter.objects.order_by('performed_on')
+        tools.assert_equals([(2016, 2015, 2016, 1), (2200, 2200, None, None)],
+                            [(r.year, r.week_year, r.fiscal_year, r.fiscal_period) for r in rows])
+
+    def test_reinstall(self):
+        install_views('')
+        tools.assert_true('reporting_searchservice' in connection.introspection.table_names())
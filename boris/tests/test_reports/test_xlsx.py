@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from datetime import date, datetime
+from io import BytesIO
+from xml.etree import ElementTree
+from zipfile import ZipFile
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+from nose import tools
+
+from boris.reporting.core import report_response, StreamingReportResponse
+from boris.reporting.forms import OUTPUT_XLSX
+from boris.reporting.management.install_views import install_views
+from boris.reporting.reports.clients import ClientReport
+from boris.reporting.reports.monthly_stats import MonthlyStatsByTown
+from boris.services.models import Encounter
+from boris.tests.helpers import get_tst_client, InitialDataTestCase
+from boris.utils.xlsx import column_letter, stream_xlsx, CONTENT_TYPE
+
+
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def read_workbook(content):
+    """Returns {sheet name: [[(type, value), ...], ...]} of an XLSX file."""
+    zf = ZipFile(BytesIO(content))
+    tools.assert_equals(None, zf.testzip())
+    workbook = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+    sheets = {}
+    for i, sheet in enumerate(workbook.iter(NS + 'sheet'), 1):
+        root = ElementTree.fromstring(zf.read('xl/worksheets/sheet%d.xml' % i))
+        sheets[sheet.get('name')] = [
+            [(c.get('t'), c.findtext(NS + 'v') or c.findtext('%sis/%st' % (NS, NS)))
+             for c in row.iter(NS + 'c')]
+            for row in root.iter(NS + 'row')
+        ]
+    return sheets
+
+
+class TestXlsxWriter(TestCase):
+    def test_column_letter(self):
+        tools.assert_equals(['A', 'Z', 'AA', 'AZ', 'BA'],
+                            [column_letter(i) for i in (0, 25, 26, 51, 52)])
+
+    def test_typed_cells(self):
+        rows = [[u'Město', 1, 2.5, True, date(2015, 1, 1), datetime(2015, 1, 1, 12), None, u'<&>']]
+        sheets = read_workbook(''.join(stream_xlsx([(u'Leden/2015', rows)])))
+        tools.assert_equals({u'Leden-2015': [[
+            ('inlineStr', u'Město'), (None, '1'), (None, '2.5'), ('b', '1'),
+            (None, '42005'), (None, '42005.5'), ('inlineStr', u'<&>'),
+        ]]}, sheets)
+
+    def test_rows_are_consumed_lazily(self):
+        def rows():
+            for i in xrange(5000):
+                yield [i, u'řádek %d' % i]
+        chunks = stream_xlsx([('a' * 40, rows()), ('a' * 40, [])])
+        sheets = read_workbook(''.join(chunks))
+        tools.assert_equals(set(['a' * 31, 'a' * 27 + ' (2)']), set(sheets))
+        tools.assert_equals(5000, len(sheets['a' * 31]))
+
+    def test_empty_workbook(self):
+        tools.assert_equals({u'List': []}, read_workbook(''.join(stream_xlsx([]))))
+
+
+class TestXlsxReports(InitialDataTestCase):
+    def setUp(self):
+        install_views('')
+        self.client = get_tst_client()
+        Encounter.objects.create(person=self.client, performed_on=date(2015, 3, 1), where=self.client.town)
+        self.request = RequestFactory().get('/')
+
+    def test_monthly_stats(self):
+        response = report_response(MonthlyStatsByTown, self.request, OUTPUT_XLSX, year=2015)
+        tools.assert_true(isinstance(response, StreamingReportResponse))
+        tools.assert_equals(CONTENT_TYPE, response['Content-Type'])
+        tools.assert_true(response['Content-Disposition'].endswith('.xlsx'))
+        sheets = read_workbook(''.join(response.streaming_content))
+        tools.assert_equals(12, len(sheets))
+        march = sheets['3-2015']
+        tools.assert_equals([('inlineStr', u'3/2015'), ('inlineStr', self.client.town.title),
+                             ('inlineStr', u'Celkem')], march[0])
+        # The number of clients stays a number.
+        tools.assert_equals([(None, '1'), (None, '1')], march[1][1:])
+
+    def test_client_report(self):
+        response = report_response(ClientReport, self.request, OUTPUT_XLSX)
+        rows = read_workbook(''.join(response.streaming_content)).values()[0]
+        tools.assert_equals(2, len(rows))
+        tools.assert_equals(('inlineStr', self.client.code), rows[1][0])
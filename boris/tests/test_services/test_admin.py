@@ -0,0 +1,127 @@
+from datetime import date
+
+import anyjson
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from nose import tools
+
+from boris.clients.models import Client
+from boris.services.models import Encounter, HarmReduction
+from boris.tests.helpers import create_service, get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+class TestEncounterChangeList(InitialDataTestCase):
+    def setUp(self):
+        self.user = get_tst_usr()
+        self.person = get_tst_client()
+        self.town = self.person.town
+        for day in xrange(1, 8):
+            for _i in xrange(2):
+                Encounter.objects.create(person=self.person, where=self.town,
+                                         performed_on=date(2014, 1, day))
+        self.model_admin = admin.site._registry[Encounter]
+        self.model_admin.list_per_page = 4
+        self.expected = list(Encounter.objects.order_by('-performed_on', '-pk'))
+
+    def tearDown(self):
+        del self.model_admin.list_per_page
+
+    def get_cl(self, url='/'):
+        request = RequestFactory().get(url)
+        request.user = self.user
+        return self.model_admin.changelist_view(request).context_data['cl']
+
+    def test_keyset_pages_walk_whole_list(self):
+        cl = self.get_cl()
+        tools.assert_true(cl.keyset)
+        tools.assert_equals(cl.keyset_prev_url, None)
+        seen = list(cl.result_list)
+        while cl.keyset_next_url:
+            cl = self.get_cl(cl.keyset_next_url)
+            seen += cl.result_list
+        tools.assert_equals(seen, self.expected)
+
+    def test_keyset_previous_page(self):
+        cl = self.get_cl()
+        second = self.get_cl(cl.keyset_next_url)
+        first = self.get_cl(second.keyset_prev_url)
+        tools.assert_equals(list(first.result_list), self.expected[:4])
+        tools.assert_equals(first.keyset_prev_url, None)
+
+    def test_keyset_falls_back_to_offset_for_related_ordering(self):
+        cl = self.get_cl('/?o=3')  # ordered by "where"
+        tools.assert_false(cl.keyset)
+
+    def test_capped_count(self):
+        self.model_admin.list_count_cap = 10
+        try:
+            cl = self.get_cl('/?is_by_phone__exact=0')
+        finally:
+            del self.model_admin.list_count_cap
+        tools.assert_equals(cl.result_count, 11)
+        tools.assert_equals(cl.result_count_display, u'10+')
+
+    def test_renders_keyset_links(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = self.model_admin.changelist_view(request).render()
+        tools.assert_true('?after=' in response.content)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        for encounter in Encounter.objects.all():
+            create_service(HarmReduction, self.person, encounter.performed_on, self.town)
+
+        def count_queries(per_page):
+            self.model_admin.list_per_page = per_page
+            request = RequestFactory().get('/')
+            request.user = self.user
+            with CaptureQueriesContext(connection) as queries:
+                self.model_admin.changelist_view(request).render()
+            return len(queries)
+
+        # The first rendering fills the cache of frozen periods.
+        count_queries(2)
+        tools.assert_equals(count_queries(2), count_queries(20))
+
+
+class TestEncounterInline(InitialDataTestCase):
+    def setUp(self):
+        self.user = get_tst_usr()
+        self.client_obj = get_tst_client()
+        for day in xrange(1, 26):
+            Encounter.objects.create(person=self.client_obj, where=self.client_obj.town,
+                                     performed_on=date(2014, 1, day))
+
+    def get(self, model_admin, view, *args, **kwargs):
+        request = RequestFactory().get('/', kwargs)
+        request.user = self.user
+        return getattr(model_admin, view)(request, *args)
+
+    def test_change_form_contains_first_page(self):
+        response = self.get(admin.site._registry[Client], 'change_view', str(self.client_obj.pk))
+        formset = [f for f in response.context_data['inline_admin_formsets']
+                   if f.opts.model is Encounter][0].formset
+        tools.assert_true(formset.has_more)
+        tools.assert_equals(len(formset.forms), 20)
+        tools.assert_equals(formset.forms[0].instance.performed_on, date(2014, 1, 25))
+
+    def test_inline_page(self):
+        response = self.get(admin.site._registry[Encounter], 'inline_page_view',
+                            str(self.client_obj.pk), page=2)
+        data = anyjson.deserialize(response.content)
+        tools.assert_equals(data['next'], None)
+        tools.assert_equals(data['content'].count('grp-tbody'), 5)
+        tools.assert_true('/services/encounter/%s/' % Encounter.objects.get(
+            performed_on=date(2014, 1, 1)).pk in data['content'])
+
+
+class TestOtherChangeLists(InitialDataTestCase):
+    def test_show_counts(self):
+        request = RequestFactory().get('/')
+        request.user = get_tst_usr()
+        response = admin.site._registry[User].changelist_view(request).render()
+        tools.assert_true(' %s</span>' % User.objects.count() in response.content)
@@ -3,11 +3,19 @@ Created on 22.10.2011
 
 @author: xaralis
 '''
+from datetime import date
+
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
 from nose import tools
 
-from boris.services.models.core import Service, service_list, get_model_for_class_name
-from boris.clients.models import Client, Anonymous
+from boris.services.forms import clear_form_cache
+from boris.services.models import Breathalyzer, HarmReduction, UrineTest
+from boris.services.models.core import Service, Encounter, service_list, \
+    get_model_for_class_name, cast_services, bulk_save_services
+from boris.clients.models import Client, Anonymous, Person
+from boris.tests.helpers import create_service, get_tst_client, InitialDataTestCase
+from boris.utils.contenttypes import content_types
 from models import DummyServiceClass, ModelDummy, DummyLimitedServiceClass, Dummy1, Dummy2
 
 
@@ -79,3 +87,110 @@ class TestUtilityMethods(TestCase):
     def test_get_model_for_class_name_raises_valueerror_for_non_registered_class(self):
         get_model_for_class_name('Dummy3')
 
+    def test_form_class_is_cached(self):
+        form = UrineTest.form()
+        tools.assert_true(UrineTest.form() is form)
+        clear_form_cache(UrineTest)
+        tools.assert_false(UrineTest.form() is form)
+
+    def test_service_list_is_sorted_by_codenumber(self):
+        codenumbers = [s.service.codenumber for s in service_list()]
+        tools.assert_equals(codenumbers, sorted(codenumbers))
+
+
+class TestServiceListForPerson(InitialDataTestCase):
+    def test_service_list_does_not_cast_person(self):
+        client = get_tst_client()
+        person = Person.objects.get(pk=client.pk)
+        expected = [s for s in service_list() if s.service.is_available(client)]
+        ContentType.objects.get_for_id(person.content_type_id)  # Warm up the cache.
+        with self.assertNumQueries(0):
+            tools.assert_equals(service_list(person), expected)
+
+    def test_limited_services_are_not_offered_to_anonymous(self):
+        anonymous = Anonymous.objects.all()[0]
+        tools.assert_false(UrineTest in service_list(anonymous))
+        tools.assert_true(UrineTest in service_list(get_tst_client()))
+
+
+
+class TestCastServices(InitialDataTestCase):
+    def setUp(self):
+        self.client = get_tst_client()
+        self.services = [
+            create_service(HarmReduction, self.client, date(2014, 1, 1), self.client.town),
+            create_service(UrineTest, self.client, date(2014, 1, 1), self.client.town,
+                           {'drug_test': True}),
+            create_service(Breathalyzer, self.client, date(2014, 1, 1), self.client.town),
+        ]
+
+    def test_cast_services_matches_cast(self):
+        services = list(Service.objects.filter(pk__in=[s.pk for s in self.services]).order_by('pk'))
+        casted = cast_services(services)
+        tools.assert_equals([type(s) for s in casted], [type(s.cast()) for s in services])
+        tools.assert_true(casted[1].drug_test)
+
+    def test_cast_services_queries_per_class(self):
+        services = list(Service.objects.filter(pk__in=[s.pk for s in self.services]))
+        for s in services:  # Warm up the content type cache.
+            ContentType.objects.get_for_id(s.content_type_id)
+        with self.assertNumQueries(2):  # Breathalyzer is a proxy.
+            cast_services(services)
+
+    def test_class_is_editable(self):
+        tools.assert_true(UrineTest.class_is_editable())
+        tools.assert_false(Breathalyzer.class_is_editable())
+        tools.assert_false(self.services[2].is_editable())
+
+
+class TestContentTypeResolver(InitialDataTestCase):
+    def test_proxy_content_type(self):
+        ct = Breathalyzer.real_content_type()
+        tools.assert_equals(('services', 'breathalyzer'), (ct.app_label, ct.model))
+        tools.assert_equals(Breathalyzer, content_types.get_model(ct.pk))
+
+    def test_lookups_are_cached(self):
+        content_types.clear()
+        Breathalyzer.real_content_type()
+        with self.assertNumQueries(0):
+            Breathalyzer.objects.all().query.sql_with_params()
+            UrineTest.real_content_type()
+            content_types.get_id(Client)
+            content_types.as_json()
+
+    def test_refreshes_on_new_content_type(self):
+        self.addCleanup(content_types.clear)
+        ct = ContentType.objects.create(app_label='services', model='nonexistent')
+        tools.assert_equals(ct.pk, content_types.get_id(('services', 'nonexistent')))
+        tools.assert_true('"nonexistent"' in content_types.as_json())
+
+
+class TestServiceSave(InitialDataTestCase):
+    def setUp(self):
+        self.client_obj = get_tst_client()
+        self.encounter = Encounter.objects.create(person=self.client_obj, where=self.client_obj.town)
+
+    def test_form_reuses_encounter(self):
+        form = Breathalyzer.form()(self.encounter, {'encounter': self.encounter.pk})
+        with self.assertNumQueries(0):
+            tools.assert_true(form.is_valid())
+        tools.assert_true(form.cleaned_data['encounter'] is self.encounter)
+        with self.assertNumQueries(1):
+            form.save()
+
+    def test_form_rejects_other_encounter(self):
+        form = Breathalyzer.form()(self.encounter, {'encounter': self.encounter.pk + 1})
+        tools.assert_false(form.is_valid())
+
+    def test_bulk_save_services(self):
+        services = [Breathalyzer(encounter=self.encounter), UrineTest(encounter=self.encounter),
+                    Breathalyzer(encounter=self.encounter), UrineTest(encounter=self.encounter)]
+        # Savepoint, largest key, insert, new keys, release, urine test insert.
+        with self.assertNumQueries(6):
+            bulk_save_services(services)
+        tools.assert_true(all(s.pk for s in services))
+        tools.assert_equals(2, Breathalyzer.objects.filter(encounter=self.encounter,
+            title=unicode(Breathalyzer.service.title)).count())
+        tools.assert_equals(sorted(s.pk for s in services[1::2]),
+                            sorted(UrineTest.objects.filter(encounter=self.encounter)
+                                   .values_list('pk', flat=True)))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import os
+import tempfile
+from datetime import date
+
+from django.contrib import admin
+from django.core.management import call_command
+from django.test import RequestFactory
+from nose import tools
+
+from boris.services.export import encounter_chunks, export, filter_encounters, \
+    FORMAT_CSV, FORMAT_JSONL
+from boris.services.models import Address, Encounter, HarmReduction, InternetUsage
+from boris.tests.helpers import create_service, get_tst_client, get_tst_town, \
+    get_tst_usr, InitialDataTestCase
+
+
+class TestEncounterExport(InitialDataTestCase):
+    def setUp(self):
+        self.client = get_tst_client()
+        self.town = self.client.town
+        self.hr = create_service(HarmReduction, self.client, date(2015, 1, 1), self.town,
+                                 {'in_count': 5, 'out_count': 3})
+        Address.objects.create(encounter=self.hr.encounter, content_type=Address.real_content_type())
+        self.usage = create_service(InternetUsage, self.client, date(2015, 2, 1), self.town)
+        self.empty = Encounter.objects.create(person=self.client, performed_on=date(2016, 1, 1),
+                                              where=get_tst_town())
+
+    def test_chunks_in_constant_number_of_queries(self):
+        # Encounters and services of every chunk, harm reduction details
+        # and the final empty chunk.
+        with self.assertNumQueries(3 * 2 + 1 + 1):
+            chunks = list(encounter_chunks(Encounter.objects.all(), chunk_size=1))
+        with self.assertNumQueries(2 + 1 + 1):
+            list(encounter_chunks(Encounter.objects.all()))
+        tools.assert_equals([[self.hr.encounter_id], [self.usage.encounter_id], [self.empty.pk]],
+                            [[e['encounter_id'] for e in chunk] for chunk in chunks])
+
+    def test_jsonl(self):
+        lines = [json.loads(line) for line in export(Encounter.objects.all(), FORMAT_JSONL)]
+        tools.assert_equals(3, len(lines))
+        first = lines[0]
+        tools.assert_equals(('2015-01-01', 'client', self.town.title),
+                            (first['performed_on'], first['person_type'], first['town']))
+        hr = first['services'][0]
+        tools.assert_equals(('harmreduction', 5, 3), (hr['service'], hr['in_count'], hr['out_count']))
+        tools.assert_equals('address', first['services'][1]['service'])
+        tools.assert_equals('internetusage', lines[1]['services'][0]['service'])
+        tools.assert_equals([], lines[2]['services'])
+
+    def test_csv_filtered(self):
+        queryset = filter_encounters(date_from=date(2015, 1, 1), date_to=date(2015, 12, 31),
+                                     towns=[self.town])
+        rows = list(csv.reader(export(queryset, FORMAT_CSV)))
+        header = rows[0]
+        tools.assert_equals('encounter_id', header[0])
+        values = [dict(zip(header, row)) for row in rows[1:]]
+        tools.assert_equals(['harmreduction', 'address', 'internetusage'],
+                            [v['service'] for v in values])
+        tools.assert_equals(['5', '', ''], [v['in_count'] for v in values])
+        tools.assert_equals(['3', '', ''], [v['out_count'] for v in values])
+        # Only the fields of the service models in the export get a column.
+        tools.assert_equals(len(set(header)), len(header))
+        tools.assert_false('in_count' in list(csv.reader(export(
+            Encounter.objects.filter(pk=self.usage.encounter_id), FORMAT_CSV)))[0])
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command('export_encounters', format=FORMAT_JSONL, output=path,
+                         date_from='2016-01-01')
+            with open(path) as f:
+                tools.assert_equals([self.empty.pk], [json.loads(l)['encounter_id'] for l in f])
+        finally:
+            os.remove(path)
+
+    def test_admin_action(self):
+        request = RequestFactory().get('/')
+        request.user = get_tst_usr()
+        model_admin = admin.site._registry[Encounter]
+        response = model_admin.export_csv(request, Encounter.objects.filter(pk=self.usage.encounter_id))
+        tools.assert_equals(2, len(''.join(response.streaming_content).splitlines()))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import csv
+import os
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from nose import tools
+
+from boris.clients.models import Client
+from boris.services.importer import ClientImporter, EncounterImporter, ImportFileError, \
+    KIND_CLIENTS, KIND_ENCOUNTERS, import_records
+from boris.services.models import AsistService, Encounter, HarmReduction, Service
+from boris.tests.helpers import get_tst_client, get_tst_town, get_tst_usr, InitialDataTestCase
+from boris.utils.bulk import bulk_insert
+
+
+CLIENTS = (
+    'code,sex,first_name,birthdate,town,primary_drug\n'
+    'nov01,1,Jan,1985-02-03,Rakovnik,3\n'
+    'NOV02,2,Jana,,rakovnik,\n'
+    'BAD03,9,,,Rakovnik,\n'
+    'nov01,1,,,Rakovnik,\n'
+    'BAD04,1,,,Praha,\n'
+)
+
+ENCOUNTERS = (
+    'encounter,performed_on,client,town,service,in_count,where\n'
+    '1,2012-05-01,BORIVOJ22,Rakovnik,HarmReduction,12,\n'
+    '1,2012-05-01,BORIVOJ22,Rakovnik,AsistService,,"m,s"\n'
+    '2,2012-05-02,borivoj22,Rakovnik,,,\n'
+    '3,2012-05-03,BORIVOJ22,Rakovnik,HarmReduction,5,\n'
+    '3,2012-05-03,BORIVOJ22,Rakovnik,AsistService,,x\n'
+    '4,2012-05-04,NOBODY,Rakovnik,HarmReduction,,\n'
+)
+
+
+def read_rejects(rejects):
+    return list(csv.DictReader(StringIO(rejects.getvalue())))
+
+
+class TestBulkInsert(InitialDataTestCase):
+    def test_sets_keys_of_parent_and_child_rows(self):
+        encounter = Encounter.objects.create(person=get_tst_client(), where=get_tst_town())
+        services = [HarmReduction(encounter=encounter, in_count=i, title=u'HR',
+                                  content_type=HarmReduction.real_content_type())
+                    for i in xrange(3)]
+        services.append(Service(encounter=encounter, title=u'Address',
+                                content_type=Service.real_content_type()))
+        bulk_insert(services)
+        tools.assert_equals([0, 1, 2], [HarmReduction.objects.get(pk=s.pk).in_count
+                                        for s in services[:3]])
+        tools.assert_equals(4, Service.objects.filter(encounter=encounter).count())
+        tools.assert_true(all(s.pk == s.service_ptr_id for s in services[:3]))
+
+
+class TestImportRecords(InitialDataTestCase):
+    def setUp(self):
+        self.client = get_tst_client()
+        self.user = get_tst_usr()
+
+    def test_clients(self):
+        rejects = StringIO()
+        result = import_records(StringIO(CLIENTS), KIND_CLIENTS, rejects)
+        tools.assert_equals((2, 3), (result.records, result.rejected))
+        jan = Client.objects.get(code='NOV01')
+        tools.assert_equals((u'Jan', 1985, 3, self.client.town_id, u'NOV01'),
+                            (jan.first_name, jan.birthdate.year, jan.primary_drug, jan.town_id, jan.title))
+        tools.assert_true(Client.objects.filter(id__indexed=u'jan').exists())
+
+        rows = read_rejects(rejects)
+        tools.assert_equals(['4', '5', '6'], [r['line'] for r in rows])
+        tools.assert_true(rows[0]['errors'].startswith('sex: '))
+        tools.assert_true(rows[1]['errors'].startswith('code: '))
+        tools.assert_true(rows[2]['errors'].startswith('town: '))
+        tools.assert_equals('BAD04', rows[2]['code'])
+
+    def test_encounters(self):
+        rejects = StringIO()
+        result = import_records(StringIO(ENCOUNTERS), KIND_ENCOUNTERS, rejects,
+                                user=self.user, chunk_size=2)
+        tools.assert_equals((2, 2, 3), (result.records, result.services, result.rejected))
+        first, second = Encounter.objects.order_by('performed_on')
+        tools.assert_equals([self.user], list(first.performed_by.all()))
+        tools.assert_equals(12, HarmReduction.objects.get(encounter=first).in_count)
+        asist = AsistService.objects.get(encounter=first)
+        tools.assert_equals(['m', 's'], list(asist.where))
+        tools.assert_true(asist.title.startswith(u'Doprovod klienta'))
+        tools.assert_equals(0, second.services.count())
+
+        rows = read_rejects(rejects)
+        tools.assert_equals(['5', '6', '7'], [r['line'] for r in rows])
+        tools.assert_true(rows[0]['errors'].startswith('__all__: '))
+        tools.assert_true(rows[1]['errors'].startswith('where: '))
+        tools.assert_true(rows[2]['errors'].startswith('client: '))
+
+    def test_chunks_keep_records_together(self):
+        importer = EncounterImporter(chunk_size=1)
+        rows = [(i, {'encounter': key}) for i, key in enumerate('aabcc')]
+        tools.assert_equals([[2], [1], [2]], [[len(r) for r in chunk]
+                                              for chunk in importer.chunks(iter(rows))])
+
+    def test_queries_per_chunk(self):
+        data = 'code,sex,town\n' + ''.join('KOD%03d,1,Rakovnik\n' % i for i in xrange(40))
+        importer = ClientImporter(chunk_size=20)
+        # Existing codes, last person id, persons, read back ids, clients and
+        # four for the search index (delete, persons, clients, tokens), with
+        # savepoints for the transaction and the bulk insert, per chunk.
+        with self.assertNumQueries(2 * 13):
+            importer.run(StringIO(data), StringIO())
+        tools.assert_equals(41, Client.objects.count())
+
+    def test_missing_column(self):
+        tools.assert_raises(ImportFileError, import_records, StringIO('code,sex\n'),
+                            KIND_CLIENTS, StringIO())
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.write(fd, CLIENTS)
+        os.close(fd)
+        try:
+            call_command('import_records', KIND_CLIENTS, path, stdout=StringIO())
+            with open(path + '.rejects.csv') as f:
+                tools.assert_equals(4, len(f.readlines()))
+            tools.assert_raises(CommandError, call_command, 'import_records', 'persons', path)
+        finally:
+            os.remove(path)
+            os.remove(path + '.rejects.csv')
+
+
+class TestImportAdmin(InitialDataTestCase):
+    def setUp(self):
+        self.my_client = get_tst_client()
+        self.user = get_tst_usr()
+        self.client.login(username=self.user.username, password=self.user.cleartext_password)
+
+    def upload(self, content):
+        f = StringIO(content)
+        f.name = 'import.csv'
+        return self.client.post(reverse('admin:services_encounter_import'),
+                                {'kind': KIND_ENCOUNTERS, 'delimiter': ',', 'file': f})
+
+    def test_upload_without_rejects_redirects(self):
+        res = self.upload(ENCOUNTERS.split('3,2012')[0])
+        tools.assert_equals(302, res.status_code)
+        tools.assert_equals(2, Encounter.objects.count())
+        tools.assert_equals([self.user], list(Encounter.objects.all()[0].performed_by.all()))
+
+    def test_upload_returns_rejects(self):
+        res = self.upload(ENCOUNTERS)
+        tools.assert_equals(200, res.status_code)
+        tools.assert_equals('text/csv; charset=utf-8', res['Content-Type'])
+        tools.assert_equals(4, len(''.join(res.streaming_content).splitlines()))
+
+    def test_missing_column_is_form_error(self):
+        res = self.upload('encounter,client\n')
+        tools.assert_equals(200, res.status_code)
+        tools.assert_true(res.context['form'].errors['file'])
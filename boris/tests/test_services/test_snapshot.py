@@ -0,0 +1,84 @@
+import gzip
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from nose import tools
+
+from boris.clients.models import Client
+from boris.reporting.models import PregeneratedReport
+from boris.services.models import Encounter, HarmReduction, Service
+from boris.tests.helpers import get_tst_client, get_tst_town, get_tst_usr, InitialDataTestCase
+from boris.utils.snapshot import export_snapshot, import_snapshot, read_manifest, \
+    snapshot_models, SnapshotError
+
+
+class TestSnapshot(InitialDataTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.user = get_tst_usr()
+        self.user.user_permissions.add(Permission.objects.get(codename='add_encounter'))
+        self.client_obj = get_tst_client()
+        encounter = Encounter.objects.create(person=self.client_obj, where=get_tst_town())
+        encounter.performed_by.add(self.user)
+        for i in xrange(3):
+            HarmReduction.objects.create(encounter=encounter, in_count=i, title=u'HR',
+                                         content_type=HarmReduction.real_content_type())
+
+        PregeneratedReport.objects.create(report='Report', parameters='', display_type='xlsx',
+                                          content_type='', content='\x00\xff')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def state(self):
+        return (
+            list(Client.objects.order_by('pk').values_list('pk', 'code', 'birthdate', 'town')),
+            list(Service.objects.order_by('pk').values_list('pk', 'content_type', 'encounter')),
+            list(HarmReduction.objects.order_by('pk').values_list('pk', 'in_count')),
+            list(Encounter.objects.values_list('pk', 'performed_on', 'performed_by')),
+            list(self.user.user_permissions.values_list('codename', flat=True)),
+            [bytes(r.content) for r in PregeneratedReport.objects.all()],
+        )
+
+    def test_round_trip(self):
+        before = self.state()
+        manifest = export_snapshot(self.directory, chunk_size=2, file_rows=2)
+        services = [t for t in manifest['tables'] if t['model'] == 'services.service'][0]
+        tools.assert_equals((3, 2), (services['rows'], len(services['files'])))
+        with gzip.open(os.path.join(self.directory, services['files'][1])) as f:
+            tools.assert_equals(1, len(f.readlines()))
+
+        result = dict(import_snapshot(self.directory, flush=True, batch_size=3))
+        tools.assert_equals(3, result['services.service'])
+        tools.assert_equals(before, self.state())
+        # Sequences continue after the imported keys.
+        tools.assert_true(get_tst_client('new01').pk >
+                          self.client_obj.pk)
+
+    def test_referenced_before_referencing(self):
+        models = snapshot_models()
+        tools.assert_true(models.index(Client) > models.index(Client._meta.get_field('town').rel.to))
+        tools.assert_true(models.index(HarmReduction) > models.index(Service) > models.index(Encounter))
+
+    def test_nonempty_database_requires_flush(self):
+        export_snapshot(self.directory)
+        tools.assert_raises(SnapshotError, import_snapshot, self.directory)
+        tools.assert_equals(3, HarmReduction.objects.count())
+
+    def test_changed_columns(self):
+        export_snapshot(self.directory)
+        manifest = read_manifest(self.directory)
+        tools.assert_true(manifest['natural_keys']['contenttypes.contenttype'])
+        os.remove(os.path.join(self.directory, 'manifest.json'))
+        tools.assert_raises(SnapshotError, import_snapshot, self.directory, flush=True)
+
+    def test_commands(self):
+        call_command('snapshot_export', self.directory, stdout=StringIO())
+        tools.assert_raises(CommandError, call_command, 'snapshot_import', self.directory)
+        call_command('snapshot_import', self.directory, flush=True, stdout=StringIO())
+        tools.assert_equals(3, HarmReduction.objects.count())
@@ -0,0 +1,104 @@
+import uuid
+
+import anyjson
+from django.test import RequestFactory
+from nose import tools
+
+from boris.clients.models import Town
+from boris.services.models import Address, Encounter, HarmReduction, Service
+from boris.services.sync import get_delta
+from boris.services.views import sync_batch
+from boris.syringes.models import SyringeCollection
+from boris.tests.helpers import get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+class TestSync(InitialDataTestCase):
+    def setUp(self):
+        self.user = get_tst_usr()
+        self.client_obj = get_tst_client()
+        self.town = self.client_obj.town
+        self.uuids = [str(uuid.uuid4()) for _i in xrange(4)]
+
+    def post(self, data):
+        request = RequestFactory().post('/', anyjson.serialize(data),
+                                        content_type='application/json')
+        request.user = self.user
+        return anyjson.deserialize(sync_batch(request).content)
+
+    def get_data(self, in_count=5, token=None):
+        return {
+            'token': token,
+            'encounters': [{
+                'uuid': self.uuids[0],
+                'person': self.client_obj.pk,
+                'where': self.town.pk,
+                'performed_on': '2015-06-01',
+                'services': [
+                    {'uuid': self.uuids[1], 'service': 'HarmReduction', 'data': {'in_count': in_count}},
+                    {'uuid': self.uuids[2], 'service': 'Address'},
+                ],
+            }],
+            'syringe_collections': [
+                {'uuid': self.uuids[3], 'town': self.town.pk, 'date': '2015-06-01', 'count': 12},
+            ],
+        }
+
+    def test_saves_batch(self):
+        resp = self.post(self.get_data())
+        tools.assert_true(resp['ok'])
+        encounter = Encounter.objects.get(uuid=self.uuids[0])
+        tools.assert_equals(resp['encounters'][0]['id'], encounter.pk)
+        tools.assert_equals([self.user], list(encounter.performed_by.all()))
+        tools.assert_equals(5, HarmReduction.objects.get(uuid=self.uuids[1]).in_count)
+        tools.assert_equals(Address.real_content_type(),
+                            Service.objects.get(uuid=self.uuids[2]).content_type)
+        collection = SyringeCollection.objects.get(uuid=self.uuids[3])
+        tools.assert_equals((12, [self.user]), (collection.count, list(collection.persons.all())))
+
+    def test_repeated_batch_updates(self):
+        first = self.post(self.get_data())
+        second = self.post(self.get_data(in_count=7))
+        tools.assert_true(second['ok'])
+        tools.assert_equals(first['services'], second['services'])
+        tools.assert_equals((1, 2, 1), (Encounter.objects.count(), Service.objects.count(),
+                                        SyringeCollection.objects.count()))
+        tools.assert_equals(7, HarmReduction.objects.get(uuid=self.uuids[1]).in_count)
+
+    def test_invalid_record_rolls_back_batch(self):
+        data = self.get_data()
+        data['encounters'][0]['services'][1]['service'] = 'Unknown'
+        resp = self.post(data)
+        tools.assert_false(resp['ok'])
+        tools.assert_equals([None, ['service']],
+                            [r['errors'] and r['errors'].keys() for r in resp['services']])
+        tools.assert_equals(0, Encounter.objects.count())
+        tools.assert_equals(0, SyringeCollection.objects.count())
+
+    def test_invalid_references(self):
+        data = self.get_data()
+        data['encounters'][0].update({'person': 0, 'performed_by': [self.user.pk, 0]})
+        data['syringe_collections'][0]['uuid'] = self.uuids[0]
+        resp = self.post(data)
+        tools.assert_false(resp['ok'])
+        tools.assert_equals(['performed_by', 'person'], sorted(resp['encounters'][0]['errors']))
+        tools.assert_equals(['uuid'], resp['syringe_collections'][0]['errors'].keys())
+        tools.assert_equals([], resp['services'])
+
+    def test_delta_since_token(self):
+        delta = get_delta()
+        tools.assert_equals([self.client_obj.pk], [c['id'] for c in delta['clients']])
+        tools.assert_equals([self.town.pk], [t['id'] for t in delta['towns']])
+        tools.assert_true(isinstance(delta['group_contact_types'], list))
+
+        delta = self.post({'token': delta['token']})['delta']
+        tools.assert_equals([self.client_obj.pk], [c['id'] for c in delta['clients']])
+        tools.assert_equals((None, None), (delta['towns'], delta['group_contact_types']))
+
+        Town.objects.create(title=u'Beroun', district=self.town.district)
+        tools.assert_equals(2, len(get_delta(delta['token'])['towns']))
+
+    def test_malformed_batch(self):
+        request = RequestFactory().post('/', anyjson.serialize({'encounters': [1]}),
+                                        content_type='application/json')
+        request.user = self.user
+        tools.assert_equals(400, sync_batch(request).status_code)
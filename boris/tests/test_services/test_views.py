@@ -0,0 +1,61 @@
+from datetime import date
+
+import anyjson
+from django.test import RequestFactory
+from nose import tools
+
+from boris.services.models import Encounter, Service, Breathalyzer, HarmReduction, UrineTest
+from boris.services.views import bulk_entry
+from boris.tests.helpers import get_tst_client, get_tst_usr, InitialDataTestCase
+
+
+class TestBulkEntry(InitialDataTestCase):
+    def setUp(self):
+        self.user = get_tst_usr()
+        self.client_obj = get_tst_client()
+
+    def post(self, data):
+        request = RequestFactory().post('/', anyjson.serialize(data),
+                                        content_type='application/json')
+        request.user = self.user
+        return anyjson.deserialize(bulk_entry(request).content)
+
+    def get_data(self, **service_data):
+        return {
+            'encounter': {
+                'person': self.client_obj.pk,
+                'performed_on': '2014-10-01',
+                'where': self.client_obj.town.pk,
+            },
+            'services': [
+                {'service': 'Breathalyzer'},
+                {'service': 'UrineTest', 'data': {'drug_test': True}},
+                {'service': 'HarmReduction', 'data': service_data},
+            ],
+        }
+
+    def test_saves_encounter_with_services(self):
+        resp = self.post(self.get_data(in_count=5))
+        tools.assert_true(resp['ok'])
+        encounter = Encounter.objects.get(pk=resp['encounter'])
+        tools.assert_equals(encounter.performed_on, date(2014, 10, 1))
+        tools.assert_equals(list(encounter.performed_by.all()), [self.user])
+        tools.assert_equals(Breathalyzer.objects.get(encounter=encounter).title,
+                            unicode(Breathalyzer.service.title))
+        tools.assert_true(UrineTest.objects.get(encounter=encounter).drug_test)
+        tools.assert_equals(HarmReduction.objects.get(encounter=encounter).in_count, 5)
+        tools.assert_equals(resp['content'].count('data-service-id'), 3)
+
+    def test_invalid_service_saves_nothing(self):
+        resp = self.post(self.get_data(in_count='many'))
+        tools.assert_false(resp['ok'])
+        tools.assert_equals([s['ok'] for s in resp['services']], [True, True, False])
+        tools.assert_true('in_count' in resp['services'][2]['errors'])
+        tools.assert_equals(Encounter.objects.count(), 0)
+        tools.assert_equals(Service.objects.count(), 0)
+
+    def test_adds_services_to_existing_encounter(self):
+        encounter = Encounter.objects.create(person=self.client_obj, where=self.client_obj.town)
+        resp = self.post({'encounter': encounter.pk, 'services': [{'service': 'Breathalyzer'}]})
+        tools.assert_true(resp['ok'])
+        tools.assert_equals(encounter.services.count(), 1)
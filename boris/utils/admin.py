@@ -1,9 +1,26 @@
-from django.contrib.admin.options import ModelAdmin, csrf_protect_m
-from django.contrib.admin.views.main import ChangeList
-from django.db import transaction
+import anyjson
+
+from django.contrib.admin.options import IncorrectLookupParameters, ModelAdmin, csrf_protect_m
+from django.contrib.admin.views.main import ChangeList, SEARCH_VAR
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.formats import number_format
 from django.utils.translation import ugettext_lazy as _
 
 
+# GET parameters holding the keyset pagination cursor.
+KEYSET_AFTER_VAR = 'after'
+KEYSET_BEFORE_VAR = 'before'
+KEYSET_VARS = (KEYSET_AFTER_VAR, KEYSET_BEFORE_VAR)
+
+COUNT_EXACT = 'exact'
+COUNT_CAPPED = 'capped'
+COUNT_ESTIMATE = 'estimate'
+
+
 def textual(title, ordering_field=None):
     """
     Fallbacks textual field to '---' instead of (None) in admin.
@@ -26,8 +43,74 @@ def textual(title, ordering_field=None):
     return decorator
 
 
+def capped_count(queryset, cap):
+    """
+    Returns the number of objects in ``queryset``, but stops counting after
+    ``cap + 1`` rows.
+    """
+    qs = queryset.values_list('pk', flat=True).order_by()[:cap + 1]
+    sql, params = qs.query.sql_with_params()
+    cursor = connections[queryset.db].cursor()
+    cursor.execute('SELECT COUNT(*) FROM (%s) capped_count' % sql, params)
+    return cursor.fetchone()[0]
+
+
+def estimated_count(model, using='default'):
+    """
+    Returns the row count estimate the database keeps for the table of
+    ``model`` or None if the backend does not provide one. PostgreSQL
+    reports -1 for tables that were never analyzed, that is unknown too.
+    """
+    connection = connections[using]
+    vendor = connection.vendor
+    if vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables ' \
+              'WHERE table_schema = DATABASE() AND table_name = %s'
+    elif vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+    else:
+        return None
+    cursor = connection.cursor()
+    cursor.execute(sql, [model._meta.db_table])
+    row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def related_list(field, title, separator=u'<br />'):
+    """
+    Returns a changelist column listing objects related through ``field``.
+    The objects are prefetched for the whole page at once.
+    """
+    @textual(title)
+    def column(self, obj):
+        return separator.join([unicode(o) for o in getattr(obj, field).all()])
+    column.prefetch_related = field
+    return column
+
+
+def related_count(field, title):
+    """
+    Returns a changelist column with the number of objects related through
+    ``field``, counted by the changelist query itself.
+    """
+    annotation = '%s_count' % field
+
+    @textual(title)
+    def column(self, obj):
+        return getattr(obj, annotation)
+    column.annotations = {annotation: Count(field, distinct=True)}
+    return column
+
+
 class BorisChangeList(ChangeList):
-    """Change list_display with respect to request."""
+    """
+    Change list_display with respect to request.
+
+    Also implements the ``list_count_mode`` and ``list_keyset_pagination``
+    options of ``BorisBaseAdmin``.
+    """
 
     remove_in_popup = ('actions_display',)
 
@@ -42,12 +125,198 @@ class BorisChangeList(ChangeList):
             self.list_display = filter(lambda x: x not in self.remove_in_popup,
                 self.list_display)
 
+    def get_filters_params(self, params=None):
+        lookup_params = super(BorisChangeList, self).get_filters_params(params)
+        for var in KEYSET_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Sorting and filtering links always lead to the first page.
+        new_params = dict(new_params or {})
+        for var in KEYSET_VARS:
+            new_params.setdefault(var, None)
+        return super(BorisChangeList, self).get_query_string(new_params, remove)
+
+    def _count(self, queryset, filtered):
+        """
+        Counts ``queryset`` according to ``list_count_mode``. Returns
+        a tuple (count, mode actually used).
+        """
+        mode = getattr(self.model_admin, 'list_count_mode', COUNT_EXACT)
+        if mode == COUNT_ESTIMATE and not filtered:
+            count = estimated_count(self.model, queryset.db)
+            if count is not None:
+                return count, COUNT_ESTIMATE
+        if mode in (COUNT_CAPPED, COUNT_ESTIMATE):
+            cap = self.model_admin.list_count_cap
+            count = capped_count(queryset, cap)
+            return count, COUNT_CAPPED if count > cap else COUNT_EXACT
+        return queryset.count(), COUNT_EXACT
+
+    def _format_count(self, count, mode):
+        if mode == COUNT_CAPPED:
+            return u'%s+' % number_format(self.model_admin.list_count_cap, force_grouping=True)
+        if mode == COUNT_ESTIMATE:
+            return u'~%s' % number_format(count, force_grouping=True)
+        return count
+
+    def get_keyset_fields(self):
+        """
+        Returns a list of (field, descending) for the ordering of the
+        queryset or None, if keyset pagination can not be used with it
+        (ordering by related, nullable or extra fields).
+        """
+        opts = self.lookup_opts
+        keyset = []
+        for name in self.queryset.query.order_by:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.name
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.null or (field.rel and field != opts.pk):
+                return None
+            keyset.append((field, descending))
+        if not keyset or keyset[-1][0] != opts.pk:
+            return None
+        return keyset
+
+    def _keyset_filter(self, keyset, values, forward):
+        """
+        Returns Q matching rows following ``values`` in the ordering given by
+        ``keyset`` (or preceding them if ``forward`` is False).
+        """
+        q = Q()
+        for i, (field, descending) in enumerate(keyset):
+            lookup = '%s__%s' % (field.name, 'lt' if descending == forward else 'gt')
+            equal = dict((f.name, v) for (f, _desc), v in zip(keyset[:i], values[:i]))
+            q |= Q(**equal) & Q(**{lookup: values[i]})
+        return q
+
+    def _parse_cursor(self, keyset, raw):
+        try:
+            values = anyjson.deserialize(raw)
+            if not isinstance(values, list) or len(values) != len(keyset):
+                raise ValueError
+            return [(field.rel.get_related_field() if field.rel else field).to_python(value)
+                    for (field, _desc), value in zip(keyset, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise IncorrectLookupParameters
+
+    def _make_cursor(self, keyset, obj):
+        return anyjson.serialize([field.value_to_string(obj) for field, _desc in keyset])
+
+    def get_keyset_results(self, queryset, keyset):
+        """
+        Fetches the current page by seeking from the cursor in GET instead
+        of using OFFSET, which has to skip over all the preceding rows.
+        """
+        per_page = self.list_per_page
+        after = self.params.get(KEYSET_AFTER_VAR)
+        before = self.params.get(KEYSET_BEFORE_VAR)
+        if after:
+            queryset = queryset.filter(self._keyset_filter(keyset, self._parse_cursor(keyset, after), True))
+        elif before:
+            queryset = queryset.filter(self._keyset_filter(keyset, self._parse_cursor(keyset, before), False))
+            queryset = queryset.reverse()
+
+        result_list = list(queryset[:per_page + 1])
+        has_more = len(result_list) > per_page
+        result_list = result_list[:per_page]
+        if before:
+            result_list.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, bool(after)
+
+        self.keyset_next_url = self.keyset_prev_url = None
+        if has_next and result_list:
+            self.keyset_next_url = self.get_query_string(
+                {KEYSET_AFTER_VAR: self._make_cursor(keyset, result_list[-1])})
+        if has_prev and result_list:
+            self.keyset_prev_url = self.get_query_string(
+                {KEYSET_BEFORE_VAR: self._make_cursor(keyset, result_list[0])})
+        return result_list
+
+    def get_list_queryset(self, queryset):
+        """
+        Applies ``prefetch_related`` and ``annotations`` declared by the
+        ``list_display`` columns (see ``related_list`` and ``related_count``)
+        to the queryset of displayed rows.
+        """
+        prefetch, annotations = [], {}
+        for name in self.list_display:
+            column = name if callable(name) else getattr(self.model_admin, name, None)
+            if getattr(column, 'prefetch_related', None):
+                prefetch.append(column.prefetch_related)
+            annotations.update(getattr(column, 'annotations', None) or {})
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+    def get_results(self, request):
+        filtered = bool(self.get_filters_params() or self.params.get(SEARCH_VAR))
+        result_count, count_mode = self._count(self.queryset, filtered)
+        if filtered:
+            full_result_count, full_count_mode = self._count(self.root_queryset, False)
+        else:
+            full_result_count, full_count_mode = result_count, count_mode
+
+        # Counting is done above on the plain queryset, the displayed rows
+        # come with their column data prefetched.
+        queryset = self.get_list_queryset(self.queryset)
+        paginator = self.model_admin.get_paginator(request, queryset, self.list_per_page)
+        paginator._count = result_count
+        can_show_all = count_mode == COUNT_EXACT and result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+
+        keyset = None
+        if getattr(self.model_admin, 'list_keyset_pagination', False) and not self.show_all:
+            keyset = self.get_keyset_fields()
+
+        if keyset is not None:
+            result_list = self.get_keyset_results(queryset, keyset)
+        elif (self.show_all and can_show_all) or not multi_page:
+            result_list = queryset._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num + 1).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+
+        self.keyset = keyset is not None
+        self.result_count = result_count
+        self.full_result_count = full_result_count
+        self.result_count_display = self._format_count(result_count, count_mode)
+        self.full_result_count_display = self._format_count(full_result_count, full_count_mode)
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
 
 class BorisBaseAdmin(ModelAdmin):
     """
     Adds ``list_actions`` to simplify addition of actions to changelist rows.
+
+    Large changelists can set ``list_count_mode`` to ``'capped'`` (count at
+    most ``list_count_cap`` rows and display "10 000+") or ``'estimate'``
+    (use the table statistics of the database when no filters are applied)
+    and ``list_keyset_pagination`` to page by seeking from the last
+    displayed row instead of by OFFSET. Keyset pagination is used only when
+    the changelist is ordered by non-null local fields ending with the
+    primary key and falls back to page numbers otherwise.
     """
     list_actions = ('change_button',)
+    list_count_mode = COUNT_EXACT
+    list_count_cap = 10000
+    list_keyset_pagination = False
 
     def __init__(self, *args, **kwargs):
         self.list_display += ('actions_display',)
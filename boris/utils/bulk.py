@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk inserts which set primary keys and work for multi-table inheritance.
+
+``QuerySet.bulk_create`` neither returns the primary keys of the new rows
+nor accepts children of concrete models (``Client``, most services).
+``bulk_insert`` inserts the rows of the parent table with ``bulk_create``,
+reads their keys back in the same transaction and inserts the child rows
+with multi-row inserts as well, so inserting thousands of objects takes
+a handful of queries per table.
+
+The keys are read back as the rows with a key greater than the largest key
+before the insert, in insertion order. If another transaction commits rows
+in the meantime the numbers don't match; the bulk insert is then rolled
+back to a savepoint and the rows are inserted one by one instead.
+"""
+from collections import OrderedDict
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+
+def _root(model):
+    """Returns (root model, parent link field or None) of a concrete ``model``."""
+    parents = model._meta.parents
+    if not parents:
+        return model, None
+    if len(parents) > 1:
+        raise ValueError('%s has more than one parent model.' % model.__name__)
+    parent, link = list(parents.items())[0]
+    if parent._meta.parents:
+        raise ValueError('%s has more than one level of parent models.' % model.__name__)
+    return parent, link
+
+
+def _batches(objs, fields, using):
+    size = connections[using].ops.bulk_batch_size(fields, objs) or len(objs)
+    for start in xrange(0, len(objs), size):
+        yield objs[start:start + size]
+
+
+def _insert_rows(model, objs, using):
+    """Inserts ``objs`` of a model without parents and sets their keys."""
+    manager = model._base_manager.db_manager(using)
+    with transaction.atomic(using=using):
+        last = manager.aggregate(last=Max('pk'))['last'] or 0
+        manager.bulk_create(objs)
+        pks = list(manager.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True)[:len(objs) + 1])
+        if len(pks) != len(objs):
+            transaction.set_rollback(True, using=using)
+
+    if len(pks) == len(objs):
+        for obj, pk in zip(objs, pks):
+            obj.pk = pk
+    else:
+        fields = [f for f in model._meta.local_concrete_fields if not f.primary_key]
+        for obj in objs:
+            obj.pk = manager._insert([obj], fields=fields, return_id=True, using=using)
+
+
+def bulk_insert(objs, using=DEFAULT_DB_ALIAS):
+    """
+    Inserts new ``objs`` and sets their primary keys. The objects may be of
+    several concrete models with the same root model (e.g. various services)
+    and at most one level of parents. No signals are sent and ``save()`` is
+    not called.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+
+    root, rows, children, parent_rows = None, [], OrderedDict(), []
+    for obj in objs:
+        model = obj._meta.concrete_model
+        obj_root, link = _root(model)
+        if root is None:
+            root = obj_root
+        elif obj_root is not root:
+            raise ValueError('Objects of %s and %s can\'t be inserted together.' % (
+                root.__name__, obj_root.__name__))
+        if link is None:
+            rows.append(obj)
+            continue
+        row = root(**dict((f.attname, getattr(obj, f.attname))
+                          for f in root._meta.concrete_fields if not f.primary_key))
+        rows.append(row)
+        parent_rows.append((obj, row))
+        children.setdefault(model, []).append(obj)
+
+    _insert_rows(root, rows, using)
+
+    for obj, row in parent_rows:
+        setattr(obj, root._meta.pk.attname, row.pk)
+        obj.pk = row.pk
+    for model, model_objs in children.items():
+        fields = model._meta.local_concrete_fields
+        manager = model._base_manager.db_manager(using)
+        for batch in _batches(model_objs, fields, using):
+            manager._insert(batch, fields=fields, using=using)
+
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+    return objs
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide ContentType resolution.
+
+Services and persons are told apart by their ``content_type`` and proxy
+models can't rely on ``ContentType.objects.get_for_model``, so the code
+used to resolve content types by natural key all over the place. The
+resolver below loads the whole (small) ``django_content_type`` table once
+per process and answers all such lookups from memory. It's reset whenever
+content types change or migrations are run.
+"""
+import json
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import signals
+
+
+class ContentTypeResolver(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self, **kwargs):
+        self._ids = None
+        self._keys = None
+        self._json = None
+
+    def _load(self):
+        self._ids, self._keys = {}, {}
+        for ct in ContentType.objects.order_by('id'):
+            self._ids[(ct.app_label, ct.model)] = ct.pk
+            self._keys[ct.pk] = (ct.app_label, ct.model)
+            ContentType.objects._add_to_cache(ContentType.objects.db, ct)
+
+    def _key(self, model):
+        if isinstance(model, tuple):
+            return model
+        return (model._meta.app_label, model._meta.object_name.lower())
+
+    def get_id(self, model):
+        """
+        Returns id of the content type of ``model`` (a model class or an
+        ``(app_label, model)`` tuple). Unlike ``get_for_model`` it respects
+        proxy models.
+        """
+        key = self._key(model)
+        if self._ids is None or key not in self._ids:
+            # Content types may have been created since the last load.
+            self._load()
+        try:
+            return self._ids[key]
+        except KeyError:
+            raise ContentType.DoesNotExist('No content type for %s.%s' % key)
+
+    def get(self, model):
+        """Returns the ``ContentType`` instance for ``model``."""
+        return ContentType.objects.get_for_id(self.get_id(model))
+
+    def get_model(self, content_type_id):
+        """Returns the model class for ``content_type_id`` or None."""
+        if self._keys is None or content_type_id not in self._keys:
+            self._load()
+        try:
+            return apps.get_model(*self._keys[content_type_id])
+        except (KeyError, LookupError):
+            return None
+
+    def as_json(self):
+        """
+        Returns all content types serialized the way grappelli expects them
+        for generic lookups. The string is built once.
+        """
+        if self._json is None:
+            if self._keys is None:
+                self._load()
+            self._json = json.dumps(dict(
+                (pk, {'pk': pk, 'app': app_label, 'model': model})
+                for pk, (app_label, model) in self._keys.iteritems()))
+        return self._json
+
+
+content_types = ContentTypeResolver()
+
+signals.post_save.connect(content_types.clear, sender=ContentType)
+signals.post_delete.connect(content_types.clear, sender=ContentType)
+signals.post_migrate.connect(content_types.clear)
@@ -0,0 +1,28 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from boris.utils.snapshot import CHUNK_SIZE, FILE_ROWS, export_snapshot
+
+
+class Command(BaseCommand):
+    args = '<directory>'
+    help = 'Export a snapshot of the whole database into a directory'
+    option_list = BaseCommand.option_list + (
+        make_option('--database', default=DEFAULT_DB_ALIAS,
+            help='Database to export (default "%s").' % DEFAULT_DB_ALIAS),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+            help='Number of rows read at once (default %d).' % CHUNK_SIZE),
+        make_option('--file-rows', type='int', default=FILE_ROWS,
+            help='Maximum number of rows in one file (default %d).' % FILE_ROWS),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: snapshot_export %s' % self.args)
+        manifest = export_snapshot(args[0], using=options['database'],
+                                   chunk_size=options['chunk_size'],
+                                   file_rows=options['file_rows'])
+        self.stdout.write('Exported %d rows of %d tables.' % (
+            sum(t['rows'] for t in manifest['tables']), len(manifest['tables'])))
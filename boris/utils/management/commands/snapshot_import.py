@@ -0,0 +1,30 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from boris.utils.snapshot import BATCH_SIZE, SnapshotError, import_snapshot
+
+
+class Command(BaseCommand):
+    args = '<directory>'
+    help = 'Import a snapshot exported by snapshot_export into an empty database'
+    option_list = BaseCommand.option_list + (
+        make_option('--database', default=DEFAULT_DB_ALIAS,
+            help='Database to import into (default "%s").' % DEFAULT_DB_ALIAS),
+        make_option('--batch-size', type='int', default=BATCH_SIZE,
+            help='Number of rows inserted at once (default %d).' % BATCH_SIZE),
+        make_option('--flush', action='store_true', default=False,
+            help='Delete the current data of the snapshot tables first.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: snapshot_import %s' % self.args)
+        try:
+            result = import_snapshot(args[0], using=options['database'],
+                                     flush=options['flush'], batch_size=options['batch_size'])
+        except SnapshotError as e:
+            raise CommandError(e)
+        self.stdout.write('Imported %d rows of %d tables.' % (
+            sum(rows for _model, rows in result), len(result)))
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Full database snapshots in a streaming format.
+
+A snapshot is a directory with a ``manifest.json`` and the rows of every
+table in gzipped JSON lines files, one JSON array of column values per row
+and at most ``FILE_ROWS`` rows per file. Tables are read by primary key in
+chunks of ``CHUNK_SIZE`` rows (``pk > last pk``), so neither export nor
+import holds more than a chunk in memory, and the files of large tables
+can be copied or checked in parts.
+
+The snapshot covers all tables of the BorIS applications, users and groups
+with their permissions and the many-to-many tables among them. Primary keys
+are kept. Rows referencing content types and permissions are remapped by
+their natural keys, because their ids differ between databases.
+
+The import inserts the rows with multi-row ``executemany`` statements while
+foreign key checks are deferred (PostgreSQL) or disabled (MySQL); all the
+references are checked once at the end. The target tables have to be empty
+or flushed by the import, sequences are reset afterwards.
+"""
+import base64
+import gzip
+import json
+import os
+from datetime import datetime
+
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.color import no_style
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+
+VERSION = 1
+MANIFEST = 'manifest.json'
+CHUNK_SIZE = 2000
+FILE_ROWS = 100000
+BATCH_SIZE = 1000
+
+SNAPSHOT_APPS = ('clients', 'services', 'syringes', 'reporting')
+SNAPSHOT_MODELS = ('auth.Group', 'auth.User')
+
+# Models referenced by natural keys instead of ids.
+NATURAL_KEY_MODELS = (ContentType, Permission)
+
+# Values of these fields are converted by the field when imported, JSON has
+# no date and time types.
+CONVERTED_TYPES = ('DateField', 'DateTimeField', 'TimeField', 'DecimalField')
+# Binary values are written base64 encoded.
+BINARY_TYPE = 'BinaryField'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
+def sort_models(models):
+    """Returns ``models`` ordered so that referenced models come first."""
+    models = list(models)
+    deps = {}
+    for model in models:
+        deps[model] = set(f.rel.to._meta.concrete_model for f in model._meta.local_concrete_fields
+                          if f.rel and f.rel.to is not model) & set(models)
+    ordered = []
+    while models:
+        ready = [m for m in models if not deps[m] - set(ordered)]
+        # Break cycles (nullable references) in the original order.
+        ordered.extend(ready or models[:1])
+        models = [m for m in models if m not in ordered]
+    return ordered
+
+
+def snapshot_models():
+    """Returns the models included in snapshots, in insertion order."""
+    models = [m for label in SNAPSHOT_APPS for m in apps.get_app_config(label).get_models()
+              if m._meta.managed and not m._meta.proxy]
+    models += [apps.get_model(label) for label in SNAPSHOT_MODELS]
+    included = set(models) | set(NATURAL_KEY_MODELS)
+    throughs = [f.rel.through for m in models for f in m._meta.local_many_to_many
+                if f.rel.through._meta.auto_created and f.rel.to in included]
+    return sort_models(models + throughs)
+
+
+def _fields(model):
+    return list(model._meta.local_concrete_fields)
+
+
+def _natural_keys(using):
+    """Returns {model label: {id: natural key}} of the natural key models."""
+    keys = {}
+    for model in NATURAL_KEY_MODELS:
+        manager = model._default_manager.db_manager(using)
+        keys[_label(model)] = dict((obj.pk, obj.natural_key())
+                                   for obj in _natural_key_objects(manager))
+    return keys
+
+
+def _natural_key_objects(manager):
+    # Natural keys of permissions include their content types.
+    if manager.model is Permission:
+        return manager.select_related('content_type')
+    return manager.all()
+
+
+class TableWriter(object):
+    """Writes rows of one table into numbered gzipped files."""
+    def __init__(self, directory, label, file_rows):
+        self.directory = directory
+        self.label = label
+        self.file_rows = file_rows
+        self.files = []
+        self.rows = 0
+        self.out = None
+
+    def write(self, line):
+        if self.rows % self.file_rows == 0:
+            self.close()
+            name = '%s.%04d.jsonl.gz' % (self.label, len(self.files) + 1)
+            self.files.append(name)
+            self.out = gzip.open(os.path.join(self.directory, name), 'wb')
+        self.out.write(line)
+        self.rows += 1
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+
+def export_table(model, directory, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE,
+                 file_rows=FILE_ROWS):
+    """Writes the rows of ``model`` in pk order, returns its manifest entry."""
+    fields = _fields(model)
+    pk_index = fields.index(model._meta.pk)
+    binary = [i for i, f in enumerate(fields) if f.get_internal_type() == BINARY_TYPE]
+    queryset = model._base_manager.using(using).order_by('pk') \
+        .values_list(*[f.attname for f in fields])
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    writer = TableWriter(directory, _label(model), file_rows)
+    last_pk = None
+    try:
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(chunk[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][pk_index]
+            for row in rows:
+                if binary:
+                    row = list(row)
+                    for i in binary:
+                        if row[i] is not None:
+                            row[i] = base64.b64encode(bytes(row[i]))
+                writer.write((encoder.encode(row) + u'\n').encode('utf-8'))
+    finally:
+        writer.close()
+    return {
+        'model': _label(model),
+        'table': model._meta.db_table,
+        'columns': [f.column for f in fields],
+        'files': writer.files,
+        'rows': writer.rows,
+    }
+
+
+def export_snapshot(directory, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE,
+                    file_rows=FILE_ROWS):
+    """Writes a snapshot of the database ``using`` into ``directory``."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest = {
+        'version': VERSION,
+        'created': datetime.now().isoformat(),
+        'natural_keys': {},
+        'tables': [],
+    }
+    connection = connections[using]
+    # One transaction reads a consistent state of all the tables.
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            connection.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        manifest['natural_keys'] = dict(
+            (label, [[pk, key] for pk, key in sorted(keys.items())])
+            for label, keys in _natural_keys(using).items())
+        for model in snapshot_models():
+            manifest['tables'].append(export_table(model, directory, using, chunk_size, file_rows))
+
+    with open(os.path.join(directory, MANIFEST), 'wb') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), 'rb') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError) as e:
+        raise SnapshotError('Can\'t read the snapshot manifest: %s' % e)
+    if manifest.get('version') != VERSION:
+        raise SnapshotError('Unsupported snapshot version %r.' % manifest.get('version'))
+    return manifest
+
+
+def _id_maps(manifest, using):
+    """Returns {model: {snapshot id: id in ``using``}} of the natural key models."""
+    maps = {}
+    for model in NATURAL_KEY_MODELS:
+        manager = model._default_manager.db_manager(using)
+        current = dict((obj.natural_key(), obj.pk) for obj in _natural_key_objects(manager))
+        maps[model] = {}
+        for pk, key in manifest['natural_keys'].get(_label(model), []):
+            key = tuple(key)
+            try:
+                maps[model][pk] = current[key]
+            except KeyError:
+                raise SnapshotError('%s %s doesn\'t exist in the target database.' % (
+                    model._meta.verbose_name, key))
+    return maps
+
+
+def _converters(model, columns, id_maps, connection):
+    """Returns a function converting a row of the snapshot to database values."""
+    by_column = dict((f.column, f) for f in _fields(model))
+    converters = []
+    for index, column in enumerate(columns):
+        field = by_column[column]
+        target = field.rel.to if field.rel else None
+        if target in id_maps:
+            converters.append((index, lambda value, m=id_maps[target]: m.get(value, value)))
+        elif field.get_internal_type() in CONVERTED_TYPES:
+            converters.append((index, lambda value, f=field: f.get_db_prep_save(
+                f.to_python(value), connection)))
+        elif field.get_internal_type() == BINARY_TYPE:
+            converters.append((index, lambda value, f=field: f.get_db_prep_save(
+                base64.b64decode(value), connection)))
+
+    def convert(row):
+        for index, converter in converters:
+            if row[index] is not None:
+                row[index] = converter(row[index])
+        return row
+    return convert
+
+
+def _read_rows(directory, files):
+    for name in files:
+        f = gzip.open(os.path.join(directory, name), 'rb')
+        try:
+            for line in f:
+                yield json.loads(line)
+        finally:
+            f.close()
+
+
+def import_table(model, table, directory, id_maps, using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE):
+    """Inserts the rows of a manifest ``table`` entry, returns their count."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(table['table']), ', '.join(qn(c) for c in table['columns']),
+        ', '.join(['%s'] * len(table['columns'])))
+    convert = _converters(model, table['columns'], id_maps, connection)
+    cursor = connection.cursor()
+    batch, count = [], 0
+    for row in _read_rows(directory, table['files']):
+        batch.append(convert(row))
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def import_snapshot(directory, using=DEFAULT_DB_ALIAS, flush=False, batch_size=BATCH_SIZE):
+    """
+    Restores the snapshot in ``directory`` into the database ``using``.
+    Returns [(model label, rows)]. With ``flush`` the tables are emptied
+    first, otherwise they have to be empty.
+    """
+    manifest = read_manifest(directory)
+    tables = []
+    for table in manifest['tables']:
+        try:
+            model = apps.get_model(table['model'])
+        except (LookupError, ValueError):
+            raise SnapshotError('Unknown model %s.' % table['model'])
+        if [f.column for f in _fields(model)] != table['columns']:
+            raise SnapshotError('Columns of %s differ from the snapshot.' % table['model'])
+        tables.append((model, table))
+
+    connection = connections[using]
+    table_names = [table['table'] for _model, table in tables]
+    result = []
+    with transaction.atomic(using=using):
+        if flush:
+            for statement in connection.ops.sql_flush(no_style(), table_names, (), allow_cascade=True):
+                connection.cursor().execute(statement)
+        else:
+            for model, table in tables:
+                if model._base_manager.using(using).exists():
+                    raise SnapshotError('Table %s is not empty, use flush.' % table['table'])
+
+        id_maps = _id_maps(manifest, using)
+        with connection.constraint_checks_disabled():
+            for model, table in tables:
+                result.append((table['model'], import_table(model, table, directory, id_maps,
+                                                            using, batch_size)))
+        connection.check_constraints(table_names=table_names)
+
+        cursor = connection.cursor()
+        for statement in connection.ops.sequence_reset_sql(no_style(), [m for m, _t in tables]):
+            cursor.execute(statement)
+    return result
@@ -17,7 +17,6 @@ except ImportError:
 
 # django imports
 from django import template
-from django.contrib.contenttypes.models import ContentType
 from django.utils.formats import get_format
 from django.utils.safestring import mark_safe
 from django.utils.translation import get_language
@@ -27,6 +26,9 @@ from django.template.context import Context
 # grappelli imports
 from grappelli.settings import *
 
+# boris imports
+from boris.utils.contenttypes import content_types
+
 register = template.Library()
 
 
@@ -36,10 +38,7 @@ class do_get_generic_objects(template.Node):
         pass
 
     def render(self, context):
-        objects = {}
-        for c in ContentType.objects.all().order_by('id'):
-            objects[c.id] = {'pk': c.id, 'app': c.app_label, 'model': c.model}
-        return json.dumps(objects)
+        return content_types.as_json()
 
 
 @register.tag
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming XLSX writer.
+
+Produces a minimal Office Open XML workbook as a generator of byte chunks,
+so that it can feed a ``StreamingHttpResponse`` or be written to a file
+without holding the workbook in memory. The zip container is written
+entry by entry with data descriptors (sizes and checksums follow the
+data), strings are written inline (no shared string table to collect
+upfront) and the workbook part listing the sheets is written last.
+
+Cell values keep their type: numbers are written as numbers, dates and
+datetimes as date serials with a date format, booleans as booleans and
+everything else as text.
+"""
+import re
+import struct
+import time
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+
+
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Sheet names are limited in length and some characters.
+SHEET_NAME_LENGTH = 31
+_INVALID_SHEET_NAME_CHARS = re.compile(r'[\[\]:*?/\\]')
+# Control characters are not allowed in XML 1.0.
+_INVALID_XML_CHARS = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_EPOCH = datetime(1899, 12, 30)
+
+# Indexes into cellXfs in STYLES.
+_STYLE_DATE = 1
+_STYLE_DATETIME = 2
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '%s'
+    '</Types>'
+)
+
+SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet%d.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>%s</sheets>'
+    '</workbook>'
+)
+
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rIdStyles" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    '%s'
+    '</Relationships>'
+)
+
+SHEET_REL = (
+    '<Relationship Id="rId%d" Target="worksheets/sheet%d.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+)
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+
+SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+
+SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def column_letter(index):
+    """Returns the column name (A, B, ..., AA, ...) for a 0-based ``index``."""
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord('A') + rest) + letters
+    return letters
+
+
+def _text(value):
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    return _INVALID_XML_CHARS.sub(u'', unicode(value))
+
+
+def cell_xml(ref, value):
+    """Returns the XML of a single cell holding ``value``."""
+    if value is None or value == '':
+        return ''
+    if isinstance(value, bool):
+        return '<c r="%s" t="b"><v>%d</v></c>' % (ref, value)
+    if isinstance(value, (int, long)):
+        return '<c r="%s"><v>%d</v></c>' % (ref, value)
+    if isinstance(value, (float, Decimal)):
+        return '<c r="%s"><v>%s</v></c>' % (ref, repr(float(value)))
+    if isinstance(value, datetime):
+        delta = value.replace(tzinfo=None) - _EPOCH
+        serial = delta.days + delta.seconds / 86400.0
+        return '<c r="%s" s="%d"><v>%r</v></c>' % (ref, _STYLE_DATETIME, serial)
+    if isinstance(value, date):
+        serial = (value - _EPOCH.date()).days
+        return '<c r="%s" s="%d"><v>%d</v></c>' % (ref, _STYLE_DATE, serial)
+    return (u'<c r="%s" t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % (
+        ref, escape(_text(value)))).encode('utf-8')
+
+
+def row_xml(number, values):
+    """Returns the XML of the row ``number`` (1-based)."""
+    cells = ''.join(cell_xml('%s%d' % (column_letter(i), number), value)
+                    for i, value in enumerate(values))
+    return '<row r="%d">%s</row>' % (number, cells)
+
+
+def sheet_chunks(rows):
+    yield SHEET_HEAD
+    for number, values in enumerate(rows, 1):
+        yield row_xml(number, values)
+    yield SHEET_TAIL
+
+
+def sheet_name(title, used):
+    """Returns a valid sheet name for ``title`` not contained in ``used``."""
+    name = _INVALID_SHEET_NAME_CHARS.sub('-', _text(title)).strip("' ") or u'List'
+    name = name[:SHEET_NAME_LENGTH]
+    candidate, i = name, 1
+    while candidate.lower() in used:
+        i += 1
+        suffix = u' (%d)' % i
+        candidate = name[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+class ZipStream(object):
+    """
+    Writes a zip archive as a sequence of byte chunks. Every entry is
+    deflated as its data comes and followed by a data descriptor, the
+    central directory is written by ``close``.
+    """
+    def __init__(self):
+        self.offset = 0
+        self.entries = []
+        now = time.localtime()
+        self.dos_time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+        self.dos_date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+
+    def _out(self, data):
+        self.offset += len(data)
+        return data
+
+    def entry(self, name, chunks):
+        """Yields the archive entry ``name`` with content from ``chunks``."""
+        header_offset = self.offset
+        yield self._out(struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, 0x08, 8,
+                                    self.dos_time, self.dos_date, 0, 0, 0, len(name), 0) + name)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        crc, size, compressed_size = 0, 0, 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield self._out(data)
+        data = compressor.flush()
+        compressed_size += len(data)
+        crc &= 0xffffffff
+        yield self._out(data + struct.pack('<IIII', 0x08074b50, crc, compressed_size, size))
+        self.entries.append((name, crc, compressed_size, size, header_offset))
+
+    def close(self):
+        """Yields the central directory."""
+        start = self.offset
+        directory = []
+        for name, crc, compressed_size, size, header_offset in self.entries:
+            directory.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, 0x08, 8,
+                                         self.dos_time, self.dos_date, crc, compressed_size, size,
+                                         len(name), 0, 0, 0, 0, 0, header_offset) + name)
+        directory = ''.join(directory)
+        yield self._out(directory + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(self.entries),
+                                                len(self.entries), len(directory), start, 0))
+
+
+def stream_xlsx(sheets):
+    """
+    Yields an XLSX workbook in chunks. ``sheets`` is an iterable of
+    ``(title, rows)`` pairs, ``rows`` an iterable of sequences of cell
+    values. Both are consumed lazily.
+    """
+    zf = ZipStream()
+    used, names = set(), []
+    for title, rows in sheets:
+        names.append(sheet_name(title, used))
+        for chunk in zf.entry('xl/worksheets/sheet%d.xml' % len(names), sheet_chunks(rows)):
+            yield chunk
+    if not names:
+        names.append(sheet_name(u'List', used))
+        for chunk in zf.entry('xl/worksheets/sheet1.xml', sheet_chunks(())):
+            yield chunk
+
+    numbers = range(1, len(names) + 1)
+    workbook = WORKBOOK % ''.join(
+        (u'<sheet name=%s sheetId="%d" r:id="rId%d"/>' % (quoteattr(name), i, i)).encode('utf-8')
+        for i, name in zip(numbers, names))
+    parts = (
+        ('xl/workbook.xml', workbook),
+        ('xl/_rels/workbook.xml.rels', WORKBOOK_RELS % ''.join(SHEET_REL % (i, i) for i in numbers)),
+        ('xl/styles.xml', STYLES),
+        ('_rels/.rels', ROOT_RELS),
+        ('[Content_Types].xml', CONTENT_TYPES % ''.join(SHEET_CONTENT_TYPE % i for i in numbers)),
+    )
+    for name, content in parts:
+        for chunk in zf.entry(name, (content,)):
+            yield chunk
+    for chunk in zf.close():
+        yield chunk